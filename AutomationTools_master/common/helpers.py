@@ -1,8 +1,166 @@
 import logging
-from typing import List
+import os
+from typing import List, Callable
 
 logger = logging.getLogger(__name__)
 
+# argument type checks are on unless python runs with -O or TESTRAIL_SKIP_ARG_CHECKS is set to 1/true/yes.  Can be
+# changed at runtime with Helpers.set_arg_checking.
+_arg_checks_enabled = __debug__ and os.environ.get('TESTRAIL_SKIP_ARG_CHECKS', '').lower() not in ('1', 'true', 'yes')
+# (function_name, types): validator from Helpers.arg_validator
+_validators = {}
+# type or tuple of types as passed to check_arg_types: the same with None swapped for type(None)
+_normalized_types = {}
+
+
+def _normalize_type(typ):
+    normalized = _normalized_types.get(typ)
+    if normalized is None:
+        if typ is None:
+            normalized = type(None)
+        elif type(typ) == tuple:
+            normalized = tuple(type(None) if v is None else v for v in typ)
+        else:
+            normalized = typ
+        _normalized_types[typ] = normalized
+    return normalized
+
+
+def _type_name(typ):
+    if type(typ) == tuple:
+        return ' or '.join(t.__name__ for t in typ)
+    return typ.__name__
+
+
+def _arg_type_errors(function_name, arguments_and_types):
+    errors = []
+    for position, (arg, typ) in enumerate(arguments_and_types, 1):
+        if not isinstance(arg, typ):
+            errors.append("check_args: {0} type check failed for argument {1} in function: {2}, received: {3} "
+                          "which isn't of type {0}".format(_type_name(typ), position, function_name, arg))
+    return errors
+
+
+class IndexedList(list):
+    """
+    list of dicts that can look records up by the value of a key without scanning the list.  The index for a key is
+    built the first time that key is looked up and kept up to date as records are appended or extended onto the
+    list.  Any other change (remove, insert, pop, slice assignment, sort, etc.) drops the indexes and they're rebuilt
+    on the next lookup.  Changing a dict that's already in the list doesn't update the indexes, call reindex() if
+    you do that.
+
+    Everything else is a plain list so it can be passed anywhere a list of dicts is expected.  e.g.
+        tests = IndexedList(pyt.get_tests_in_run(5234))
+        tests.find('case_id', 1263027)
+    """
+
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self._indexes = {}  # key: {value: position of the first record with that value}
+
+    def _build_index(self, key):
+        index = {}
+        for position, record in enumerate(self):
+            if key in record:
+                index.setdefault(record[key], position)
+        self._indexes[key] = index
+        return index
+
+    def position(self, key, value):
+        # type: (str, object) -> int or None
+        """
+        :return: position of the first record whose key is value.  None if there isn't one.
+        """
+        index = self._indexes.get(key)
+        try:
+            if index is None:
+                index = self._build_index(key)
+            return index.get(value)
+        except TypeError:
+            # unhashable values (lists, dicts) can't be indexed, search the old way
+            self._indexes.pop(key, None)
+            return next((position for position, record in enumerate(self) if record.get(key) == value), None)
+
+    def find(self, key, value, default=None):
+        # type: (str, object, object) -> dict
+        """
+        :return: the first record whose key is value.  default if there isn't one.
+        """
+        position = self.position(key, value)
+        return default if position is None else self[position]
+
+    def reindex(self):
+        """
+        drops every index.  They're rebuilt on the next lookup.
+        """
+        self._indexes = {}
+
+    def _add_to_indexes(self, records, start):
+        for key, index in self._indexes.items():
+            for position, record in enumerate(records, start):
+                if key in record:
+                    try:
+                        index.setdefault(record[key], position)
+                    except TypeError:
+                        self._indexes = {}
+                        return
+
+    def append(self, record):
+        list.append(self, record)
+        if self._indexes:
+            self._add_to_indexes((record,), len(self) - 1)
+
+    def extend(self, records):
+        start = len(self)
+        list.extend(self, records)
+        if self._indexes:
+            self._add_to_indexes(self[start:], start)
+
+    def __iadd__(self, records):
+        self.extend(records)
+        return self
+
+    def __reduce__(self):
+        # copy and pickle rebuild it from the records.  The indexes are rebuilt on demand afterwards.
+        return IndexedList, (list(self),)
+
+    # every other change can move records around, so it drops the indexes
+    def remove(self, record):
+        self._indexes = {}
+        list.remove(self, record)
+
+    def insert(self, position, record):
+        self._indexes = {}
+        list.insert(self, position, record)
+
+    def pop(self, position=-1):
+        self._indexes = {}
+        return list.pop(self, position)
+
+    def clear(self):
+        self._indexes = {}
+        list.clear(self)
+
+    def sort(self, *args, **kwargs):
+        self._indexes = {}
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._indexes = {}
+        list.reverse(self)
+
+    def __setitem__(self, position, value):
+        self._indexes = {}
+        list.__setitem__(self, position, value)
+
+    def __delitem__(self, position):
+        self._indexes = {}
+        list.__delitem__(self, position)
+
+    def __imul__(self, count):
+        self._indexes = {}
+        return list.__imul__(self, count)
+
 
 class Helpers():
     # This class is for helper functions etc that are commonly used in the various LaW_Test_Automation projects.
@@ -18,7 +176,8 @@ class Helpers():
         This checks the type for arguments in a function.  If there are type mismatches in the arguments provided,
         a list of errors are generated that identify the function they reside in, the position of the argument in
         the argument list and what's wrong with it.  The errors are raised in an exception.  If no errors the function
-        returns True so you can use this check in an if statement.
+        returns True so you can use this check in an if statement.  Does nothing but return True when arg checking
+        is off, see set_arg_checking.  For calls in hot loops use arg_validator instead.
         :type function_name: str
         :type arguments_and_types: [[]]
         :param function_name: name of function who's arguments are being type checked
@@ -26,29 +185,65 @@ class Helpers():
                                     [[arg1, arg1_type], [arg2, arg2_type], [arg3, arg3_type], ... ]
         :return: Boolean True if all arg's are correctly typed.  If not, a ValueError exception is raised
         """
-        errors = []
-        position = 0
-        for arg_and_type in arguments_and_types:
-            position += 1
-            arg = arg_and_type[0]
-            typ = arg_and_type[1]
-            if type(typ) == tuple:
-                if None in typ:
-                    # handle None being passed in as a type in a tuple.  convert to list, replace None with type(None)
-                    # and convert back to a tuple
-                    typ_list = list(typ)
-                    typ_list = [type(None) if v is None else v for v in typ_list]
-                    typ = tuple(typ_list)
-            if typ == None:
-                typ = type(None)
-            if not isinstance(arg, typ):
-                current_error = "check_args: {0} type check failed for argument {1} in function: {2}, received: {3} " \
-                                "which isn't of type {0}".format(typ.__name__, position, function_name, arg)
-                errors.append(current_error)
-        if len(errors) > 0:
-            raise ValueError(errors)
-        else:
+        if not _arg_checks_enabled:
             return True
+        for arg, typ in arguments_and_types:
+            normalized = _normalized_types.get(typ)
+            if normalized is None:
+                normalized = _normalize_type(typ)
+            if not isinstance(arg, normalized):
+                raise ValueError(_arg_type_errors(function_name, [(arg, _normalize_type(typ))
+                                                                  for arg, typ in arguments_and_types]))
+        return True
+
+    @staticmethod
+    def arg_validator(function_name, *types):
+        # type: (str, ...) -> Callable[..., bool]
+        """
+        compiled version of check_arg_types for one call site.  The types are normalized once here and the returned
+        function only does the isinstance checks, so build it once (at module level) and call it in the function.
+        It raises the same ValueError as check_arg_types and is a no-op when arg checking is off.  example:
+            _check_get_run = Helpers.arg_validator('get_run', (str, int))
+            ...
+            def get_run(self, run_id):
+                if _check_get_run(run_id):
+        :param function_name: name of the function the args belong to.  used in the error messages.
+        :param types: one type, tuple of types or None per argument.
+        :return: function(*args) that returns True if every arg has the right type.
+        """
+        key = (function_name, types)
+        validator = _validators.get(key)
+        if validator is not None:
+            return validator
+        normalized = tuple(_normalize_type(typ) for typ in types)
+        if len(normalized) == 1:
+            typ = normalized[0]
+
+            def validator(arg):
+                if _arg_checks_enabled and not isinstance(arg, typ):
+                    raise ValueError(_arg_type_errors(function_name, [(arg, typ)]))
+                return True
+        else:
+            def validator(*args):
+                if _arg_checks_enabled and not all(map(isinstance, args, normalized)):
+                    raise ValueError(_arg_type_errors(function_name, list(zip(args, normalized))))
+                return True
+        _validators[key] = validator
+        return validator
+
+    @staticmethod
+    def set_arg_checking(enabled):
+        # type: (bool) -> None
+        """
+        turns check_arg_types and the arg_validator checks on or off for the whole process.
+        """
+        global _arg_checks_enabled
+        _arg_checks_enabled = bool(enabled)
+
+    @staticmethod
+    def arg_checking_enabled():
+        # type: () -> bool
+        return _arg_checks_enabled
 
     @staticmethod
     def list_to_comma_delim_string(list_to_convert):
@@ -91,15 +286,19 @@ class Helpers():
         """
         Searches a list of dictionaries for a key value pair.  If it finds it then it either returns the dictionary
         containing it or the index in the list of that dictionary.  If return_index is false then it returns the dict.
-        If return_index is true then it returns the integer index of the dictionary in the list.
+        If return_index is true then it returns the integer index of the dictionary in the list.  Pass an IndexedList
+        to look it up in that list's index instead of searching.
         :param key: string key to look for.
         :param value: value associated with the key to look for.
         :param list_of_dicts: List of dictionaries to search in
         :param return_index: bool.  True if you want the index returned, False if you want the found dictionary returned.
         :return: None or the integer index found or the dictonary found.
         """
-        found_index = next((index for (index, d) in enumerate(list_of_dicts) if d[key] == value), None)
-        if found_index >= 0:
+        if isinstance(list_of_dicts, IndexedList):
+            found_index = list_of_dicts.position(key, value)
+        else:
+            found_index = next((index for (index, d) in enumerate(list_of_dicts) if d[key] == value), None)
+        if found_index is not None:
             if return_index:
                 return found_index
             else:
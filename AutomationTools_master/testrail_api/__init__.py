@@ -0,0 +1,49 @@
+# The main classes can be imported straight from the package, e.g.
+#     from AutomationTools_master.testrail_api import PyTestRail
+# Each one is imported from its module the first time it's used (PEP 562), so importing the package stays cheap and
+# only loads the modules the caller actually needs.
+
+# name: module it lives in
+_lazy_exports = {
+    'APIClient': 'testrail',
+    'APIError': 'testrail',
+    'PyTestRail': 'pytestrail',
+    'TestStatus': 'pytestrail',
+    'AsyncPyTestRail': 'async_pytestrail',
+    'ResponseCache': 'cache',
+    'TestRailMirror': 'mirror',
+    'RunIndex': 'run_index',
+    'PlanIndex': 'run_index',
+    'ResultQueue': 'result_queue',
+    'ResultSpool': 'result_spool',
+    'SpoolReplayer': 'result_spool',
+    'SectionTree': 'section_tree',
+    'TagIndex': 'tag_index',
+    'CaseTable': 'case_table',
+    'RunGeneratorDaemon': 'daemon',
+    'DaemonClient': 'daemon_client',
+    'TestTags': 'testplan',
+    'Operator': 'testplan',
+    'CaseFilter': 'testplan',
+    'TestCase': 'testplan',
+    'TestRun': 'testplan',
+    'TestPlan': 'testplan',
+    'PlanBuilder': 'testplan',
+}
+
+__all__ = list(_lazy_exports)
+
+
+def __getattr__(name):
+    module_name = _lazy_exports.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    from importlib import import_module
+    value = getattr(import_module('.' + module_name, __name__), name)
+    # cache it so the next lookup doesn't come back here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_exports))
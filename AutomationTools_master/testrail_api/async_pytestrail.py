@@ -0,0 +1,181 @@
+import asyncio
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+from .pytestrail import PyTestRail, PAGE_SIZE
+
+
+class AsyncPyTestRail:
+    """
+    asyncio version of PyTestRail.  Every PyTestRail method that talks to testrail is available here as a coroutine
+    with the same name and arguments, e.g. await atr.get_cases(27, 2552) or await atr.get_projects (get_projects and
+    get_case_types are properties on PyTestRail, here they're coroutine methods: await atr.get_projects()).
+
+    Calls run on a worker pool that shares one pooled PyTestRail connection.  max_concurrency caps how many requests
+    are in flight at once, anything over that waits its turn.  Methods that don't hit the network (result_builder,
+    strip_id, plan_entry_builder, ...) stay regular functions.  Anything else, like send_get, can be run on the pool
+    with call: await atr.call('send_get', 'get_case/1').  The iter_ methods (iter_cases, iter_runs, ...) are
+    async generators: async for case in atr.iter_cases(27, 2552).
+
+    example:
+        async with AsyncPyTestRail(user, key, max_concurrency=16) as atr:
+            tests_by_run = await atr.get_tests_in_runs([5234, 5235, 5236])
+    """
+    # PyTestRail methods that go over the network.  Each gets a coroutine (iter_ ones an async generator) with the
+    # same name.  New PyTestRail methods aren't picked up on their own, add them here if they're api calls.
+    API_METHODS = ('add_attachment_to_result', 'add_case', 'add_nested_sections', 'add_plan', 'add_plan_entry',
+                   'add_rerun_run', 'add_result', 'add_run', 'add_run_chunked', 'add_section', 'add_suite',
+                   'add_test_results', 'build_plan_index', 'close_run', 'delete_plan', 'delete_run', 'delete_section',
+                   'delete_suite', 'ensure_section_paths', 'find_case_in_section', 'get_all_cases',
+                   'get_all_results_for_run', 'get_case', 'get_case_ids_by_custom_tag', 'get_case_ids_by_status',
+                   'get_case_steps', 'get_case_types', 'get_cases', 'get_name_from_suite', 'get_plan', 'get_plans',
+                   'get_proj_suite_from_run', 'get_project', 'get_project_id', 'get_projects', 'get_results',
+                   'get_results_for_case', 'get_results_for_run', 'get_run', 'get_runid_for_case_in_plan', 'get_runs',
+                   'get_section', 'get_sections', 'get_suite', 'get_suite_id', 'get_suites', 'get_test',
+                   'get_tests_in_run', 'is_case_in_run', 'iter_cases', 'iter_plans', 'iter_results_for_case',
+                   'iter_results_for_run', 'iter_runs', 'iter_sections', 'iter_tests_in_run', 'update_run',
+                   'update_section', 'update_suite')
+    # PyTestRail methods that don't wait on testrail.  These are passed straight through instead of being wrapped.
+    LOCAL_METHODS = ('add_argument', 'result_builder', 'strip_id', 'strip_bad_data', 'find_matching_section',
+                     'plan_entry_builder', 'entry_run_builder', 'placeholder', 'enable_result_spool',
+                     'disable_result_spool', 'section_tree')
+
+    def __init__(self, username, api_key, testrail_url='https://testrail.control4.com/', max_concurrency=8,
+                 interface=None, connect_timeout=10.0, read_timeout=120.0):
+        """
+        :type username: str
+        :type api_key: str
+        :type testrail_url: str
+        :type max_concurrency: int
+        :type interface: PyTestRail
+        :type connect_timeout: float
+        :type read_timeout: float
+        :param username: the testrail username to use...eg user@control4.com
+        :param api_key: the testrail api_key or password for the user.
+        :param testrail_url: url to the testrail instance you're working with.
+        :param max_concurrency: max number of testrail requests in flight at the same time.
+        :param interface: optional. existing PyTestRail object to use instead of creating one.  Its connection pool
+            should be at least max_concurrency connections or the extra requests will open throwaway connections.
+        :param connect_timeout: seconds to wait for a connection to testrail.
+        :param read_timeout: seconds to wait for testrail to respond.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency has to be at least 1.  I got: {}".format(max_concurrency))
+        if interface is None:
+            interface = PyTestRail(username, api_key, testrail_url, pool_maxsize=max_concurrency,
+                                   connect_timeout=connect_timeout, read_timeout=read_timeout)
+        self.interface = interface
+        self.max_concurrency = max_concurrency
+        self.test_status = interface.test_status
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='AsyncPyTestRail')
+
+    def __getattr__(self, name):
+        # only called for attributes that aren't found normally.  Hands back the formatting helpers from PyTestRail.
+        if name in AsyncPyTestRail.LOCAL_METHODS:
+            return getattr(self.interface, name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        waits for queued requests to finish, then shuts down the worker pool and the pooled connections.
+        """
+        self._executor.shutdown(wait=True)
+        self.interface.close()
+
+    async def call(self, method_name, *args, **kwargs):
+        """
+        runs a PyTestRail method by name on the worker pool and returns its result.  The wrapped coroutine methods
+        all go through here.
+        :type method_name: str
+        :param method_name: name of the PyTestRail method or property to run
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          functools.partial(self._call_interface, method_name, args, kwargs))
+
+    def _call_interface(self, method_name, args, kwargs):
+        # the getattr has to happen on the worker thread too.  get_projects and get_case_types are properties so
+        # just looking them up sends the request.
+        attribute = getattr(self.interface, method_name)
+        if callable(attribute):
+            return attribute(*args, **kwargs)
+        return attribute
+
+    async def get_tests_in_runs(self, run_ids):
+        # type: (List[str or int]) -> Dict[int, List[dict]]
+        """
+        gets the tests for every run in run_ids at the same time.
+        :param run_ids: list of string or integer run ids
+        :return: dict of integer run id: get_tests_in_run response for that run
+        """
+        run_ids = [self.interface.strip_id(run_id) for run_id in run_ids]
+        responses = await asyncio.gather(*[self.get_tests_in_run(run_id) for run_id in run_ids])
+        return dict(zip(run_ids, responses))
+
+    async def test_runs_from_plan(self, plan_id):
+        # type: (str or int) -> List
+        """
+        builds a testplan.TestRun for every run in a test plan, with run_tests filled in.  The tests for all runs
+        are fetched at the same time instead of one run after the other like TestRun.run_from_existing_runID.
+        :param plan_id: string or integer id of the test plan
+        :return: list of testplan.TestRun objects in the same order the runs appear in the plan
+        """
+        from .testplan import TestRun
+
+        plan_data = await self.get_plan(plan_id)
+        if not plan_data:
+            raise ValueError('plan_id: {0} doesn''t exist in testrail.'.format(plan_id))
+        run_headers = [run for entry in plan_data['entries'] for run in entry['runs']]
+        tests_by_run = await self.get_tests_in_runs([run['id'] for run in run_headers])
+        test_runs = []
+        for run_data in run_headers:
+            test_run = TestRun(run_data['suite_id'], [""], run_id=run_data['id'], interface=self.interface
+                               , project_id=run_data['project_id'], run_header=run_data
+                               , run_tests=tests_by_run[run_data['id']])
+            test_run.run_name = str(run_data['name'])
+            test_runs.append(test_run)
+        return test_runs
+
+
+def _make_async_generator_method(method_name):
+    async def method(self, *args, **kwargs):
+        # the generator body doesn't run until it's iterated so creating it here doesn't block the event loop.
+        # records are pulled a page at a time on the worker pool.
+        records = getattr(self.interface, method_name)(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(self._executor, list, itertools.islice(records, PAGE_SIZE))
+            if not batch:
+                break
+            for record in batch:
+                yield record
+    method.__name__ = method_name
+    method.__qualname__ = 'AsyncPyTestRail.{}'.format(method_name)
+    method.__doc__ = getattr(PyTestRail, method_name).__doc__
+    return method
+
+
+def _make_coroutine_method(method_name):
+    async def method(self, *args, **kwargs):
+        return await self.call(method_name, *args, **kwargs)
+    method.__name__ = method_name
+    method.__qualname__ = 'AsyncPyTestRail.{}'.format(method_name)
+    method.__doc__ = getattr(PyTestRail, method_name).__doc__
+    return method
+
+
+# add a coroutine version of every PyTestRail api method
+for _name in AsyncPyTestRail.API_METHODS:
+    if _name.startswith('iter_'):
+        setattr(AsyncPyTestRail, _name, _make_async_generator_method(_name))
+    else:
+        setattr(AsyncPyTestRail, _name, _make_coroutine_method(_name))
+del _name
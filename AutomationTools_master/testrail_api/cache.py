@@ -0,0 +1,162 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Callable
+
+# marks a cache miss since None could be a real cached response
+_MISSING = object()
+
+
+class ResponseCache:
+    """
+    Size bounded LRU cache for testrail GET responses with a time to live per endpoint.  Hand one to PyTestRail
+    (PyTestRail(user, key, cache=ResponseCache())) and repeat calls to metadata endpoints like get_projects,
+    get_suites or get_sections are answered locally until their ttl runs out.
+
+    Only endpoints listed in ttls are cached.  Everything else (cases, runs, tests, results) always goes to testrail.
+    When PyTestRail sends a write, every cached endpoint that write can change is dropped (see INVALIDATES), so
+    add_section followed by get_sections sees the new section.
+
+    Anything with get_or_fetch(uri, fetch) and invalidate_for_write(uri) methods can be passed to PyTestRail instead
+    of this class.
+    """
+    # seconds each endpoint's responses are kept.  These almost never change during a test session.
+    DEFAULT_TTLS = {
+        'get_projects': 600,
+        'get_project': 600,
+        'get_suites': 300,
+        'get_suite': 300,
+        'get_sections': 120,
+        'get_section': 120,
+        'get_case_types': 3600,
+        'get_case_fields': 3600,
+        'get_priorities': 3600,
+        'get_statuses': 3600,
+        'get_templates': 3600,
+        'get_configs': 600,
+        'get_milestones': 300,
+        'get_milestone': 300,
+    }
+
+    # write endpoint: read endpoints whose cached responses it makes stale
+    INVALIDATES = {
+        'add_project': ('get_projects', 'get_project'),
+        'update_project': ('get_projects', 'get_project'),
+        'delete_project': ('get_projects', 'get_project', 'get_suites', 'get_suite', 'get_sections', 'get_section'),
+        'add_suite': ('get_suites', 'get_suite'),
+        'update_suite': ('get_suites', 'get_suite'),
+        'delete_suite': ('get_suites', 'get_suite', 'get_sections', 'get_section'),
+        'add_section': ('get_sections', 'get_section'),
+        'update_section': ('get_sections', 'get_section'),
+        'move_section': ('get_sections', 'get_section'),
+        'delete_section': ('get_sections', 'get_section'),
+        'add_case_field': ('get_case_fields',),
+        'add_config': ('get_configs',),
+        'update_config': ('get_configs',),
+        'delete_config': ('get_configs',),
+        'add_config_group': ('get_configs',),
+        'update_config_group': ('get_configs',),
+        'delete_config_group': ('get_configs',),
+        'add_milestone': ('get_milestones', 'get_milestone'),
+        'update_milestone': ('get_milestones', 'get_milestone'),
+        'delete_milestone': ('get_milestones', 'get_milestone'),
+    }
+
+    def __init__(self, max_entries=512, ttls=None):
+        # type: (int, Dict[str, float]) -> None
+        """
+        :param max_entries: max number of responses kept.  The least recently used one is dropped past that.
+        :param ttls: optional. dict of endpoint name: seconds that's merged over DEFAULT_TTLS.  Set an endpoint to 0
+            or None to stop caching it.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries has to be at least 1.  I got: {}".format(max_entries))
+        self.max_entries = max_entries
+        self.ttls = dict(ResponseCache.DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()   # uri: (expires_at, response)
+        self._generation = 0            # bumped on every invalidation
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(uri):
+        # type: (str) -> str
+        """
+        :return: the api method name at the front of a uri.  e.g. get_sections for get_sections/27&suite_id=2552
+        """
+        return uri.split('/', 1)[0].split('&', 1)[0]
+
+    def get_or_fetch(self, uri, fetch):
+        # type: (str, Callable[[], object]) -> object
+        """
+        returns the cached response for uri if there is one that hasn't expired.  Otherwise calls fetch(), caches
+        what it returns and returns that.  Exceptions from fetch are passed through and nothing is cached.
+        """
+        ttl = self.ttls.get(self.endpoint(uri))
+        if not ttl:
+            return fetch()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(uri)
+                self.hits += 1
+                cached = entry[1]
+            else:
+                self.misses += 1
+                cached = _MISSING
+            generation = self._generation
+        if cached is not _MISSING:
+            # callers are free to modify what they get back (add_nested_sections appends to get_sections), so
+            # never hand out the cached object itself.
+            return copy.deepcopy(cached)
+        response = fetch()
+        with self._lock:
+            if generation != self._generation:
+                # a write invalidated the cache while we were fetching.  what we got may be from before that write.
+                return response
+            self._entries[uri] = (now + ttl, copy.deepcopy(response))
+            self._entries.move_to_end(uri)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return response
+
+    def invalidate_for_write(self, uri):
+        # type: (str) -> None
+        """
+        drops the cached responses a write to uri could have made stale.
+        """
+        stale_endpoints = ResponseCache.INVALIDATES.get(self.endpoint(uri))
+        if stale_endpoints:
+            self.invalidate(*stale_endpoints)
+
+    def invalidate(self, *endpoints):
+        # type: (str) -> None
+        """
+        drops every cached response for the given endpoint names.  With no args the whole cache is cleared.
+        """
+        with self._lock:
+            self._generation += 1
+            if not endpoints:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                return
+            for uri in [uri for uri in self._entries if self.endpoint(uri) in endpoints]:
+                del self._entries[uri]
+                self.invalidations += 1
+
+    def stats(self):
+        # type: () -> Dict[str, int]
+        """
+        :return: dict with the hit, miss, eviction and invalidation counters and the current number of entries.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self._entries)}
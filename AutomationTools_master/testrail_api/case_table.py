@@ -0,0 +1,217 @@
+from typing import List, Dict, Iterable
+
+try:
+    import numpy
+except ImportError:
+    # optional.  only CaseTable needs it, the rest of testrail_api works without numpy.
+    numpy = None
+
+
+class CaseTable:
+    """
+    Column store for the cases of a suite, for picking run cases by priority, type, section, milestone, dates or
+    custom fields without looping over case dicts.  Every numeric field is one numpy int64 array (0 where the case
+    has no value), and each custom field is dictionary encoded: a small array of the distinct values plus an int32
+    code per case.  Multi-select custom fields (lists, like custom_tags) are kept as a flat value array with the row
+    each value belongs to.  The case dicts themselves aren't kept.
+
+    Filters return boolean masks that can be combined with & | ~, and select turns a mask into the list of case
+    ids that add_run(case_ids=...) and plan_entry_builder(case_ids=...) take.  example:
+        table = CaseTable.from_suite(pyt, 27, 2552, custom_fields=['custom_tags', 'custom_automation_type'])
+        case_ids = table.select(table.mask(priority_id=[3, 4], custom_automation_type=2)
+                                & ~table.mask(custom_tags=TestTags.Disabled))
+
+    Needs numpy.  pip install numpy
+    """
+    NUMERIC_COLUMNS = ('id', 'section_id', 'suite_id', 'priority_id', 'type_id', 'template_id', 'milestone_id',
+                       'created_by', 'created_on', 'updated_by', 'updated_on')
+
+    # mask() keywords for date ranges, same names as the get_cases filters: (column, compare)
+    RANGE_FILTERS = {'created_after': ('created_on', 'gt'), 'created_before': ('created_on', 'lt'),
+                     'updated_after': ('updated_on', 'gt'), 'updated_before': ('updated_on', 'lt')}
+
+    def __init__(self, cases, custom_fields=None):
+        # type: (Iterable[Dict], List[str]) -> None
+        """
+        :param cases: get_case dicts.
+        :param custom_fields: optional. names of the custom fields to keep, e.g. ['custom_tags'].  Defaults to every
+            custom_ field any of the cases has whose values are numbers, bools or lists of numbers (dropdowns,
+            checkboxes, multi-selects).  Text and step fields are only kept if they're named here.
+        """
+        if numpy is None:
+            raise ImportError("CaseTable needs numpy.  pip install numpy")
+        numeric = {column: [] for column in CaseTable.NUMERIC_COLUMNS}
+        custom = {} if custom_fields is None else {field: [] for field in custom_fields}
+        row_count = 0
+        for case in cases:
+            if custom_fields is None:
+                # cases only have the custom fields that apply to them, so a field can show up on any case
+                for field in case:
+                    if field.startswith('custom_') and field not in custom:
+                        custom[field] = [None] * row_count
+            for column, values in numeric.items():
+                values.append(case.get(column) or 0)
+            for field, values in custom.items():
+                values.append(case.get(field))
+            row_count += 1
+        self.row_count = row_count
+        self.columns = {column: numpy.array(values, dtype=numpy.int64) for column, values in numeric.items()}
+        self.custom_columns = {}    # field: (distinct values array, codes array)
+        self.multi_columns = {}     # field: (flat values array, row of each value array)
+        for field, values in custom.items():
+            kind = self._field_kind(values)
+            if kind == 'other':
+                if custom_fields is not None:
+                    raise ValueError("custom field {} has values that can't be indexed, like dicts or lists of dicts"
+                                     .format(field))
+            elif kind == 'text' and custom_fields is None:
+                continue
+            elif kind == 'multi':
+                self.multi_columns[field] = self._encode_multi(values)
+            else:
+                self.custom_columns[field] = self._encode(values)
+        # position of each case id, for lookups by id
+        self._order = numpy.argsort(self.columns['id'], kind='stable')
+
+    @classmethod
+    def from_suite(cls, interface, project_id, suite_id, custom_fields=None, workers=8, **filters):
+        """
+        builds the table from every case in a suite.  The pages are downloaded in parallel, see get_all_cases.
+        :type interface: pytestrail.PyTestRail
+        :param filters: any of the optional get_cases args except limit and offset.
+        :rtype: CaseTable
+        """
+        return cls(interface.get_all_cases(project_id, suite_id, workers=workers, **filters),
+                   custom_fields=custom_fields)
+
+    @classmethod
+    def from_mirror(cls, case_mirror, suite_id, custom_fields=None, **filters):
+        """
+        builds the table from the cases of a suite in a mirror.TestRailMirror.
+        :param filters: any of the TestRailMirror.get_cases filters.
+        :rtype: CaseTable
+        """
+        return cls(case_mirror.get_cases(suite_id, **filters), custom_fields=custom_fields)
+
+    @staticmethod
+    def _field_kind(values):
+        # type: (list) -> str
+        """
+        :return: 'number', 'text', 'multi' (lists of hashable values) or 'other' for a custom field's values.
+        """
+        kind = 'number'
+        for value in values:
+            if value is None or isinstance(value, (bool, int, float)):
+                continue
+            if isinstance(value, str):
+                kind = 'text' if kind == 'number' else kind
+            elif isinstance(value, list) and not any(isinstance(item, (dict, list)) for item in value):
+                kind = 'multi'
+            else:
+                return 'other'
+        return kind
+
+    @staticmethod
+    def _encode(values):
+        codes = {}
+        encoded = numpy.fromiter((codes.setdefault(value, len(codes)) for value in values), dtype=numpy.int32,
+                                 count=len(values))
+        distinct = numpy.empty(len(codes), dtype=object)
+        distinct[:] = list(codes)
+        return distinct, encoded
+
+    @staticmethod
+    def _encode_multi(values):
+        flat = []
+        rows = []
+        for row, value in enumerate(values):
+            if value:
+                flat.extend(value)
+                rows.extend([row] * len(value))
+        # ints for the usual multi-select of option ids, objects if they're strings or mixed
+        flat_values = numpy.array(flat) if flat else numpy.array([], dtype=numpy.int64)
+        if flat_values.dtype.kind not in 'iub':
+            flat_values = numpy.array(flat, dtype=object)
+        return flat_values, numpy.array(rows, dtype=numpy.int64)
+
+    def __len__(self):
+        return self.row_count
+
+    def _isin(self, array, wanted):
+        if isinstance(wanted, (list, tuple, set, frozenset)):
+            return numpy.isin(array, list(wanted))
+        return array == wanted
+
+    def mask(self, **conditions):
+        # type: (...) -> numpy.ndarray
+        """
+        :param conditions: column=value pairs that are and'ed.  The value can be a single value or a list/set of
+            values (any of them matches).  Columns are NUMERIC_COLUMNS, the custom fields the table was built with,
+            and created_after, created_before, updated_after, updated_before (unix timestamps).  For multi-select
+            custom fields a case matches if any of its values is one of the wanted ones.
+        :return: boolean numpy array with one entry per case.
+        """
+        mask = numpy.ones(self.row_count, dtype=bool)
+        for name, wanted in conditions.items():
+            if name in self.columns:
+                mask &= self._isin(self.columns[name], wanted)
+            elif name in CaseTable.RANGE_FILTERS:
+                column, compare = CaseTable.RANGE_FILTERS[name]
+                mask &= getattr(numpy, 'greater' if compare == 'gt' else 'less')(self.columns[column], wanted)
+            elif name in self.custom_columns:
+                distinct, codes = self.custom_columns[name]
+                # compare against the handful of distinct values, then look the codes up per case
+                mask &= self._isin(distinct, wanted)[codes] if len(distinct) else False
+            elif name in self.multi_columns:
+                flat, rows = self.multi_columns[name]
+                has_value = numpy.zeros(self.row_count, dtype=bool)
+                has_value[rows[self._isin(flat, wanted)]] = True
+                mask &= has_value
+            else:
+                raise ValueError("unknown case table column: {}.  valid columns are {}".format(
+                    name, sorted(set(self.columns) | set(CaseTable.RANGE_FILTERS) | set(self.custom_columns)
+                                 | set(self.multi_columns))))
+        return mask
+
+    def select(self, mask=None, **conditions):
+        # type: (numpy.ndarray, ...) -> List[int]
+        """
+        :param mask: optional. boolean array from mask() or a combination of them.
+        :param conditions: optional. more conditions, see mask().  and'ed with mask.
+        :return: list of integer case ids, in the order the cases were added.  Ready for add_run(case_ids=...).
+        """
+        if mask is None:
+            mask = self.mask(**conditions)
+        elif conditions:
+            mask = mask & self.mask(**conditions)
+        return self.columns['id'][mask].tolist()
+
+    def rows_for_case_ids(self, case_ids):
+        # type: (Iterable[int]) -> numpy.ndarray
+        """
+        :return: row positions of case ids in the table.  Raises ValueError for ids that aren't in it.
+        """
+        ids = self.columns['id']
+        wanted = numpy.asarray(list(case_ids), dtype=numpy.int64)
+        if not len(ids):
+            rows = numpy.empty(0, dtype=numpy.intp)
+            missing = wanted
+        else:
+            found = numpy.searchsorted(ids, wanted, sorter=self._order)
+            rows = self._order[numpy.minimum(found, len(ids) - 1)]
+            missing = wanted[ids[rows] != wanted]
+        if len(missing):
+            raise ValueError("case ids not in the case table: {}".format(missing.tolist()))
+        return rows
+
+    def values(self, column, case_ids=None):
+        # type: (str, Iterable[int]) -> list
+        """
+        :return: list of a column's values, for every case or for the given case ids.  Multi-select fields aren't
+            supported here.
+        """
+        rows = slice(None) if case_ids is None else self.rows_for_case_ids(case_ids)
+        if column in self.columns:
+            return self.columns[column][rows].tolist()
+        distinct, codes = self.custom_columns[column]
+        return distinct[codes[rows]].tolist()
@@ -0,0 +1,248 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Dict
+
+from .pytestrail import PyTestRail, APIError, RUN_CASE_CHUNK_SIZE
+from .run_generator import normalize_entry, create_run, create_runs, create_plan
+from .testplan import CaseFilter
+
+
+class RunGeneratorDaemon:
+    """
+    long running run generator.  Keeps one pooled PyTestRail object (give it a cache.ResponseCache for the suite and
+    section lookups) plus an index of the cases of every suite it has seen, and serves run generator requests over
+    localhost http or a unix socket, so CI jobs on the same host don't each pay for a new process, new connections
+    and cold caches.
+
+    Requests are POSTs with a json body, answers are json:
+        /create_run     a run_generator manifest entry.  Can have tag_filters instead of case_ids, a list of
+                        [operator, tag_id] pairs like [["==", 12], ["!=", 40]] (see TagIndex.evaluate) that is
+                        answered from the cached cases of the suite.  returns a create_run result.
+        /create_runs    {"runs": [entries], "concurrency": 4}.  returns a list of create_run results.
+        /create_plan    see run_generator.create_plan.  can have "concurrency" like /create_runs.
+        /add_results    {"run_id": 1, "results": [result dicts]}.  see PyTestRail.add_test_results.
+        /warm           {"project_id": 1, "suite_id": 2}.  loads the cases and sections of a suite ahead of time.
+    and GET /status for cache stats.  Use daemon_client.DaemonClient to talk to it.
+
+    example:
+        pyt = PyTestRail(user, key, pool_maxsize=16, cache=ResponseCache())
+        RunGeneratorDaemon(pyt).serve('/tmp/run_generator.sock')
+    """
+
+    def __init__(self, interface, case_ttl=600.0, concurrency=4, chunk_size=RUN_CASE_CHUNK_SIZE):
+        # type: (PyTestRail, float, int, int) -> None
+        """
+        :param interface: PyTestRail object every request goes through.  Its pool_maxsize should be at least
+            concurrency plus the number of requests you expect at the same time.
+        :param case_ttl: seconds the cases of a suite are kept before they're downloaded again.
+        :param concurrency: default max runs created at the same time by /create_runs.
+        :param chunk_size: runs with more cases than this are created with add_run_chunked.
+        """
+        self.interface = interface
+        self.case_ttl = case_ttl
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.started = time.time()
+        self.request_count = 0
+        self._tag_indexes = {}      # (project_id, suite_id): (expires_at, TagIndex)
+        self._suite_locks = {}      # (project_id, suite_id): lock so a suite's cases are only downloaded once
+        self._lock = threading.Lock()
+
+    def tag_index(self, project_id, suite_id):
+        """
+        :return: tag_index.TagIndex over the cases of a suite.  Downloaded the first time and again after case_ttl.
+        :rtype: tag_index.TagIndex
+        """
+        from .tag_index import TagIndex
+        key = (project_id, suite_id)
+        with self._lock:
+            suite_lock = self._suite_locks.setdefault(key, threading.Lock())
+        with suite_lock:
+            cached = self._tag_indexes.get(key)
+            if cached is None or cached[0] <= time.monotonic():
+                index = TagIndex.from_suite(self.interface, project_id, suite_id)
+                cached = (time.monotonic() + self.case_ttl, index)
+                with self._lock:
+                    self._tag_indexes[key] = cached
+            return cached[1]
+
+    def warm(self, body):
+        # type: (Dict) -> Dict
+        project_id = PyTestRail.strip_id(body['project_id'])
+        suite_id = PyTestRail.strip_id(body['suite_id'])
+        cases = len(self.tag_index(project_id, suite_id))
+        tree = self.interface.section_tree(project_id, suite_id)
+        return {'project_id': project_id, 'suite_id': suite_id, 'cases': cases, 'sections': len(tree)}
+
+    def _entry(self, body, position=0):
+        # normalizes a create_run body and turns tag_filters into case_ids
+        tag_filters = body.get('tag_filters')
+        if tag_filters is None:
+            return normalize_entry(body, position)
+        if body.get('case_ids'):
+            raise ValueError("entry {} has both case_ids and tag_filters.  use one or the other".format(position))
+        entry = normalize_entry(dict(body, include_all_cases=False), position)
+        case_filters = [CaseFilter(str(operator), int(tag_id)) for operator, tag_id in tag_filters]
+        entry['case_ids'] = self.tag_index(entry['project_id'], entry['suite_id']).select(case_filters)
+        return entry
+
+    def create_run(self, body):
+        # type: (Dict) -> Dict
+        return create_run(self.interface, self._entry(body), chunk_size=self.chunk_size)
+
+    def create_runs(self, body):
+        # type: (Dict) -> List[Dict]
+        entries = [self._entry(entry, position) for position, entry in enumerate(body['runs'])]
+        return create_runs(self.interface, entries, concurrency=int(body.get('concurrency') or self.concurrency),
+                           chunk_size=self.chunk_size)
+
+    def create_plan(self, body):
+        # type: (Dict) -> Dict
+        return create_plan(self.interface, body, concurrency=int(body.get('concurrency') or self.concurrency))
+
+    def add_results(self, body):
+        # type: (Dict) -> Dict
+        run_id = PyTestRail.strip_id(body['run_id'])
+        response = self.interface.add_test_results(run_id, body['results'])
+        if response is None:
+            return {'run_id': run_id, 'results': None, 'error': 'add_test_results failed, see the daemon output'}
+        return {'run_id': run_id, 'results': response, 'error': None}
+
+    def status(self):
+        # type: () -> Dict
+        cache = self.interface.cache
+        with self._lock:
+            # tag_index adds suites from other request threads
+            cached_suites = sorted([list(key) for key in self._tag_indexes])
+            request_count = self.request_count
+        return {
+            'uptime': round(time.time() - self.started, 1),
+            'requests': request_count,
+            'cached_suites': cached_suites,
+            'response_cache': None if cache is None else {name: getattr(cache, name, None) for name in
+                                                           ('hits', 'misses', 'evictions', 'invalidations')},
+        }
+
+    # path: method that answers it.  Each takes the json body and returns something json serializable.
+    POST_ROUTES = {
+        '/create_run': 'create_run',
+        '/create_runs': 'create_runs',
+        '/create_plan': 'create_plan',
+        '/add_results': 'add_results',
+        '/warm': 'warm',
+    }
+
+    def make_server(self, address):
+        """
+        :param address: unix socket path (anything with a / in it, or unix:<path>), or [host:]port for http.  The
+            host defaults to 127.0.0.1, only bind to another interface if you really mean to.
+        :return: the server, not started yet.  call serve_forever() on it.
+        """
+        if address.startswith('unix:') or '/' in address:
+            server = _UnixHTTPServer(address[5:] if address.startswith('unix:') else address, _DaemonRequestHandler)
+        else:
+            host, _, port = address.rpartition(':')
+            server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), _DaemonRequestHandler)
+        server.run_generator = self
+        return server
+
+    def serve(self, address):
+        """
+        serves requests on address until the process is stopped.  see make_server for the address format.
+        """
+        server = self.make_server(address)
+        print('run generator daemon listening on {}'.format(address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.interface.close()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    bound = False
+
+    def server_bind(self):
+        # a socket file left behind by a daemon that was killed would make bind fail.  Only remove it if it really
+        # is a socket and nothing answers on it, never a regular file or a daemon that's still running.
+        if self._is_stale_socket(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.bound = True
+        # what BaseHTTPRequestHandler expects from an http server
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    @staticmethod
+    def _is_stale_socket(path):
+        try:
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                return False
+        except FileNotFoundError:
+            return False
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            return True
+        finally:
+            probe.close()
+        return False
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        # also called when bind fails, and then the path belongs to someone else
+        if self.bound and os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        self.bound = False
+
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # one line per request is too much for a daemon that answers every CI job on the host
+        pass
+
+    def _answer(self, code, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._answer(200, self.server.run_generator.status())
+        else:
+            self._answer(404, {'error': 'unknown path {}'.format(self.path)})
+
+    def do_POST(self):
+        daemon = self.server.run_generator
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        method_name = RunGeneratorDaemon.POST_ROUTES.get(self.path)
+        if method_name is None:
+            self._answer(404, {'error': 'unknown path {}'.format(self.path)})
+            return
+        with daemon._lock:
+            daemon.request_count += 1
+        try:
+            response = getattr(daemon, method_name)(json.loads(body.decode('utf-8') or 'null'))
+        except (ValueError, KeyError, TypeError) as error:
+            self._answer(400, {'error': '{}: {}'.format(type(error).__name__, error)})
+        except APIError as error:
+            self._answer(502, {'error': str(error)})
+        except Exception as error:
+            self._answer(500, {'error': '{}: {}'.format(type(error).__name__, error)})
+        else:
+            self._answer(200, response)
@@ -0,0 +1,136 @@
+import http.client
+import json
+import select
+import socket
+from typing import List, Dict
+
+from .testrail import APIError
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonClient:
+    """
+    talks to a daemon.RunGeneratorDaemon.  Only uses the standard library (no requests, no testrail modules past
+    APIError) so a short lived CI process that hands its work to the daemon starts as fast as python can.  The
+    connection is kept open between calls.  Not thread safe, use one DaemonClient per thread.
+
+    example:
+        client = DaemonClient('/tmp/run_generator.sock')
+        run_id = client.create_run(59, 23407, 'BDD:API_Test', case_ids=[3871665, 3878729])['run_id']
+    """
+
+    # requests that are safe to send twice.  Anything else is only resent if it provably never got to the daemon.
+    IDEMPOTENT = {('GET', '/status'), ('POST', '/warm')}
+
+    def __init__(self, address, timeout=600.0):
+        # type: (str, float) -> None
+        """
+        :param address: same as the daemon was started with.  a unix socket path (anything with a / in it, or
+            unix:<path>) or [host:]port.
+        :param timeout: seconds to wait for an answer.  Big runs and plans can take a while.
+        """
+        self.address = address
+        self.timeout = timeout
+        self._connection = None
+
+    def _connect(self):
+        address = self.address
+        if address.startswith('unix:') or '/' in address:
+            return _UnixHTTPConnection(address[5:] if address.startswith('unix:') else address, self.timeout)
+        host, _, port = address.rpartition(':')
+        return http.client.HTTPConnection(host or '127.0.0.1', int(port), timeout=self.timeout)
+
+    def _request(self, method, path, body=None):
+        payload = None if body is None else json.dumps(body).encode('utf-8')
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        if self._connection is not None and self._dropped():
+            self.close()
+        # a kept open connection the daemon has since dropped can still fail on first use.  That gets one retry on a
+        # new connection, but only if the request never got written or is safe to send twice.  A create or add that
+        # failed after it was sent may have been handled already.
+        for attempt in (1, 2):
+            if self._connection is None:
+                self._connection = self._connect()
+            sent = False
+            try:
+                self._connection.request(method, path, body=payload, headers=headers)
+                sent = True
+                response = self._connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError) as error:
+                self.close()
+                if attempt == 2 or (sent and (method, path) not in DaemonClient.IDEMPOTENT):
+                    raise APIError('run generator daemon at {} failed: {}'.format(self.address, error))
+        answer = json.loads(data.decode('utf-8'))
+        if response.status != 200:
+            raise APIError('run generator daemon returned HTTP {} ({})'.format(response.status, answer.get('error')))
+        return answer
+
+    def _dropped(self):
+        # an idle keep-alive socket only turns readable when the daemon closed it
+        sock = self._connection.sock
+        if sock is None:
+            return False
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def create_run(self, project_id, suite_id, name, case_ids=None, **options):
+        # type: (int, int, str, List[int], ...) -> Dict
+        """
+        :param options: any other run_generator manifest entry key, or tag_filters (see RunGeneratorDaemon).
+        :return: run_generator.create_run result, a dict with run_id and error.
+        """
+        entry = dict(options, project_id=project_id, suite_id=suite_id, name=name)
+        if case_ids is not None:
+            entry['case_ids'] = list(case_ids)
+        return self._request('POST', '/create_run', entry)
+
+    def create_runs(self, entries, concurrency=None):
+        # type: (List[Dict], int) -> List[Dict]
+        """
+        :param entries: run_generator manifest entries.
+        :return: list of run_generator.create_run results in entries order.
+        """
+        body = {'runs': entries}
+        if concurrency is not None:
+            body['concurrency'] = concurrency
+        return self._request('POST', '/create_runs', body)
+
+    def create_plan(self, project_id, name, entries, **options):
+        # type: (int, str, List[Dict], ...) -> Dict
+        """
+        :param options: description, milestone_id.  see run_generator.create_plan.
+        :return: dict with plan_id, run_ids and error.
+        """
+        return self._request('POST', '/create_plan', dict(options, project_id=project_id, name=name, entries=entries))
+
+    def add_results(self, run_id, list_of_result_dicts):
+        # type: (int, List[Dict]) -> Dict
+        """
+        :return: dict with results (the add_test_results response) and error.
+        """
+        return self._request('POST', '/add_results', {'run_id': run_id, 'results': list_of_result_dicts})
+
+    def warm(self, project_id, suite_id):
+        # type: (int, int) -> Dict
+        return self._request('POST', '/warm', {'project_id': project_id, 'suite_id': suite_id})
+
+    def status(self):
+        # type: () -> Dict
+        return self._request('GET', '/status')
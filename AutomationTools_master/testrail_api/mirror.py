@@ -0,0 +1,283 @@
+import json
+import sqlite3
+import threading
+from typing import List, Dict
+
+from .pytestrail import PyTestRail
+
+
+class TestRailMirror:
+    """
+    Local sqlite copy of the projects, suites, sections and cases in testrail.  Sync a suite once and after that
+    case lookups and selection are indexed queries against the local file instead of downloads.
+
+    The first sync_suite for a suite downloads everything.  Later ones only ask testrail for cases updated since the
+    newest updated_on already in the mirror (get_cases updated_after filter).  testrail doesn't report deleted cases
+    through that filter so run sync_suite(..., full=True) every so often to drop them.
+
+    Records come back as the same dicts the api returns, so they can be used anywhere a get_cases/get_sections
+    response is expected.
+
+    example:
+        mirror = TestRailMirror(pyt, '/var/cache/testrail/mirror.sqlite3')
+        mirror.sync_suite(27, 2552)
+        case_ids = [case['id'] for case in mirror.get_cases(2552, priority_id=[3, 4])]
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS projects (id INTEGER PRIMARY KEY, name TEXT, data TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS suites (id INTEGER PRIMARY KEY, project_id INTEGER, name TEXT, '
+        'data TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS suites_project ON suites (project_id, name)',
+        'CREATE TABLE IF NOT EXISTS sections (id INTEGER PRIMARY KEY, suite_id INTEGER, parent_id INTEGER, '
+        'name TEXT, depth INTEGER, display_order INTEGER, data TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS sections_suite ON sections (suite_id, parent_id, name)',
+        'CREATE TABLE IF NOT EXISTS cases (id INTEGER PRIMARY KEY, suite_id INTEGER, section_id INTEGER, '
+        'title TEXT, priority_id INTEGER, type_id INTEGER, template_id INTEGER, milestone_id INTEGER, '
+        'updated_on INTEGER, data TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS cases_suite_section ON cases (suite_id, section_id)',
+        'CREATE INDEX IF NOT EXISTS cases_suite_priority ON cases (suite_id, priority_id)',
+        'CREATE INDEX IF NOT EXISTS cases_suite_type ON cases (suite_id, type_id)',
+        'CREATE INDEX IF NOT EXISTS cases_suite_updated ON cases (suite_id, updated_on)',
+    )
+
+    def __init__(self, interface, db_path='testrail_mirror.sqlite3', workers=8):
+        # type: (PyTestRail, str, int) -> None
+        """
+        :param interface: PyTestRail object used to sync from testrail.  Only needed for the sync_ methods, pass
+            None to just query an existing mirror file.
+        :param db_path: path to the sqlite file.  It's created if it doesn't exist.  ':memory:' works for a mirror
+            that only lives as long as the object.
+        :param workers: number of pages downloaded at the same time during a full case sync.
+        """
+        if interface is not None:
+            assert isinstance(interface, PyTestRail)
+        self.interface = interface
+        self.db_path = db_path
+        self.workers = workers
+        # one connection shared by every thread.  sqlite serializes writes anyway, the lock keeps the python side
+        # of the connection from being used by two threads at once.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            for statement in TestRailMirror.SCHEMA:
+                self._connection.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # sync from testrail
+    def sync_projects(self):
+        # type: () -> int
+        """
+        replaces the mirrored project list with what's in testrail now.
+        :return: number of projects mirrored
+        """
+        projects = self._records(self._require_interface().get_projects, 'projects')
+        rows = [(project['id'], project['name'], json.dumps(project)) for project in projects]
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM projects')
+            self._connection.executemany('INSERT INTO projects (id, name, data) VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def sync_suites(self, project_id):
+        # type: (int) -> int
+        """
+        replaces the mirrored suites for a project with what's in testrail now.
+        :param project_id: integer project id
+        :return: number of suites mirrored
+        """
+        suites = self._records(self._require_interface().get_suites(project_id), 'suites')
+        rows = [(suite['id'], project_id, suite['name'], json.dumps(suite)) for suite in suites]
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM suites WHERE project_id = ?', (project_id,))
+            self._connection.executemany('INSERT INTO suites (id, project_id, name, data) VALUES (?, ?, ?, ?)',
+                                         rows)
+        return len(rows)
+
+    def sync_sections(self, project_id, suite_id):
+        # type: (int, int) -> int
+        """
+        replaces the mirrored sections for a suite with what's in testrail now.  Sections have no updated_after
+        filter so this is always a full download, one request per 250 sections.  Every page is downloaded before the
+        mirrored sections are replaced, so a failed page leaves the old ones in place.
+        :return: number of sections mirrored
+        """
+        sections = list(self._require_interface().iter_sections(project_id, suite_id))
+        rows = [(section['id'], suite_id, section['parent_id'], section['name'], section['depth']
+                 , section.get('display_order'), json.dumps(section)) for section in sections]
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM sections WHERE suite_id = ?', (suite_id,))
+            self._connection.executemany('INSERT INTO sections (id, suite_id, parent_id, name, depth, display_order'
+                                         ', data) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def sync_cases(self, project_id, suite_id, full=False):
+        # type: (int, int, bool) -> int
+        """
+        brings the mirrored cases for a suite up to date.  If the suite has never been synced, or full is True,
+        every case is downloaded and the suite's cases are replaced.  Otherwise only cases updated since the newest
+        updated_on in the mirror are downloaded and upserted.
+        :param project_id: integer project id
+        :param suite_id: integer suite id
+        :param full: True to force a full download.  Use it now and then to drop cases deleted in testrail.
+        :return: number of cases downloaded
+        """
+        interface = self._require_interface()
+        watermark = None if full else self.last_case_update(suite_id)
+        if watermark is None:
+            cases = interface.get_all_cases(project_id, suite_id, workers=self.workers)
+        else:
+            # updated_after is a strict comparison.  step back a second so edits made in the same second as the
+            # newest case we have aren't missed.  Re-downloading a few unchanged cases is harmless.
+            cases = list(interface.iter_cases(project_id, suite_id, updated_after=watermark - 1))
+        rows = [self._case_row(case, suite_id) for case in cases]
+        with self._lock, self._connection:
+            if watermark is None:
+                self._connection.execute('DELETE FROM cases WHERE suite_id = ?', (suite_id,))
+            self._connection.executemany('INSERT OR REPLACE INTO cases (id, suite_id, section_id, title, priority_id'
+                                         ', type_id, template_id, milestone_id, updated_on, data) '
+                                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def sync_suite(self, project_id, suite_id, full=False):
+        # type: (int, int, bool) -> int
+        """
+        syncs the sections and cases of a suite.  See sync_cases.
+        :return: number of cases downloaded
+        """
+        self.sync_sections(project_id, suite_id)
+        return self.sync_cases(project_id, suite_id, full=full)
+
+    def last_case_update(self, suite_id):
+        # type: (int) -> int or None
+        """
+        :return: newest updated_on timestamp of the mirrored cases in a suite.  None if the suite hasn't been synced.
+        """
+        row = self._query_one('SELECT MAX(updated_on) FROM cases WHERE suite_id = ?', (suite_id,))
+        return row[0]
+
+    # local queries
+    def get_projects(self):
+        # type: () -> List[Dict]
+        return self._query_data('SELECT data FROM projects ORDER BY id', ())
+
+    def get_suites(self, project_id):
+        # type: (int) -> List[Dict]
+        return self._query_data('SELECT data FROM suites WHERE project_id = ? ORDER BY id', (project_id,))
+
+    def get_suite_id(self, project_id, suite_name):
+        # type: (int, str) -> int
+        """
+        same as PyTestRail.get_suite_id but from the mirror.  returns -1 if there's no suite with that name.
+        """
+        row = self._query_one('SELECT id FROM suites WHERE project_id = ? AND name = ?', (project_id, suite_name))
+        return row[0] if row else -1
+
+    def get_sections(self, suite_id):
+        # type: (int) -> List[Dict]
+        return self._query_data('SELECT data FROM sections WHERE suite_id = ? ORDER BY display_order, id'
+                                , (suite_id,))
+
+    def get_case(self, case_id):
+        # type: (str or int) -> Dict or None
+        row = self._query_one('SELECT data FROM cases WHERE id = ?', (PyTestRail.strip_id(case_id),))
+        return json.loads(row[0]) if row else None
+
+    def get_case_steps(self, case_id):
+        # type: (str or int) -> List[Dict]
+        """
+        same as PyTestRail.get_case_steps but from the mirror.
+        """
+        case_data = self.get_case(case_id)
+        if case_data is None:
+            raise ValueError("case id: {} isn't in the mirror.  Sync its suite first.".format(case_id))
+        if "custom_steps_separated" in case_data:
+            return case_data["custom_steps_separated"]
+        else:
+            raise ValueError("custom_steps_separated doesnt exist in case id: {}.  So test case step updates wont "
+                             "work downstream.".format(case_id))
+
+    def get_cases(self, suite_id, section_id=None, priority_id=None, type_id=None, template_id=None,
+                  milestone_id=None, title_filter=None, updated_after=None):
+        # type: (int, int, List[int], List[int], List[int], List[int], str, int) -> List[Dict]
+        """
+        selects cases from the mirror.  The filters mean the same thing as the get_cases ones and are and'ed.
+        :param suite_id: required. integer suite id
+        :param section_id: optional. integer section id
+        :param priority_id: optional. list of integer priority ids
+        :param type_id: optional. list of integer type ids
+        :param template_id: optional. list of integer template ids
+        :param milestone_id: optional. list of integer milestone ids
+        :param title_filter: optional. only cases whose title contains this string
+        :param updated_after: optional. unix timestamp.  only cases updated after it
+        :return: list of get_case dicts ordered by case id
+        """
+        clauses, args = self._case_filter(suite_id, section_id, priority_id, type_id, template_id, milestone_id,
+                                          title_filter, updated_after)
+        return self._query_data('SELECT data FROM cases WHERE {} ORDER BY id'.format(' AND '.join(clauses)), args)
+
+    def get_case_ids(self, suite_id, section_id=None, priority_id=None, type_id=None, template_id=None,
+                     milestone_id=None, title_filter=None, updated_after=None):
+        # type: (int, int, List[int], List[int], List[int], List[int], str, int) -> List[int]
+        """
+        same as get_cases but only returns the case ids, which skips decoding the case data.
+        """
+        clauses, args = self._case_filter(suite_id, section_id, priority_id, type_id, template_id, milestone_id,
+                                          title_filter, updated_after)
+        rows = self._query_all('SELECT id FROM cases WHERE {} ORDER BY id'.format(' AND '.join(clauses)), args)
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _case_filter(suite_id, section_id, priority_id, type_id, template_id, milestone_id, title_filter,
+                     updated_after):
+        clauses = ['suite_id = ?']
+        args = [suite_id]
+        if section_id is not None:
+            clauses.append('section_id = ?')
+            args.append(section_id)
+        for column, values in (('priority_id', priority_id), ('type_id', type_id), ('template_id', template_id)
+                               , ('milestone_id', milestone_id)):
+            if values is not None:
+                clauses.append('{} IN ({})'.format(column, ', '.join('?' * len(values))))
+                args.extend(values)
+        if title_filter is not None:
+            clauses.append('instr(title, ?) > 0')
+            args.append(title_filter)
+        if updated_after is not None:
+            clauses.append('updated_on > ?')
+            args.append(updated_after)
+        return clauses, args
+
+    @staticmethod
+    def _case_row(case, suite_id):
+        return (case['id'], case.get('suite_id', suite_id), case.get('section_id'), case.get('title')
+                , case.get('priority_id'), case.get('type_id'), case.get('template_id'), case.get('milestone_id')
+                , case.get('updated_on'), json.dumps(case))
+
+    @staticmethod
+    def _records(response, records_key):
+        # list endpoints return a plain list on older testrail and a paginated dict on 6.7+.  The get_ methods
+        # print the APIError and return None when a call fails, don't wipe the mirror in that case.
+        if response is None:
+            raise ValueError("testrail didn't return any {}.  See the error printed above.".format(records_key))
+        if isinstance(response, dict):
+            return response.get(records_key, [])
+        return response
+
+    def _require_interface(self):
+        if self.interface is None:
+            raise ValueError("this mirror was created without a PyTestRail interface so it can't sync.")
+        return self.interface
+
+    def _query_all(self, sql, args):
+        with self._lock:
+            return self._connection.execute(sql, args).fetchall()
+
+    def _query_one(self, sql, args):
+        with self._lock:
+            return self._connection.execute(sql, args).fetchone()
+
+    def _query_data(self, sql, args):
+        return [json.loads(row[0]) for row in self._query_all(sql, args)]
@@ -5,8 +5,11 @@ try:
 except:
     from .testrail import APIClient, APIError
 
-from typing import List, Dict, Text, Optional
+from typing import List, Dict, Text, Optional, Iterator
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import time
+import json
+import itertools
 import logging
 
 try:
@@ -18,6 +21,28 @@ except:
     from ..common.helpers import Helpers
 
 
+# testrail never returns more than this many records from one call to a list endpoint (get_cases, get_runs, ...)
+PAGE_SIZE = 250
+
+# add_run_chunked puts at most this many new cases into a run per add_run/update_run call
+RUN_CASE_CHUNK_SIZE = 5000
+
+# argument type checks for the methods below.  Built once here instead of on every call, see Helpers.arg_validator
+_check_get_run = Helpers.arg_validator('get_run', (str, int))
+_check_is_case_in_run = Helpers.arg_validator('is_caseId_in_run', (str, int), (str, int))
+_check_get_runid_for_case_in_plan = Helpers.arg_validator('get_runid_for_case_in_plan', (str, int), (str, int))
+_check_get_test = Helpers.arg_validator('get_test', (str, int))
+_check_get_tests = Helpers.arg_validator('get_tests', (str, int))
+_check_get_case_steps = Helpers.arg_validator('get_case_steps', (str, int), (list, None))
+_check_get_plan = Helpers.arg_validator('get_plan', (str, int))
+_check_get_plans = Helpers.arg_validator('get_plans', int, (int, None), (int, None))
+_check_add_plan = Helpers.arg_validator('add_plan', str, str, int, list, int)
+_check_add_plan_entry = Helpers.arg_validator('add_plan_entry', int, dict)
+_check_plan_entry_builder = Helpers.arg_validator('plan_entry_builder', int, str, str, int, list, list, list)
+_check_entry_run_builder = Helpers.arg_validator('entry_run_builder', list, str, str, int, list)
+_check_get_name_from_suite = Helpers.arg_validator('get_name_from_suite', int)
+
+
 class TestStatus:
     PASSED = 1
     BLOCKED = 2
@@ -28,7 +53,8 @@ class TestStatus:
 
 class PyTestRail(APIClient):
     # inherit from testrail's APIClient class.
-    def __init__(self, username, api_key, testrail_url='https://testrail.control4.com/'):
+    def __init__(self, username, api_key, testrail_url='https://testrail.control4.com/', pool_connections=10,
+                 pool_maxsize=10, pool_block=False, connect_timeout=10.0, read_timeout=120.0, cache=None):
         """
         pass in the username and api_key(password) for the testrail user.  The testrail url wont change for anyone
         in the company so i hard coded it here but you can override it if you want.  Then call the APIClient constructor
@@ -36,16 +62,58 @@ class PyTestRail(APIClient):
         :type username: str
         :type api_key: str
         :type testrail_url: str
+        :type pool_connections: int
+        :type pool_maxsize: int
+        :type pool_block: bool
+        :type connect_timeout: float
+        :type read_timeout: float
         :param username: the testrail username to use...eg user@control4.com
         :param api_key: the testrail api_key or password for the user.  you can add API_keys for your user in account
                         settings in testrail.  Make sure you hit save settings first or they wont work.
         :param testrail_url: url to the testrail instance you're working with.
-        """
-        APIClient.__init__(self, testrail_url)
+        :param pool_connections: optional. number of per-host connection pools.  see APIClient for details.
+        :param pool_maxsize: optional. max keep-alive connections per host.  Raise it if you share one PyTestRail
+                        object between more threads than this.
+        :param pool_block: optional. True to make threads wait for a free pooled connection instead of opening an
+                        extra one.
+        :param connect_timeout: optional. seconds to wait for a connection to testrail.
+        :param read_timeout: optional. seconds to wait for testrail to respond.
+        :param cache: optional. cache.ResponseCache (or anything with the same get_or_fetch and invalidate_for_write
+                        methods) used to answer repeat metadata GETs like get_projects and get_suites locally.
+        """
+        APIClient.__init__(self, testrail_url, pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                           pool_block=pool_block, connect_timeout=connect_timeout, read_timeout=read_timeout)
         self.user = username
         self.password = api_key
         self.test_status = TestStatus()
         self.help = Helpers()
+        self.cache = cache
+        # set by enable_result_spool.  When set, add_result and add_test_results write to the spool instead of
+        # posting and a result_spool.SpoolReplayer sends them in the background.
+        self.result_spool = None
+        self.spool_replayer = None
+        # (project_id, suite_id): section_tree.SectionTree.  see section_tree()
+        self._section_trees = {}
+
+    def send_get(self, uri, filepath=None):
+        """
+        APIClient.send_get that goes through self.cache first when one is set.  Attachment downloads are never
+        cached.
+        """
+        if self.cache is None or filepath is not None:
+            return APIClient.send_get(self, uri, filepath)
+        return self.cache.get_or_fetch(uri, lambda: APIClient.send_get(self, uri))
+
+    def send_post(self, uri, data):
+        """
+        APIClient.send_post that drops any cached responses the write makes stale.  They're dropped even if the post
+        fails since testrail may have applied it anyway.
+        """
+        try:
+            return APIClient.send_post(self, uri, data)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate_for_write(uri)
 
     @property
     def get_projects(self):
@@ -315,7 +383,7 @@ class PyTestRail(APIClient):
             untested_count	    int	        The amount of tests in the test run marked as untested
             url	                string	    The address/URL of the test run in the user interface
         """
-        if self.help.check_arg_types("get_run", [[run_id, (str, int)]]):
+        if _check_get_run(run_id):
             run_id_int = self.strip_id(run_id)
             try:
                 response = self.send_get('get_run/{0}'.format(run_id_int))
@@ -332,7 +400,7 @@ class PyTestRail(APIClient):
         :param run_id:
         :return:
         """
-        if self.help.check_arg_types("is_caseId_in_run", [[case_id, (str, int)], [run_id, (str, int)]]):
+        if _check_is_case_in_run(case_id, run_id):
             case_id_int = self.strip_id(case_id)
             run_id_int = self.strip_id(run_id)
             tests_in_run = self.get_tests_in_run(run_id_int)
@@ -352,10 +420,35 @@ class PyTestRail(APIClient):
             raise ValueError('testrun_id: {0} doesn''t exist in testrail.  check the use_testrun_id command and '
                              'make sure a valid run id is there.'.format(run_id))
 
-    def get_runid_for_case_in_plan(self, case_id, plan_id):
-        if self.help.check_arg_types("get_runid_for_case_in_plan", [[case_id, (str, int)], [plan_id, (str, int)]]):
+    def build_plan_index(self, plan_id, workers=8):
+        # type: (str or int, int) -> PlanIndex
+        """
+        downloads the plan and the tests of all its runs (concurrently) and returns a run_index.PlanIndex that
+        answers case -> run and case -> test id lookups without going back to testrail.  Pass it to
+        get_runid_for_case_in_plan when you look up more than one case.
+        :param plan_id: string or integer plan id
+        :param workers: number of runs downloaded at the same time.
+        :return: built run_index.PlanIndex
+        """
+        from .run_index import PlanIndex
+        return PlanIndex(self, plan_id, workers=workers).build()
+
+    def get_runid_for_case_in_plan(self, case_id, plan_id, plan_index=None):
+        """
+        returns the id of the first run in the plan that includes the case, or None.
+        :param case_id: string or integer case id
+        :param plan_id: string or integer plan id
+        :param plan_index: optional. run_index.PlanIndex for plan_id from build_plan_index.  Without one every run in
+            the plan is downloaded on every call.
+        """
+        if _check_get_runid_for_case_in_plan(case_id, plan_id):
             case_id_int = self.strip_id(case_id)
             plan_id_int = self.strip_id(plan_id)
+            if plan_index is not None:
+                if plan_index.plan_id != plan_id_int:
+                    raise ValueError("plan_index is for plan {0}, not plan {1}".format(plan_index.plan_id,
+                                                                                       plan_id_int))
+                return plan_index.run_id_for_case(case_id_int)
             print("before get plan")
             plan_data = self.get_plan(plan_id_int)
             print("after get plan")
@@ -458,6 +551,109 @@ class PyTestRail(APIClient):
         else:
             raise ValueError("length of update run dict is 0.  pass in at least one value to send the update")
 
+    def add_run_chunked(self, project_id, suite_id, name, description, case_ids, milestone_id=None,
+                        assignedto_id=None, chunk_size=RUN_CASE_CHUNK_SIZE):
+        """
+        adds a test run with a selection of cases that's too big for one add_run call.  The run is created with the
+        first chunk_size cases and the rest are added chunk_size at a time with update_run, so no single call makes
+        testrail create more than chunk_size tests.  update_run replaces the run's case list, so each update sends
+        every case id so far.
+
+        case_ids is consumed as it's iterated, so it can be a generator reading ids from a file (see
+        run_generator.read_case_ids) and the first chunk goes out before the rest is read.
+        :type case_ids: Iterable[int]
+        :type chunk_size: int
+        :param case_ids: required.  integer case ids from the suite.  Should already be de-duplicated.
+        :param chunk_size: optional.  max new cases per call.
+        see add_run for the other args.
+        :return: the last add_run/update_run response, same as get_run.  None if a call failed, the error is printed
+            and the run (if it got created) keeps the cases from the calls that worked.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size has to be at least 1.  i got {}".format(chunk_size))
+        selected = []
+        response = None
+        for case_id in case_ids:
+            selected.append(case_id)
+            if len(selected) % chunk_size == 0:
+                response = self._send_run_chunk(response, project_id, suite_id, name, description, selected,
+                                                milestone_id, assignedto_id)
+                if response is None:
+                    return None
+        if response is None or len(selected) % chunk_size:
+            response = self._send_run_chunk(response, project_id, suite_id, name, description, selected,
+                                            milestone_id, assignedto_id)
+        return response
+
+    def get_case_ids_by_status(self, run_id, status_ids):
+        # type: (str or int, List[int]) -> List[int]
+        """
+        returns the case ids of the tests in a run whose current status is one of status_ids.  testrail does the
+        filtering (get_tests with status_id) and the pages are streamed, so only matching tests are downloaded.
+        :param run_id: string or integer id of the test run
+        :param status_ids: list of integer status id's.  see TestStatus.
+        :return: list of integer case ids in the order testrail returns the tests.
+        """
+        return list(self._iter_case_ids_by_status(run_id, status_ids))
+
+    def _iter_case_ids_by_status(self, run_id, status_ids):
+        seen = set()
+        for test in self.iter_tests_in_run(run_id, status_id=list(status_ids)):
+            case_id = test['case_id']
+            if case_id not in seen:
+                seen.add(case_id)
+                yield case_id
+
+    def add_rerun_run(self, source_run_id, status_ids=(TestStatus.FAILED, TestStatus.RETEST, TestStatus.BLOCKED),
+                      name=None, description=None, chunk_size=RUN_CASE_CHUNK_SIZE):
+        """
+        adds a follow up run with the cases of source_run_id whose tests have one of status_ids, e.g. to rerun
+        everything that failed.  The new run is in the same project and suite and has the same milestone as the
+        source run.  The matching case ids are streamed from get_tests into add_run_chunked, the first chunk goes out
+        as soon as it's read.
+        :type source_run_id: str or int
+        :type status_ids: List[int]
+        :type name: str
+        :type description: str
+        :param source_run_id: required.  run to take the cases from.  R prefix is fine.
+        :param status_ids: optional.  integer status id's of the tests to rerun.  defaults to failed, retest and
+                        blocked.
+        :param name: optional.  name of the new run.  defaults to the source run's name with " (rerun)" on the end.
+        :param description: optional.  description of the new run.
+        :param chunk_size: optional.  see add_run_chunked.
+        :return: the add_run_chunked response, same as get_run.  An empty dict if no test had one of status_ids, no
+            run is added then.  None if adding the run failed, the error is printed.
+        """
+        source_run_id = self.strip_id(source_run_id)
+        source_run = self.get_run(source_run_id)
+        if not source_run:
+            raise APIError("couldn't get source run {0}.  See the error printed above.".format(source_run_id))
+        case_ids = self._iter_case_ids_by_status(source_run_id, status_ids)
+        first_case_id = next(case_ids, None)
+        if first_case_id is None:
+            return {}
+        if name is None:
+            name = '{0} (rerun)'.format(source_run['name'])
+        if description is None:
+            description = 'Rerun of the tests in R{0} with status {1}.'.format(
+                source_run_id, ', '.join(str(status_id) for status_id in status_ids))
+        return self.add_run_chunked(source_run['project_id'], source_run['suite_id'], name, description,
+                                    itertools.chain([first_case_id], case_ids),
+                                    milestone_id=source_run.get('milestone_id'), chunk_size=chunk_size)
+
+    def _send_run_chunk(self, response, project_id, suite_id, name, description, selected, milestone_id,
+                        assignedto_id):
+        # add_run for the first chunk, update_run with everything so far for the rest
+        if response is None:
+            return self.add_run(project_id, suite_id, name, description, include_all_cases=False,
+                                case_ids=list(selected), milestone_id=milestone_id, assignedto_id=assignedto_id)
+        # straight to send_post, update_run would print the whole case list
+        try:
+            return self.send_post('update_run/{0}'.format(response['id']),
+                                  {'include_all': False, 'case_ids': selected})
+        except APIError as error:
+            print(error)
+
     def close_run(self, run_id):
         """
         Closes a test run with a given run id and archives its tests and results.  This is irreversable so
@@ -537,7 +733,7 @@ class PyTestRail(APIClient):
             "type_id": 4
         }
         """
-        if self.help.check_arg_types("get_test", [[test_id, (str, int)]]):
+        if _check_get_test(test_id):
             test_id_int = self.strip_id(test_id)
             try:
                 response = self.send_get('get_test/{0}'.format(test_id_int))
@@ -546,17 +742,28 @@ class PyTestRail(APIClient):
             else:
                 return response
 
-    def get_tests_in_run(self, run_id):
-        # type: (str or int) -> List[dict]
+    def get_tests_in_run(self, run_id, limit=None, offset=None, status_id=None):
+        # type: (str or int, int, int, List[int]) -> List[dict]
         """
         returns a list dict's for all tests in a run.  The dict format is the same as the get_test response dict.
         :param run_id: string or integer id of the test run
+        :param limit: optional.  limit the number of tests to this number.  testrail 6.7+ only.
+        :param offset: optional.  skip this many tests.  testrail 6.7+ only.  see iter_tests_in_run.
+        :param status_id: optional.  list of integer status id's.  Only tests whose current status is one of them are
+                        returned.  see TestStatus.
         :return: list of get_test response dicts.  see the get_test method documentation for info.
         """
-        if self.help.check_arg_types("get_tests", [[run_id, (str, int)]]):
+        if _check_get_tests(run_id):
             run_id_int = self.strip_id(run_id)
+            command = 'get_tests/{0}'.format(run_id_int)
+            if limit is not None:
+                command = self.add_argument(command, 'limit={0}'.format(limit))
+            if offset is not None:
+                command = self.add_argument(command, 'offset={0}'.format(offset))
+            if status_id is not None:
+                command = self.add_argument(command, 'status_id={0}'.format(','.join(str(x) for x in status_id)))
             try:
-                response = self.send_get('get_tests/{0}'.format(run_id_int))
+                response = self.send_get(command)
             except APIError as error:
                 print(error)
             else:
@@ -758,7 +965,7 @@ class PyTestRail(APIClient):
                 ..
             }
         :return: same return type as get_results.  The only difference is it's a single dict result instead of a
-                list of dict results.
+                list of dict results.  If enable_result_spool was called it's {'spooled': [record id]} instead.
         """
 
         # add required args
@@ -777,6 +984,8 @@ class PyTestRail(APIClient):
         if custom_fields_dict is not None:
             result_data.update(custom_fields_dict)
 
+        if self.result_spool is not None:
+            return {'spooled': [self.result_spool.append('tests', 'add_result/{0}'.format(test_id), result_data)]}
         try:
             response = self.send_post('add_result/{0}'.format(test_id), result_data)
         except APIError as error:
@@ -784,15 +993,93 @@ class PyTestRail(APIClient):
         else:
             return response
 
-    def add_test_results(self, run_id, list_of_result_dicts):
+    def add_attachment_to_result(self, result_id, file_path):
         """
-        bulk add function.  Used to update multiple test cases in a run with one call.
+        uploads a file and attaches it to a test result.
+        :type result_id: int
+        :type file_path: str
+        :param result_id: required. integer id of the result, the 'id' key of an add_result(s) response.
+        :param file_path: required. path of the file to upload.
+        :return: dict with the attachment_id of the new attachment.
+        """
+        try:
+            response = self.send_post('add_attachment_to_result/{0}'.format(result_id), file_path)
+        except APIError as error:
+            print(error)
+        else:
+            return response
+
+    def enable_result_spool(self, spool_dir, replay_interval=5.0, fsync_every=50, fsync_interval=1.0):
+        """
+        turns on the write-ahead result spool.  From here on add_result and add_test_results append the results to
+        files in spool_dir and return right away with {'spooled': [record ids]} instead of testrail's response.
+        A background result_spool.SpoolReplayer sends them to testrail every replay_interval seconds.  Anything
+        left in spool_dir by a process that's no longer running is sent too.  Processes running at the same time can
+        share a spool_dir, each one only sends its own results.
+        :type spool_dir: str
+        :type replay_interval: float
+        :type fsync_every: int
+        :type fsync_interval: float
+        :param spool_dir: directory for the spool files.
+        :param replay_interval: seconds between background sends.
+        :param fsync_every: see result_spool.ResultSpool
+        :param fsync_interval: see result_spool.ResultSpool
+        :return: the result_spool.SpoolReplayer.  Call disable_result_spool (or its stop) to send what's left.
+        """
+        from .result_spool import ResultSpool, SpoolReplayer
+        if self.result_spool is None:
+            self.result_spool = ResultSpool(spool_dir, fsync_every=fsync_every, fsync_interval=fsync_interval)
+            self.spool_replayer = SpoolReplayer(self, self.result_spool, interval=replay_interval)
+            self.spool_replayer.start()
+        return self.spool_replayer
+
+    def disable_result_spool(self):
+        """
+        turns the result spool back off, after one last try at sending everything in it.
+        :return: number of spooled records that couldn't be sent.  They stay on disk for the next
+            enable_result_spool or SpoolReplayer on the same spool_dir.
+        """
+        if self.result_spool is None:
+            return 0
+        spool, replayer = self.result_spool, self.spool_replayer
+        self.result_spool = None
+        self.spool_replayer = None
+        replayer.stop(drain=False)
+        spool.close()
+        still_pending = replayer.drain()
+        spool.release()
+        return still_pending
+
+    def add_test_results(self, run_id, list_of_result_dicts, max_chunk_results=250, max_chunk_bytes=2097152,
+                         workers=4, retries=2, failed_results=None):
+        """
+        bulk add function.  Used to update multiple test cases in a run with one call.  Big result lists are split
+        into chunks of at most max_chunk_results results and max_chunk_bytes of json, and the chunks are uploaded
+        concurrently.  Chunks that share a test/case id are still sent in order, one after the other, so later
+        results for a test land after earlier ones.  A chunk that fails is retried on its own up to retries times, but
+        only when testrail can't have added it: no connection could be made, or testrail answered 429 or 503.  Any
+        other failure (like a read timeout) might have added the results already, so the chunk isn't sent again.
         :type run_id: int
         :type list_of_result_dicts: list
+        :type max_chunk_results: int
+        :type max_chunk_bytes: int
+        :type workers: int
+        :type retries: int
+        :type failed_results: list
         :param run_id: id of the run you want to update
         :param list_of_result_dicts: list of properly formatted result dict's.  Use result_builder to build the result
             dict's.
-        :return:
+        :param max_chunk_results: optional. max number of results sent in one request.
+        :param max_chunk_bytes: optional. max json size of one request.  A single result bigger than this is sent on
+            its own.
+        :param workers: optional. max number of chunks uploaded at the same time.
+        :param retries: optional. number of times a chunk that never reached testrail is retried.
+        :param failed_results: optional. list the result dicts that weren't added get appended to, so callers can
+            tell which ones are missing when only part of a chunked upload made it.
+        :return: testrail's response, a list of the added results.  When the upload was chunked it's the responses
+            of the chunks merged in the original order.  If some chunks still failed after their retries the error is
+            printed and the merged response only has the results that made it.  None if nothing made it.  If
+            enable_result_spool was called it's {'spooled': [record ids]} instead.
 
         test_id example for list_of_result_dicts (expanded for readability):
         [
@@ -872,21 +1159,130 @@ class PyTestRail(APIClient):
                                  'result dicts in the results list of dicts.  list of test/case id keys found: {0}'
                                  .format(result_types))
             else:
-                result_data = {'results': list_of_result_dicts}
-                try:
-                    if result_type == 'test_id':
-                        print('sending add_results')
-                        response = self.send_post('add_results/{0}'.format(run_id), result_data)
-                    elif result_type == 'case_id':
-                        logging.debug('sending add_results_for_case \r\n {}'.format(result_data))
-                        response = self.send_post('add_results_for_cases/{0}'.format(run_id), result_data)
-                except APIError as error:
-                    print(error)
+                chunks = self._chunk_results(list_of_result_dicts, max_chunk_results, max_chunk_bytes)
+                if self.result_spool is not None:
+                    # one record per chunk so every replayed post stays under the size limits
+                    command = 'add_results/{0}' if result_type == 'test_id' else 'add_results_for_cases/{0}'
+                    key = self.result_spool.run_key(run_id)
+                    return {'spooled': [self.result_spool.append(key, command.format(run_id), {'results': chunk})
+                                        for chunk in chunks]}
+                if len(chunks) == 1:
+                    result_data = {'results': list_of_result_dicts}
+                    try:
+                        if result_type == 'test_id':
+                            print('sending add_results')
+                            response = self.send_post('add_results/{0}'.format(run_id), result_data)
+                        elif result_type == 'case_id':
+                            logging.debug('sending add_results_for_case \r\n {}'.format(result_data))
+                            response = self.send_post('add_results_for_cases/{0}'.format(run_id), result_data)
+                    except APIError as error:
+                        print(error)
+                        if failed_results is not None:
+                            failed_results.extend(list_of_result_dicts)
+                    else:
+                        return response
                 else:
-                    return response
+                    response, not_added, errors = self._upload_result_chunks(run_id, result_type, chunks, workers,
+                                                                             retries)
+                    for error in errors:
+                        print(error)
+                    if not_added:
+                        print('{0} of {1} results for run {2} were not added.'
+                              .format(len(not_added), len(list_of_result_dicts), run_id))
+                        if failed_results is not None:
+                            failed_results.extend(not_added)
+                    if response:
+                        return response
         else:
             raise ValueError("list_of_result_dicts is empty.  I require all the datas...resistance is futile")
 
+    @staticmethod
+    def _chunk_results(list_of_result_dicts, max_chunk_results, max_chunk_bytes):
+        # type: (List[Dict], int, int) -> List[List[Dict]]
+        """
+        splits results into consecutive chunks bounded by count and by json encoded size.
+        """
+        if max_chunk_results < 1:
+            raise ValueError("max_chunk_results has to be at least 1.  I got: {0}".format(max_chunk_results))
+        chunks = []
+        chunk = []
+        chunk_bytes = 0
+        for result in list_of_result_dicts:
+            # + 2 for the ', ' separator json.dumps puts between list items
+            result_bytes = len(json.dumps(result).encode('utf-8')) + 2
+            if chunk and (len(chunk) >= max_chunk_results or chunk_bytes + result_bytes > max_chunk_bytes):
+                chunks.append(chunk)
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(result)
+            chunk_bytes += result_bytes
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _upload_result_chunks(self, run_id, result_type, chunks, workers, retries):
+        # type: (int, str, List[List[Dict]], int, int) -> (List[Dict], List[Dict], List[str])
+        """
+        uploads result chunks concurrently.  Chunks that share a test/case id are chained and sent one after the
+        other in their original order.  Independent chains run in parallel.  When a chunk fails all its retries the
+        rest of its chain is not sent, since that would put those results ahead of the failed ones.
+        :return: tuple of (merged responses in chunk order, results that weren't added, error strings)
+        """
+        command = 'add_results/{0}' if result_type == 'test_id' else 'add_results_for_cases/{0}'
+        command = command.format(run_id)
+
+        # union-find chunks that touch the same id into chains
+        parents = list(range(len(chunks)))
+
+        def find(index):
+            while parents[index] != index:
+                parents[index] = parents[parents[index]]
+                index = parents[index]
+            return index
+
+        first_chunk_for_id = {}
+        for index, chunk in enumerate(chunks):
+            for result in chunk:
+                other = first_chunk_for_id.setdefault(result[result_type], index)
+                if other != index:
+                    parents[find(index)] = find(other)
+        chains = {}
+        for index in range(len(chunks)):
+            chains.setdefault(find(index), []).append(index)
+
+        responses = [None] * len(chunks)
+        errors = []
+
+        def send_chain(chunk_indexes):
+            for position, index in enumerate(chunk_indexes):
+                for attempt in range(retries + 1):
+                    try:
+                        responses[index] = self.send_post(command, {'results': chunks[index]})
+                        break
+                    except APIError as error:
+                        # add_results isn't idempotent, so only resend what testrail provably didn't add
+                        if attempt == retries or (error.request_sent and error.status_code not in (429, 503)):
+                            errors.append('chunk {0} ({1} results) failed after {2} attempts: {3}'
+                                          .format(index, len(chunks[index]), attempt + 1, error))
+                            if position + 1 < len(chunk_indexes):
+                                errors.append('skipped chunks {0} for run {1} to keep result order'
+                                              .format(chunk_indexes[position + 1:], run_id))
+                            return
+                        time.sleep(0.5 * 2 ** attempt)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chains)))) as pool:
+            for future in [pool.submit(send_chain, chain) for chain in chains.values()]:
+                future.result()
+
+        merged = []
+        failed_results = []
+        for index, response in enumerate(responses):
+            if response is None:
+                failed_results.extend(chunks[index])
+            elif isinstance(response, list):
+                merged.extend(response)
+        return merged, failed_results, errors
+
     @staticmethod
     def result_builder(test_id, status_id, comment=None, version=None, elapsed=None, defects=None,
                        assignedto_id=None, custom_fields_dict=None, by_case=True):
@@ -983,7 +1379,7 @@ class PyTestRail(APIClient):
             updated_by	        int	        The ID of the user who last updated the test case
             updated_on	        timestamp	The date/time when the test case was last updated (as UNIX timestamp)
         """
-        if self.help.check_arg_types("get_test", [[case_id, (str, int)]]):
+        if _check_get_test(case_id):
             case_id_int = self.strip_id(case_id)
             try:
                 response = self.send_get('get_case/{0}'.format(case_id_int))
@@ -1005,7 +1401,7 @@ class PyTestRail(APIClient):
             {u'content': u'Halogen MLV - Torrodial', u'expected': u''},
             {u'content': u'Halogen ELV', u'expected': u''}]
         """
-        if self.help.check_arg_types("get_case_steps", [[case_id, (str, int)], [list_of_case_dicts, (list, None)]]):
+        if _check_get_case_steps(case_id, list_of_case_dicts):
             case_id_int = self.strip_id(case_id)
             # if populated then search in list_of_case_dicts for the case.  If not, ping testrail for the case data
             if list_of_case_dicts:
@@ -1247,16 +1643,12 @@ class PyTestRail(APIClient):
         :param project_id:
         :param suite_id:
         :param tag_ids:
-        :return:
+        :return: list of the ids of the cases that have at least one of tag_ids.  For more than one query on the same
+            suite build a tag_index.TagIndex once and use it instead.
         """
-        cases_list = []
-        cases = self.get_cases(project_id, suite_id)
-        print(len(cases))
-        for case in cases:
-            if any(elem in case['custom_tags'] for elem in tag_ids):
-                cases_list.append(case['id'])
-        # convert to a set to remove any possible duplicates, then convert back to a list for return.
-        return list(set(cases_list))
+        from .tag_index import TagIndex
+        tag_index = TagIndex(self.iter_cases(project_id, suite_id))
+        return tag_index.case_ids(tag_index.any_of(tag_ids))
 
     # Sections api
     def get_section(self, section_id):
@@ -1283,17 +1675,26 @@ class PyTestRail(APIClient):
         else:
             return response
 
-    def get_sections(self, project_id, suite_id):
+    def get_sections(self, project_id, suite_id, limit=None, offset=None):
         """
         returns a list of get_section responses for each section in a suite.
         :type project_id: int
         :type suite_id: int
+        :type limit: int
+        :type offset: int
         :param project_id:
         :param suite_id:
+        :param limit: optional.  limit the number of sections to this number.  testrail 6.7+ only.
+        :param offset: optional.  skip this many sections.  testrail 6.7+ only.  see iter_sections.
         :return: list of get_section dict's for each section in the suite
         """
+        command = 'get_sections/{0}&suite_id={1}'.format(project_id, suite_id)
+        if limit is not None:
+            command = self.add_argument(command, 'limit={0}'.format(limit))
+        if offset is not None:
+            command = self.add_argument(command, 'offset={0}'.format(offset))
         try:
-            response = self.send_get('get_sections/{0}&suite_id={1}'.format(project_id, suite_id))
+            response = self.send_get(command)
         except APIError as error:
             print(error)
         else:
@@ -1332,6 +1733,9 @@ class PyTestRail(APIClient):
         except APIError as error:
             print(error)
         else:
+            section_tree = self._section_trees.get((self.strip_id(project_id), self.strip_id(suite_id)))
+            if section_tree is not None and response:
+                section_tree.add(response)
             return response
 
     def add_nested_sections(self, project_id, suite_id, section_name_list):
@@ -1345,26 +1749,46 @@ class PyTestRail(APIClient):
         it adds it.  the function would return the integer id of the section named "third" in this example.
         :param project_id: required. integer ID for the project you're working with.
         :param suite_id: required. integer ID for the suite within project_id you're working with.
+        The suite's sections are looked up in section_tree(project_id, suite_id), so they're only downloaded on the
+        first call for a suite.  Use ensure_section_paths to add a lot of paths at once.
         :param section_name_list: list of string section names that you want to add if they dont exist
         :return: integer id for the last section in section_name_list
         """
-        current_sections = self.get_sections(project_id, suite_id)
-        current_parent = None
-        for depth, section_name in enumerate(section_name_list):
-            # depth is the index of the section name in section_name_list
-            matching_section = self.find_matching_section(current_sections, section_name, current_parent, depth)
-            if len(matching_section) > 0:
-                # section found, set current parent to this sections id.
-                current_parent = matching_section['id']
-            else:
-                # section not found, add it
-                # print('section name: {0} with parent: {1} at depth: {2} not found.  Adding it'
-                #     .format(section_name, current_parent, depth))
-                response = self.add_section(project_id, suite_id, section_name, current_parent)
-                current_parent = response['id']
-                # append the add response to current_sections so we dont have to get that again
-                current_sections.append(response)
-        return current_parent
+        return self.section_tree(project_id, suite_id).ensure_path(section_name_list)
+
+    def ensure_section_paths(self, project_id, suite_id, list_of_paths, workers=8):
+        # type: (int, int, List[List[str]], int) -> List[int]
+        """
+        add_nested_sections for many paths at once.  Missing sections are added one level at a time with the
+        sections at the same level added concurrently.  see section_tree.SectionTree.ensure_paths.
+        :param project_id: required. integer ID for the project you're working with.
+        :param suite_id: required. integer ID for the suite within project_id you're working with.
+        :param list_of_paths: list of section_name_list's.  see add_nested_sections.
+        :param workers: optional. max number of add_section calls at the same time.  Keep it at or below the
+            pool_maxsize the PyTestRail object was created with.
+        :return: list with the integer id of the last section of each path, in list_of_paths order.
+        """
+        return self.section_tree(project_id, suite_id).ensure_paths(list_of_paths, workers=workers)
+
+    def section_tree(self, project_id, suite_id, refresh=False):
+        """
+        returns the (parent_id, name) index of a suite's sections, building it the first time it's asked for.  The
+        same tree is returned on later calls, and sections added with add_section are added to it.
+        :type project_id: int
+        :type suite_id: int
+        :type refresh: bool
+        :param refresh: optional. True to download the sections again, e.g. after they were changed outside this
+            PyTestRail object.
+        :return: section_tree.SectionTree
+        """
+        from .section_tree import SectionTree
+        key = (self.strip_id(project_id), self.strip_id(suite_id))
+        section_tree = self._section_trees.get(key)
+        if section_tree is None:
+            section_tree = self._section_trees.setdefault(key, SectionTree(self, key[0], key[1]))
+        elif refresh:
+            section_tree.refresh()
+        return section_tree
 
     def update_section(self, section_id, name=None, description=None):
         # type: (int, str, str) -> Dict
@@ -1388,6 +1812,8 @@ class PyTestRail(APIClient):
             except APIError as error:
                 print(error)
             else:
+                # a renamed section is under the wrong key in the section trees now
+                self._section_trees.clear()
                 return response
         else:
             raise ValueError('name and/or description args to update_section werent passed in.  1 or both have to '
@@ -1409,10 +1835,16 @@ class PyTestRail(APIClient):
         except APIError as error:
             print(error)
         else:
+            # the section and everything under it is gone
+            self._section_trees.clear()
             return response
 
     @staticmethod
     def find_matching_section(sections_list, name, parent_id, depth):
+        # sections_list can also be a section_tree.SectionTree, which finds the section without a search.  depth
+        # follows from parent_id so the tree doesn't need it.
+        if not isinstance(sections_list, list):
+            return sections_list.find(name, parent_id) or {}
         list_of_match_dicts = []
         for i, section in enumerate(sections_list):
             if section['name'] == name and section['parent_id'] == parent_id and section['depth'] == depth:
@@ -1558,7 +1990,7 @@ class PyTestRail(APIClient):
         }
 
         """
-        if self.help.check_arg_types('get_plan', [[plan_id, (str, int)]]):
+        if _check_get_plan(plan_id):
             plan_id_int = self.strip_id(plan_id)
             try:
                 response = self.send_get('get_plan/{0}'.format(plan_id_int))
@@ -1567,16 +1999,24 @@ class PyTestRail(APIClient):
             else:
                 return response
 
-    def get_plans(self, project_id):
-        # type: (int) -> List[Dict]
+    def get_plans(self, project_id, limit=None, offset=None):
+        # type: (int, int, int) -> List[Dict]
         """
-        returns get_plan data for every test plan in a given project.
+        returns get_plan data for every test plan in a given project.  Max of 250 plans per call, use offset or
+        iter_plans to get the rest.
         :param project_id: Required. integer ID for the project you want plans data from
+        :param limit: Optional.  Limit the result to :limit number of test plans.
+        :param offset: Optional.  Skip the first :offset number of records.
         :return: list of get_plan response dictionaries.  See the get_plan method's return data for details.
         """
-        if self.help.check_arg_types('get_plans', [[project_id, int]]):
+        if _check_get_plans(project_id, limit, offset):
+            command = 'get_plans/{0}'.format(project_id)
+            if limit is not None:
+                command = self.add_argument(command, 'limit={0}'.format(limit))
+            if offset is not None:
+                command = self.add_argument(command, 'offset={0}'.format(offset))
             try:
-                response = self.send_get('get_plans/{0}'.format(project_id))
+                response = self.send_get(command)
             except APIError as error:
                 print(error)
             else:
@@ -1601,8 +2041,7 @@ class PyTestRail(APIClient):
         :return: dict with header level info on the new plan created as well as get_run type data for any test
             run created using list_of_entry_dicts.  return type is the same as get_plan.  see that for details.
         """
-        if self.help.check_arg_types('add_plan', [[name, str], [description, str], [project_id, int]
-            , [list_of_entry_dicts, list], [milestone_id, int]]):
+        if _check_add_plan(name, description, project_id, list_of_entry_dicts, milestone_id):
             # add required args first
             plan_data = {
                 'name': name
@@ -1630,14 +2069,28 @@ class PyTestRail(APIClient):
             format as the entries field of get_plan, but for a single entry instead of a list of entries.
 
         """
-        if self.help.check_arg_types('add_plan_entry', [[plan_id, int], [plan_entry_dict, dict]]):
+        if _check_add_plan_entry(plan_id, plan_entry_dict):
             try:
-                response = self.send_post('add_plan/{0}'.format(plan_id), plan_entry_dict)
+                response = self.send_post('add_plan_entry/{0}'.format(plan_id), plan_entry_dict)
             except APIError as error:
                 print(error)
             else:
                 return response
 
+    def delete_plan(self, plan_id):
+        """
+        Deletes a test plan of a given id along with all of its runs and their results.  It is irreversable.
+        :type plan_id: int
+        :param plan_id: plan id you want to delete
+        :return:
+        """
+        try:
+            response = self.send_post('delete_plan/{0}'.format(plan_id), {})
+        except APIError as error:
+            print(error)
+        else:
+            return response
+
     def plan_entry_builder(self, suite_id  # type: int
                            , name  # type: str
                            , description  # type: str
@@ -1695,9 +2148,8 @@ class PyTestRail(APIClient):
             config_ids = []
         if case_ids is None:
             case_ids = []
-        if self.help.check_arg_types('plan_entry_builder', [[suite_id, int], [name, str], [description, str]
-            , [assignedto_id, int], [case_ids, list], [config_ids, list]
-            , [runs_list_of_dicts, list]]):
+        if _check_plan_entry_builder(suite_id, name, description, assignedto_id, case_ids, config_ids,
+                                     runs_list_of_dicts):
             # add required args first
             entry_data = {
                 'suite_id': suite_id
@@ -1791,8 +2243,7 @@ class PyTestRail(APIClient):
         """
         if config_ids is None:
             config_ids = []
-        if self.help.check_arg_types('entry_run_builder', [[case_ids, list], [name, str], [description, str]
-            , [assignedto_id, int], [config_ids, list]]):
+        if _check_entry_run_builder(case_ids, name, description, assignedto_id, config_ids):
             run_dict = {
                 "case_ids": case_ids,
                 "include_all": False
@@ -1811,11 +2262,219 @@ class PyTestRail(APIClient):
 
     def get_name_from_suite(self, suite_id):
         # type: (int) -> str
-        self.help.check_arg_types('get_name_from_suite', [[suite_id, int]])
+        _check_get_name_from_suite(suite_id)
         suite_data = self.get_suite(suite_id)
         name = suite_data['name']
         return name
 
+    def iter_runs(self, project_id, page_size=PAGE_SIZE, **filters):
+        # type: (int, int, ...) -> Iterator[Dict]
+        """
+        same as get_runs but follows the offset for you and yields every matching run, not just the first 250.
+        :param project_id: Required. project id you want to retrieve test run data from.
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :param filters: any of the optional get_runs args except limit and offset.
+        :return: generator of get_run dicts.
+        """
+        return self._iter_pages(lambda limit, offset: self.get_runs(project_id, limit=limit, offset=offset, **filters)
+                                , 'runs', page_size)
+
+    def iter_sections(self, project_id, suite_id, page_size=PAGE_SIZE):
+        # type: (int, int, int) -> Iterator[Dict]
+        """
+        same as get_sections but follows the offset for you and yields every section in the suite.
+        :param project_id: Required. id of the project
+        :param suite_id: Required. id of the test suite
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :return: generator of get_section dicts.
+        """
+        return self._iter_pages(lambda limit, offset: self.get_sections(project_id, suite_id, limit=limit
+                                                                        , offset=offset)
+                                , 'sections', page_size)
+
+    def iter_cases(self, project_id, suite_id, page_size=PAGE_SIZE, **filters):
+        # type: (int, int, int, ...) -> Iterator[Dict]
+        """
+        same as get_cases but follows the offset for you and yields every matching case, not just the first 250.
+        :param project_id: Required. id of the project
+        :param suite_id: Required. id of the test suite
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :param filters: any of the optional get_cases args except limit and offset.
+        :return: generator of get_case dicts.
+        """
+        return self._iter_pages(lambda limit, offset: self.get_cases(project_id, suite_id, limit=limit, offset=offset
+                                                                     , **filters)
+                                , 'cases', page_size)
+
+    def iter_tests_in_run(self, run_id, page_size=PAGE_SIZE, status_id=None):
+        # type: (str or int, int, List[int]) -> Iterator[Dict]
+        """
+        same as get_tests_in_run but follows the offset for you and yields every matching test.
+        :param run_id: Required. id of the test run
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :param status_id: Optional. list of integer status id's to filter on.
+        :return: generator of get_test dicts.
+        """
+        return self._iter_pages(lambda limit, offset: self.get_tests_in_run(run_id, limit=limit, offset=offset
+                                                                            , status_id=status_id)
+                                , 'tests', page_size)
+
+    def iter_results_for_run(self, run_id, page_size=PAGE_SIZE, **filters):
+        # type: (int, int, ...) -> Iterator[Dict]
+        """
+        same as get_results_for_run but follows the offset for you and yields every matching result.
+        :param run_id: Required. id of the test run
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :param filters: any of the optional get_results_for_run args except limit and offset.
+        :return: generator of result dicts.  See get_results for the format.
+        """
+        return self._iter_pages(lambda limit, offset: self.get_results_for_run(run_id, limit=limit, offset=offset
+                                                                               , **filters)
+                                , 'results', page_size)
+
+    def iter_results_for_case(self, run_id, case_id, page_size=PAGE_SIZE, status_id=None):
+        # type: (int, int, int, List[int]) -> Iterator[Dict]
+        """
+        same as get_results_for_case but follows the offset for you and yields every matching result.
+        :param run_id: Required. id of the test run
+        :param case_id: Required. id of the test case
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :param status_id: Optional. list of integer status id's to filter on.
+        :return: generator of result dicts.  See get_results for the format.
+        """
+        return self._iter_pages(lambda limit, offset: self.get_results_for_case(run_id, case_id, limit=limit
+                                                                                , offset=offset, status_id=status_id)
+                                , 'results', page_size)
+
+    def iter_plans(self, project_id, page_size=PAGE_SIZE):
+        # type: (int, int) -> Iterator[Dict]
+        """
+        same as get_plans but follows the offset for you and yields every plan in the project.
+        :param project_id: Required. integer ID for the project you want plans data from
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :return: generator of plan dicts.  See get_plans for the format.
+        """
+        return self._iter_pages(lambda limit, offset: self.get_plans(project_id, limit=limit, offset=offset)
+                                , 'plans', page_size)
+
+    def get_all_cases(self, project_id, suite_id, workers=8, page_size=PAGE_SIZE, **filters):
+        # type: (int, int, int, int, ...) -> List[Dict]
+        """
+        gets every matching case in a suite by downloading the pages concurrently.  Much faster than iter_cases for
+        big suites but the whole result is held in memory.  Cases come back in the same order testrail returns them.
+        :param project_id: Required. id of the project
+        :param suite_id: Required. id of the test suite
+        :param workers: Optional. number of pages to download at the same time.  Keep it at or below the
+            pool_maxsize the PyTestRail object was created with.
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :param filters: any of the optional get_cases args except limit and offset.
+        :return: list of get_case dicts.
+        """
+        return self._fetch_pages_parallel(lambda limit, offset: self.get_cases(project_id, suite_id, limit=limit
+                                                                               , offset=offset, **filters)
+                                          , 'cases', page_size, workers)
+
+    def get_all_results_for_run(self, run_id, workers=8, page_size=PAGE_SIZE, **filters):
+        # type: (int, int, int, ...) -> List[Dict]
+        """
+        gets every matching result in a run by downloading the pages concurrently.  See get_all_cases.
+        :param run_id: Required. id of the test run
+        :param workers: Optional. number of pages to download at the same time.
+        :param page_size: Optional. records per request.  250 is the most testrail allows.
+        :param filters: any of the optional get_results_for_run args except limit and offset.
+        :return: list of result dicts.  See get_results for the format.
+        """
+        return self._fetch_pages_parallel(lambda limit, offset: self.get_results_for_run(run_id, limit=limit
+                                                                                         , offset=offset, **filters)
+                                          , 'results', page_size, workers)
+
+    def _fetch_pages_parallel(self, get_page, records_key, page_size, workers):
+        """
+        downloads every page of a list endpoint over a pool of worker threads and returns the records merged in
+        offset order.  testrail doesn't tell us the total up front so this keeps `workers` pages in flight at
+        offsets 0, page_size, 2*page_size, ... and stops handing out new offsets as soon as a page comes back
+        short (the last page).  At most workers - 1 requests are wasted past the end.
+        :param get_page: function(limit, offset) that returns one page of the endpoint's response
+        :param records_key: see _iter_pages
+        :param page_size: number of records per page.
+        :param workers: max number of pages being downloaded at the same time.
+        """
+        if not 0 < page_size <= PAGE_SIZE:
+            raise ValueError("page_size has to be between 1 and {0}.  I got: {1}".format(PAGE_SIZE, page_size))
+        if workers < 1:
+            raise ValueError("workers has to be at least 1.  I got: {0}".format(workers))
+        pages = {}
+        last_offset = None
+        next_offset = 0
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                while True:
+                    # keep the pool full until we know where the last page is
+                    while last_offset is None and len(in_flight) < workers:
+                        in_flight[pool.submit(get_page, page_size, next_offset)] = next_offset
+                        next_offset += page_size
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        offset = in_flight.pop(future)
+                        records, has_more = self._unwrap_page(future.result(), records_key, page_size, offset)
+                        if has_more and len(records) != page_size:
+                            raise APIError("testrail returned {0} records at offset {1} when {2} were asked for.  "
+                                           "Lower page_size to what the server allows."
+                                           .format(len(records), offset, page_size))
+                        pages[offset] = records
+                        if not has_more and (last_offset is None or offset < last_offset):
+                            last_offset = offset
+            except BaseException:
+                for future in in_flight:
+                    future.cancel()
+                raise
+        return [record for offset in sorted(pages) if offset <= last_offset for record in pages[offset]]
+
+    def _iter_pages(self, get_page, records_key, page_size):
+        """
+        generator that walks a paginated list endpoint.  While the caller works through one page the next one is
+        already being downloaded on a background thread, so only two pages are ever held in memory.
+        :param get_page: function(limit, offset) that returns one page of the endpoint's response
+        :param records_key: key the records are under when testrail returns a paginated dict (testrail 6.7+) instead
+            of a plain list.  e.g. 'cases' for get_cases.
+        :param page_size: number of records to ask for per page.
+        """
+        if not 0 < page_size <= PAGE_SIZE:
+            raise ValueError("page_size has to be between 1 and {0}.  I got: {1}".format(PAGE_SIZE, page_size))
+        prefetcher = ThreadPoolExecutor(max_workers=1)
+        try:
+            offset = 0
+            next_page = prefetcher.submit(get_page, page_size, offset)
+            while next_page is not None:
+                records, has_more = self._unwrap_page(next_page.result(), records_key, page_size, offset)
+                offset += len(records)
+                next_page = prefetcher.submit(get_page, page_size, offset) if has_more else None
+                for record in records:
+                    yield record
+        finally:
+            prefetcher.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _unwrap_page(response, records_key, page_size, offset):
+        # type: (list or dict, str, int, int) -> (list, bool)
+        """
+        pulls the records out of one page of a list endpoint and works out if there's another page after it.
+        :return: tuple of (list of records, bool True if there are more pages)
+        """
+        if response is None:
+            # the get_ method already printed the APIError.  Raise here so a failed page doesn't quietly end the
+            # iteration early and leave the caller with a partial list.
+            raise APIError("couldn't get the page at offset {0} for {1}.  See the error printed above."
+                           .format(offset, records_key))
+        if isinstance(response, dict):
+            records = response.get(records_key, [])
+            links = response.get('_links') or {}
+            return records, bool(links.get('next')) and len(records) > 0
+        return response, len(response) >= page_size
+
     def placeholder(self):
         # pycharm keeps hosing indenting if you add a function at the bottom.  If i add them above this it works
         # fine.  That's the only function for this.
@@ -0,0 +1,148 @@
+import gzip
+import os
+import tempfile
+from collections import deque
+from typing import List, Tuple
+
+COUNTS_HEADER = 'PASS: {0}\r\n' \
+                'WARNING: {1}\r\n' \
+                'FAIL: {2}\r\n' \
+                'ERROR: {3}\r\n\r\n' \
+                'Details:\r\n'
+
+
+class CommentRenderer:
+    """
+    Renders TestRun result comments with a size budget.  The comment keeps the PASS/WARNING/FAIL/ERROR counts and
+    the first head_lines and last tail_lines of every section.  If anything had to be cut, the complete comment (the
+    same text TestRun.format_result_comment builds) is streamed into a gzip file that's uploaded as an attachment of
+    the result, so what goes in add_test_results stays about the same size however much a test logs.
+
+    Set it on a run with test_run.comment_renderer = CommentRenderer(...).  submit_result uploads the attachment
+    after testrail creates the result and deletes the local file once it's uploaded.
+    """
+
+    def __init__(self, head_lines=100, tail_lines=100, max_chars=65536, overflow_dir=None):
+        # type: (int, int, int, str) -> None
+        """
+        :param head_lines: number of lines kept from the start of each section.
+        :param tail_lines: number of lines kept from the end of each section.
+        :param max_chars: hard limit for the inline comment.  Long lines can still push head + tail past it, in
+            which case the comment is cut at max_chars.
+        :param overflow_dir: optional. directory for the gzip files.  Defaults to the system temp directory.
+        """
+        if max_chars < 200:
+            raise ValueError("max_chars has to be at least 200.  I got: {}".format(max_chars))
+        self.head_lines = head_lines
+        self.tail_lines = tail_lines
+        self.max_chars = max_chars
+        self.overflow_dir = overflow_dir
+
+    @staticmethod
+    def sections(finished_testcase, result_type):
+        # type: (object, str) -> List[Tuple[str, object]]
+        """
+        :return: the comment as a list of (text, lines) pairs.  The full comment is every text followed by its lines
+            joined with newlines.
+        """
+        results = finished_testcase.results
+        header = COUNTS_HEADER.format(finished_testcase.PASS, finished_testcase.WARNING, finished_testcase.FAIL,
+                                      finished_testcase.ERROR)
+        if result_type.upper() == 'GROUPED':
+            return [(header + 'Passed:\r\n', results['pass']),
+                    ('\r\n\r\nWarnings:\r\n', results['warning']),
+                    ('\r\n\r\nFailed:\r\n', results['fail']),
+                    ('\r\n\r\nErrors:\r\n', results['error'])]
+        return [(header, results['all'])]
+
+    def render(self, finished_testcase, result_type):
+        # type: (object, str) -> Tuple[str, str or None]
+        """
+        :param finished_testcase: the finished testplan.TestCase.
+        :param result_type: 'ALL' or 'GROUPED'.  see TestRun.format_result_comment.
+        :return: (comment, path of the gzip file with the full comment).  The path is None if nothing was cut.
+        """
+        sections = self.sections(finished_testcase, result_type)
+        rendered = []
+        cut_any = False
+        for text, lines in sections:
+            head = []
+            tail = deque(maxlen=self.tail_lines)
+            cut = 0
+            for line in lines:
+                if len(head) < self.head_lines:
+                    head.append(line)
+                    continue
+                if len(tail) == self.tail_lines:
+                    # the oldest line in tail (or this one if there's no tail) falls out of the comment
+                    cut += 1
+                tail.append(line)
+            rendered.append((text, head, cut, tail))
+            cut_any = cut_any or cut > 0
+        inline_size = sum(len(text) + sum(len(line) + 1 for line in head) + sum(len(line) + 1 for line in tail)
+                          for text, head, cut, tail in rendered)
+        if not cut_any and inline_size <= self.max_chars:
+            return ''.join(text + '\n'.join(head) for text, head, cut, tail in rendered), None
+
+        overflow_path = self.write_full_comment(finished_testcase, sections)
+        marker = '... {{}} lines cut, full log attached as {} ...'.format(os.path.basename(overflow_path))
+        parts = []
+        for text, head, cut, tail in rendered:
+            section_lines = list(head)
+            if cut:
+                section_lines.append(marker.format(cut))
+            section_lines.extend(tail)
+            parts.append(text + '\n'.join(section_lines))
+        comment = ''.join(parts)
+        if len(comment) > self.max_chars:
+            ending = '\n' + marker.format('more')
+            comment = comment[:self.max_chars - len(ending)] + ending
+        return comment, overflow_path
+
+    def write_full_comment(self, finished_testcase, sections):
+        # type: (object, List[Tuple[str, object]]) -> str
+        """
+        streams the complete comment into a new gzip file a line at a time.
+        :return: path of the file.
+        """
+        handle, path = tempfile.mkstemp(prefix='case_{}_'.format(finished_testcase.number), suffix='.log.gz',
+                                        dir=self.overflow_dir)
+        with os.fdopen(handle, 'wb') as raw_file, \
+                gzip.GzipFile(fileobj=raw_file, mode='wb') as gzip_file:
+            for text, lines in sections:
+                gzip_file.write(text.encode('utf-8'))
+                separator = b''
+                for line in lines:
+                    gzip_file.write(separator)
+                    gzip_file.write(line.encode('utf-8'))
+                    separator = b'\n'
+        return path
+
+
+def upload_overflow_attachments(interface, response, attachment_paths):
+    # type: (object, object, List[str or None]) -> int
+    """
+    uploads each overflow file to the result testrail created for the result at the same position.  Files are deleted
+    once they're uploaded.  Files that couldn't be uploaded are left on disk and their paths printed.
+    :param interface: PyTestRail object.
+    :param response: what add_test_results returned for the results.
+    :param attachment_paths: one entry per posted result, the gzip path from CommentRenderer.render or None.
+    :return: number of files uploaded.
+    """
+    wanted = [(position, path) for position, path in enumerate(attachment_paths) if path]
+    if not wanted:
+        return 0
+    if not isinstance(response, list) or len(response) != len(attachment_paths):
+        # spooled, failed, or only part of the results made it.  Can't tell which result is which.
+        print("couldn't match the full result logs to their testrail results.  They're still at: {}"
+              .format([path for position, path in wanted]))
+        return 0
+    uploaded = 0
+    for position, path in wanted:
+        if interface.add_attachment_to_result(response[position]['id'], path) is None:
+            print("full result log wasn't attached to result {}.  It's still at: {}"
+                  .format(response[position]['id'], path))
+            continue
+        os.remove(path)
+        uploaded += 1
+    return uploaded
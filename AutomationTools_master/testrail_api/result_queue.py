@@ -0,0 +1,144 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import List, Dict
+
+from .pytestrail import PyTestRail
+from .result_comment import upload_overflow_attachments
+
+logger = logging.getLogger(__name__)
+
+# markers passed to the worker thread along with the results
+_STOP = object()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class ResultQueue:
+    """
+    Collects result_builder dicts for one run and uploads them with add_test_results from a background thread, so
+    the test that produced a result never waits on testrail.  A batch is sent when it reaches max_batch results or
+    when the oldest result in it has waited max_delay seconds, whichever comes first.
+
+    close() (or interpreter exit) sends whatever is still queued.  Every upload is recorded in flush_stats with its
+    size and how long it took.  Results from uploads that failed are kept in failed_results.
+    """
+
+    def __init__(self, interface, run_id, max_batch=50, max_delay=5.0):
+        # type: (PyTestRail, str or int, int, float) -> None
+        """
+        :param interface: PyTestRail object used for the uploads.
+        :param run_id: string or integer id of the run the results belong to.
+        :param max_batch: max number of results sent in one add_test_results call.
+        :param max_delay: max seconds a result waits in the queue before its batch is sent.
+        """
+        assert isinstance(interface, PyTestRail)
+        if max_batch < 1:
+            raise ValueError("max_batch has to be at least 1.  I got: {}".format(max_batch))
+        self.interface = interface
+        self.run_id = PyTestRail.strip_id(run_id)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.flush_stats = []       # type: List[Dict]
+        self.failed_results = []    # type: List[Dict]
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='ResultQueue-R{}'.format(self.run_id), daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def put(self, result_dict, attachment=None):
+        # type: (Dict, str) -> None
+        """
+        queues a result_builder dict for upload.
+        :param attachment: optional. path of a file to attach to the result once it's uploaded.  see
+            result_comment.CommentRenderer
+        """
+        if self._closed:
+            raise ValueError("result queue for run {} is closed.  Can't add: {}".format(self.run_id, result_dict))
+        self._queue.put((result_dict, attachment))
+
+    def flush(self, timeout=None):
+        # type: (float) -> bool
+        """
+        sends everything queued so far and waits for it to be uploaded.
+        :param timeout: optional. max seconds to wait.
+        :return: True if the flush finished within timeout.
+        """
+        if self._closed:
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def close(self, timeout=None):
+        # type: (float) -> None
+        """
+        sends everything still queued and stops the worker thread.  Safe to call more than once.
+        :param timeout: optional. max seconds to wait for the last uploads.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                item = self._queue.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                # the oldest result has waited max_delay
+                self._send(batch)
+                batch, deadline = [], None
+                continue
+            if item is _STOP:
+                self._send(batch)
+                return
+            if isinstance(item, _FlushRequest):
+                self._send(batch)
+                batch, deadline = [], None
+                item.done.set()
+                continue
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.max_delay
+            if len(batch) >= self.max_batch:
+                self._send(batch)
+                batch, deadline = [], None
+
+    def _send(self, batch):
+        if not batch:
+            return
+        results = [result for result, attachment in batch]
+        not_added = []
+        start = time.monotonic()
+        try:
+            response = self.interface.add_test_results(self.run_id, results, failed_results=not_added)
+        except Exception:
+            # a ValueError for a malformed result shouldn't kill the worker and strand everything queued after it
+            logger.exception('run {}: add_test_results raised'.format(self.run_id))
+            response = None
+        seconds = time.monotonic() - start
+        if response is None:
+            not_added = results
+        elif isinstance(response, list) and len(response) < len(results) and not not_added:
+            # a short response with nothing reported missing.  Can't tell which ones are gone, so keep them all
+            not_added = results
+        # a spooled upload ({'spooled': [...]}) isn't a list of results, it's all on disk
+        self.flush_stats.append({'results': len(batch), 'seconds': seconds, 'ok': not not_added})
+        if not_added:
+            self.failed_results.extend(not_added)
+            logger.warning("run {}: {} of {} results weren't uploaded after {:.3f}s"
+                           .format(self.run_id, len(not_added), len(batch), seconds))
+        else:
+            logger.info('run {}: uploaded {} results in {:.3f}s'.format(self.run_id, len(batch), seconds))
+        upload_overflow_attachments(self.interface, response, [attachment for result, attachment in batch])
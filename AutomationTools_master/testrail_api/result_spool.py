@@ -0,0 +1,382 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import List, Dict
+
+try:
+    import fcntl
+except ImportError:
+    # windows.  Without file locks a spool only ever drains its own directory.
+    fcntl = None
+
+from .testrail import APIError
+
+logger = logging.getLogger(__name__)
+
+
+class ResultSpool:
+    """
+    Write-ahead spool for test results.  Results are appended to a file on local disk first and sent to testrail
+    later by a SpoolReplayer, so a slow or unreachable testrail never holds up the test and never loses a result.
+
+    Each run gets an append-only <key>.spool file with one json record per line.  A record is exactly one testrail
+    write: {"id": ..., "command": "add_results_for_cases/5234", "data": {...}}.  Once a record has been sent its id
+    is appended to <key>.acked.  Records testrail rejects for good are moved to <key>.dead (see dead_letter).
+    Records are written to the os right away and fsynced in batches: after fsync_every
+    records or fsync_interval seconds, whichever comes first, and on sync()/close().
+
+    Several processes can share a spool_dir.  Each ResultSpool writes to its own subdirectory and holds an flock on
+    the .lock file in it for as long as the process lives.  keys() also picks up the subdirectories of processes that
+    are gone (their lock is free) and takes their lock, so a process never replays or deletes records another live
+    process is still writing, and two processes never adopt the same leftovers.
+    """
+    SPOOL_EXTENSION = '.spool'
+    ACKED_EXTENSION = '.acked'
+    DEAD_EXTENSION = '.dead'
+    LOCK_NAME = '.lock'
+
+    def __init__(self, spool_dir, fsync_every=50, fsync_interval=1.0):
+        # type: (str, int, float) -> None
+        """
+        :param spool_dir: directory for the spool files.  Created if it doesn't exist.
+        :param fsync_every: max number of records written before they're fsynced.
+        :param fsync_interval: max seconds between the first unsynced record and the fsync.
+        """
+        self.spool_dir = spool_dir
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.name = '{0}-{1}'.format(os.getpid(), uuid.uuid4().hex[:12])
+        os.makedirs(os.path.join(spool_dir, self.name))
+        self._dir_locks = {self.name: self._take_dir_lock(self.name, block=True)}    # subdirectory: locked file
+        self._lock = threading.Lock()
+        self._files = {}            # key: open append file
+        self._unsynced = 0
+        self._oldest_unsynced = None
+        # per key: acked ids past the read offset, and the offset in the spool file before which every record is
+        # acked.  Keeps pending() from reading the whole spool and acked files again on every drain.
+        self._acked = {}            # key: set of record ids
+        self._offsets = {}          # key: byte offset
+
+    @staticmethod
+    def run_key(run_id):
+        # type: (int) -> str
+        return 'run_{0}'.format(run_id)
+
+    def _qualify(self, key):
+        # keys without a subdirectory are this spool's own, e.g. run_key(run_id)
+        return key if '/' in key else self.name + '/' + key
+
+    def _path(self, key, extension):
+        return os.path.join(self.spool_dir, key + extension)
+
+    def _take_dir_lock(self, name, block=False):
+        # the open .lock file of a subdirectory with the flock on it, None if another process holds it
+        try:
+            lock_file = open(os.path.join(self.spool_dir, name, ResultSpool.LOCK_NAME), 'a')
+        except FileNotFoundError:
+            # not set up yet, or cleaned up by whoever drained it
+            return None
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if block else fcntl.LOCK_NB))
+            except OSError:
+                lock_file.close()
+                return None
+        return lock_file
+
+    def release(self):
+        """
+        closes the spool and gives up its directories, so another process can drain what's left in them.  Empty
+        ones are deleted.  Don't use the spool after this.
+        """
+        self.close()
+        with self._lock:
+            for name, lock_file in self._dir_locks.items():
+                directory = os.path.join(self.spool_dir, name)
+                if os.listdir(directory) == [ResultSpool.LOCK_NAME]:
+                    os.remove(os.path.join(directory, ResultSpool.LOCK_NAME))
+                    os.rmdir(directory)
+                lock_file.close()
+            self._dir_locks = {}
+
+    def append(self, key, command, data):
+        # type: (str, str, dict) -> str
+        """
+        adds one testrail write to the spool.
+        :param key: spool file the record goes in, e.g. run_key(run_id).
+        :param command: api command the record is replayed with, e.g. add_results_for_cases/5234
+        :param data: the post data for the command.
+        :return: id of the new record.
+        """
+        key = self._qualify(key)
+        record_id = uuid.uuid4().hex
+        line = json.dumps({'id': record_id, 'command': command, 'data': data}) + '\n'
+        with self._lock:
+            spool_file = self._files.get(key)
+            if spool_file is None:
+                spool_file = open(self._path(key, ResultSpool.SPOOL_EXTENSION), 'a', encoding='utf-8')
+                self._files[key] = spool_file
+            spool_file.write(line)
+            spool_file.flush()
+            self._unsynced += 1
+            if self._oldest_unsynced is None:
+                self._oldest_unsynced = time.monotonic()
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._oldest_unsynced >= self.fsync_interval:
+                self._fsync_locked()
+        return record_id
+
+    def sync(self):
+        """
+        fsyncs every record written so far.
+        """
+        with self._lock:
+            self._fsync_locked()
+
+    def _fsync_locked(self):
+        for spool_file in self._files.values():
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+        self._unsynced = 0
+        self._oldest_unsynced = None
+
+    def close(self):
+        with self._lock:
+            self._fsync_locked()
+            for spool_file in self._files.values():
+                spool_file.close()
+            self._files = {}
+
+    def keys(self):
+        # type: () -> List[str]
+        """
+        :return: keys of every spool file this spool may drain, oldest file first: its own, plus the ones in
+            subdirectories of spool_dir whose process is gone.  Those are locked to this spool from here on.
+        """
+        entries = []
+        with os.scandir(self.spool_dir) as subdirectories:
+            for subdirectory in subdirectories:
+                name = subdirectory.name
+                if not subdirectory.is_dir():
+                    continue
+                if name not in self._dir_locks:
+                    if fcntl is None:
+                        continue
+                    lock_file = self._take_dir_lock(name)
+                    if lock_file is None:
+                        continue
+                    with self._lock:
+                        self._dir_locks[name] = lock_file
+                entries.extend((name, entry) for entry in os.scandir(subdirectory.path)
+                               if entry.is_file() and entry.name.endswith(ResultSpool.SPOOL_EXTENSION))
+        entries.sort(key=lambda name_entry: name_entry[1].stat().st_mtime)
+        return [name + '/' + entry.name[:-len(ResultSpool.SPOOL_EXTENSION)] for name, entry in entries]
+
+    def pending(self, key):
+        # type: (str) -> List[Dict]
+        """
+        :return: records in a spool file that haven't been acked, in the order they were written.
+        """
+        key = self._qualify(key)
+        with self._lock:
+            # under the lock so we never read a line append() is halfway through writing
+            return self._pending_locked(key)
+
+    def _pending_locked(self, key):
+        acked = self._acked.get(key)
+        if acked is None:
+            acked = self._acked[key] = set(self._read_lines(self._path(key, ResultSpool.ACKED_EXTENSION)))
+        offset = self._offsets.get(key, 0)
+        records = []
+        try:
+            spool_file = open(self._path(key, ResultSpool.SPOOL_EXTENSION), 'rb')
+        except FileNotFoundError:
+            return records
+        with spool_file:
+            if os.fstat(spool_file.fileno()).st_size < offset:
+                # the file was replaced behind our back, start over
+                offset = 0
+            spool_file.seek(offset)
+            # the offset only moves over the records at the start that are done with
+            done_so_far = True
+            for line in spool_file:
+                record = None
+                if line.strip():
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # half written last line from a crash.  It was never synced so the write it holds never
+                        # happened.
+                        logger.warning('skipping unreadable record in spool {0}: {1!r}'.format(key, line[:80]))
+                if record is not None and record['id'] not in acked:
+                    done_so_far = False
+                    records.append(record)
+                elif done_so_far:
+                    offset += len(line)
+                    if record is not None:
+                        acked.discard(record['id'])
+        self._offsets[key] = offset
+        return records
+
+    def ack(self, key, record_id):
+        # type: (str, str) -> None
+        """
+        marks a record as sent so it's never replayed again.
+        """
+        key = self._qualify(key)
+        with self._lock:
+            self._ack_locked(key, record_id)
+
+    def _ack_locked(self, key, record_id):
+        with open(self._path(key, ResultSpool.ACKED_EXTENSION), 'a', encoding='utf-8') as acked_file:
+            acked_file.write(record_id + '\n')
+            acked_file.flush()
+            os.fsync(acked_file.fileno())
+        acked = self._acked.get(key)
+        if acked is not None:
+            acked.add(record_id)
+
+    def dead_letter(self, key, record, error):
+        # type: (str, Dict, str) -> None
+        """
+        moves a record testrail will never accept (a 4xx like a deleted run or a bad case id) to <key>.dead with the
+        error and acks it, so it stops holding up the records behind it.  .dead files are never deleted, look through
+        them and fix or drop the records by hand.
+        """
+        key = self._qualify(key)
+        line = json.dumps({'record': record, 'error': error}) + '\n'
+        with self._lock:
+            with open(self._path(key, ResultSpool.DEAD_EXTENSION), 'a', encoding='utf-8') as dead_file:
+                dead_file.write(line)
+                dead_file.flush()
+                os.fsync(dead_file.fileno())
+            self._ack_locked(key, record['id'])
+
+    def remove_if_drained(self, key):
+        # type: (str) -> bool
+        """
+        deletes a spool file and its acked file once every record in it has been acked.
+        :return: True if the files were deleted.
+        """
+        key = self._qualify(key)
+        with self._lock:
+            # all under one lock so nothing can be appended between the check and the delete
+            if key in self._files:
+                # still being written to
+                return False
+            if self._pending_locked(key):
+                return False
+            for extension in (ResultSpool.SPOOL_EXTENSION, ResultSpool.ACKED_EXTENSION):
+                try:
+                    os.remove(self._path(key, extension))
+                except FileNotFoundError:
+                    pass
+            self._acked.pop(key, None)
+            self._offsets.pop(key, None)
+        return True
+
+    @staticmethod
+    def _read_lines(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as spool_file:
+                return [line.rstrip('\n') for line in spool_file if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+class SpoolReplayer:
+    """
+    Sends spooled records to testrail.  drain() goes through every spool file once.  start() does that every
+    interval seconds on a background thread until stop().
+
+    Records of a spool file are sent one at a time in the order they were written, and each is acked right after
+    testrail accepts it, so draining again never resends a record.  A record testrail rejects with a 4xx (other than
+    401, 403 and 429, which aren't about the record) is moved to the dead letter file and the rest of the file keeps
+    going.  If a record fails any other way the rest of that file waits for the next drain to keep results in
+    order.  If the process dies between testrail accepting a record and the ack, that one record is sent again on the
+    next drain.
+    """
+
+    def __init__(self, interface, spool, interval=5.0):
+        """
+        :type interface: pytestrail.PyTestRail
+        :type spool: ResultSpool
+        :param interface: PyTestRail object used to send the records.
+        :param spool: ResultSpool to drain.
+        :param interval: seconds between drains when running in the background.
+        """
+        self.interface = interface
+        self.spool = spool
+        self.interval = interval
+        self.sent = 0
+        self._stop = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._worker = None
+
+    def drain(self):
+        # type: () -> int
+        """
+        sends every pending record it can.
+        :return: number of records still pending afterwards.
+        """
+        with self._drain_lock:
+            self.spool.sync()
+            still_pending = 0
+            for key in self.spool.keys():
+                records = self.spool.pending(key)
+                for position, record in enumerate(records):
+                    try:
+                        self.interface.send_post(record['command'], record['data'])
+                    except APIError as error:
+                        logger.warning('replaying spooled record {0} of {1} failed: {2}'
+                                       .format(record['id'], key, error))
+                        if SpoolReplayer.rejected(error):
+                            self.spool.dead_letter(key, record, str(error))
+                            continue
+                        still_pending += len(records) - position
+                        break
+                    self.spool.ack(key, record['id'])
+                    self.sent += 1
+                else:
+                    self.spool.remove_if_drained(key)
+            return still_pending
+
+    @staticmethod
+    def rejected(error):
+        # type: (APIError) -> bool
+        """
+        :return: True if testrail turned the record down for good, so sending it again can't work.
+        """
+        return error.status_code is not None and 400 <= error.status_code < 500 and \
+            error.status_code not in (401, 403, 429)
+
+    def start(self):
+        """
+        starts draining every interval seconds on a background thread.
+        """
+        if self._worker is None:
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name='SpoolReplayer', daemon=True)
+            self._worker.start()
+
+    def stop(self, drain=True):
+        """
+        stops the background thread.
+        :param drain: True to try one last drain before returning.
+        """
+        if self._worker is not None:
+            self._stop.set()
+            self._worker.join()
+            self._worker = None
+        if drain:
+            self.drain()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as error:
+                # keep the background thread alive through disk or data errors, they'll show up again next pass
+                logger.exception('spool drain failed: {0}'.format(error))
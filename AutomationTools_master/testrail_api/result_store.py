@@ -0,0 +1,120 @@
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import List, Iterator
+
+# interned so every store shares one copy of each tag and lookups compare by identity first
+PASS = sys.intern('pass')
+WARNING = sys.intern('warning')
+FAIL = sys.intern('fail')
+ERROR = sys.intern('error')
+ALL = sys.intern('all')
+CATEGORIES = (PASS, WARNING, FAIL, ERROR)
+
+
+class ResultStore(Mapping):
+    """
+    Compact storage for the result lines of one TestCase.  Every line is kept once in a single append-only buffer and
+    pass/warning/fail/error/all are arrays of offsets into it, so a line costs one string plus 4 bytes per category
+    it's in instead of a list slot and a reference per category.
+
+    It reads like the old {'pass': [], 'warning': [], 'fail': [], 'error': [], 'all': []} dict and behaves the same:
+    results['fail'] is a list-like view that can be iterated, sliced, joined and appended to, and a line is only in
+    the categories it was appended to.  Appending the same string object to a category and then to 'all' (the usual
+    pattern) stores it once.
+    """
+    __slots__ = ('_lines', '_offsets', '_views')
+
+    def __init__(self):
+        self._lines = []                # type: List[str]
+        self._offsets = {category: array('I') for category in CATEGORIES + (ALL,)}
+        self._views = {category: _ResultView(self, category) for category in CATEGORIES + (ALL,)}
+
+    def add(self, category, line):
+        # type: (str, str) -> None
+        """
+        adds a result line to one category.
+        :param category: 'pass', 'warning', 'fail', 'error' or 'all'.
+        :param line: string result line.
+        """
+        offsets = self._offsets.get(category)
+        if offsets is None:
+            raise KeyError("invalid result category: {}.  valid values are {}".format(category, CATEGORIES + (ALL,)))
+        lines = self._lines
+        if lines and lines[-1] is line:
+            # the same object as the line before it, e.g. results['all'].append(line) after results['pass'].append(line)
+            offsets.append(len(lines) - 1)
+        else:
+            offsets.append(len(lines))
+            lines.append(line)
+
+    def count(self, category):
+        # type: (str) -> int
+        return len(self._offsets[category])
+
+    def lines(self, category, start=0):
+        # type: (str, int) -> List[str]
+        """
+        :return: list of the lines in a category from position start on.
+        """
+        lines = self._lines
+        return [lines[offset] for offset in self._offsets[category][start:]]
+
+    def join(self, category, separator='\n'):
+        # type: (str, str) -> str
+        lines = self._lines
+        return separator.join(lines[offset] for offset in self._offsets[category])
+
+    def __getitem__(self, category):
+        return self._views[category]
+
+    def __iter__(self):
+        return iter(self._views)
+
+    def __len__(self):
+        return len(self._views)
+
+    def __repr__(self):
+        return 'ResultStore({})'.format({category: self.count(category) for category in self._views})
+
+
+class _ResultView:
+    """
+    list-like view of one category of a ResultStore.  Slices and copies are plain lists.
+    """
+    __slots__ = ('_store', '_category')
+
+    def __init__(self, store, category):
+        # type: (ResultStore, str) -> None
+        self._store = store
+        self._category = category
+
+    def append(self, line):
+        # type: (str) -> None
+        self._store.add(self._category, line)
+
+    def extend(self, lines):
+        for line in lines:
+            self._store.add(self._category, line)
+
+    def __len__(self):
+        return self._store.count(self._category)
+
+    def __iter__(self):
+        # type: () -> Iterator[str]
+        store = self._store
+        lines = store._lines
+        return (lines[offset] for offset in store._offsets[self._category])
+
+    def __getitem__(self, index):
+        store = self._store
+        offsets = store._offsets[self._category]
+        if isinstance(index, slice):
+            return [store._lines[offset] for offset in offsets[index]]
+        return store._lines[offsets[index]]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
@@ -0,0 +1,189 @@
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Iterator
+
+from .pytestrail import PyTestRail, APIError, RUN_CASE_CHUNK_SIZE
+
+RUN_DESCRIPTION = 'Test run created using the TestRail.'
+
+
+def load_manifest(path):
+    # type: (str) -> List[Dict]
+    """
+    reads a run manifest: a list of runs to create, one entry per run.  The format comes from the file extension.
+        .json           a list of entry objects, or an object with the list under "runs"
+        .yaml / .yml    same as json.  needs PyYAML
+        .csv            a header row with the entry keys, then one run per row.  case_ids is a space, comma or
+                        semicolon separated list in one column.
+    entry keys:
+        project_id, suite_id, name  required.  testrun_name works for name too, like the command line
+        case_ids                    optional.  list of case ids, C prefixes are fine.  All cases if it's missing.
+        include_all_cases           optional.  defaults to True when there are no case_ids
+        description, milestone_id, assignedto_id    optional.
+    :return: list of entry dicts with the keys above, ids as integers.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', encoding='utf-8', newline='') as manifest_file:
+        if extension == '.json':
+            entries = json.load(manifest_file)
+        elif extension in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("yaml manifests need PyYAML.  pip install pyyaml, or use a json or csv manifest")
+            entries = yaml.safe_load(manifest_file)
+        elif extension == '.csv':
+            entries = list(csv.DictReader(manifest_file))
+        else:
+            raise ValueError("unknown manifest type: {}.  Use a .json, .yaml, .yml or .csv file".format(path))
+    if isinstance(entries, dict):
+        entries = entries.get('runs')
+    if not isinstance(entries, list):
+        raise ValueError("manifest {} has to be a list of runs or have the list under 'runs'".format(path))
+    return [normalize_entry(entry, position) for position, entry in enumerate(entries)]
+
+
+def normalize_entry(entry, position=0):
+    # type: (Dict, int) -> Dict
+    """
+    checks one manifest entry and converts its values to what add_run takes.
+    :param position: index of the entry in the manifest, used in error messages.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError("manifest entry {} isn't a mapping: {}".format(position, entry))
+    name = entry.get('name') or entry.get('testrun_name')
+    missing = [key for key, value in (('project_id', entry.get('project_id')), ('suite_id', entry.get('suite_id')),
+                                      ('name', name)) if value in (None, '')]
+    if missing:
+        raise ValueError("manifest entry {} is missing {}: {}".format(position, missing, entry))
+    case_ids = entry.get('case_ids')
+    if isinstance(case_ids, str):
+        case_ids = case_ids.replace(',', ' ').replace(';', ' ').split()
+    case_ids = [PyTestRail.strip_id(case_id) for case_id in case_ids] if case_ids else None
+    include_all_cases = entry.get('include_all_cases')
+    if include_all_cases in (None, ''):
+        include_all_cases = case_ids is None
+    elif isinstance(include_all_cases, str):
+        include_all_cases = include_all_cases.strip().lower() in ('true', 'yes', '1')
+    normalized = {
+        'project_id': PyTestRail.strip_id(entry['project_id']),
+        'suite_id': PyTestRail.strip_id(entry['suite_id']),
+        'name': str(name),
+        'description': entry.get('description') or RUN_DESCRIPTION,
+        'include_all_cases': bool(include_all_cases),
+        'case_ids': case_ids,
+    }
+    for optional in ('milestone_id', 'assignedto_id'):
+        if entry.get(optional) not in (None, ''):
+            normalized[optional] = PyTestRail.strip_id(entry[optional])
+    return normalized
+
+
+def read_case_ids(lines):
+    # type: (Iterable[str]) -> Iterator[int]
+    """
+    reads case ids from an open file or any other iterable of lines, one line at a time.  Ids can be one per line or
+    comma separated (csv), C prefixes are fine.  Blank lines and lines starting with # are skipped, and so is a
+    first line that isn't ids (a csv header).  Ids that were already read are dropped.
+    :return: generator of integer case ids in the order they first show up.
+    """
+    seen = set()
+    first_row = True
+    for row in csv.reader(lines):
+        if not row or row[0].lstrip().startswith('#'):
+            continue
+        try:
+            ids = [PyTestRail.strip_id(field.strip()) for field in row if field.strip()]
+        except ValueError:
+            if first_row:
+                first_row = False
+                continue
+            raise ValueError("not a case id in line: {}".format(','.join(row)))
+        first_row = False
+        for case_id in ids:
+            if case_id not in seen:
+                seen.add(case_id)
+                yield case_id
+
+
+def create_run(interface, entry, chunk_size=RUN_CASE_CHUNK_SIZE):
+    # type: (PyTestRail, Dict, int) -> Dict
+    """
+    creates the run for one normalized manifest entry.  Entries with more than chunk_size case ids go through
+    add_run_chunked.
+    :return: dict with the entry's project_id, suite_id and name plus run_id (None if it failed) and error.
+    """
+    result = {'project_id': entry['project_id'], 'suite_id': entry['suite_id'], 'name': entry['name'],
+              'run_id': None, 'error': None}
+    try:
+        if entry['case_ids'] and len(entry['case_ids']) > chunk_size and not entry['include_all_cases']:
+            response = interface.add_run_chunked(entry['project_id'], entry['suite_id'], entry['name'],
+                                                 entry['description'], entry['case_ids'],
+                                                 milestone_id=entry.get('milestone_id'),
+                                                 assignedto_id=entry.get('assignedto_id'), chunk_size=chunk_size)
+        else:
+            response = interface.add_run(entry['project_id'], entry['suite_id'], entry['name'],
+                                         entry['description'], include_all_cases=entry['include_all_cases'],
+                                         case_ids=entry['case_ids'], milestone_id=entry.get('milestone_id'),
+                                         assignedto_id=entry.get('assignedto_id'))
+    except (APIError, ValueError) as error:
+        result['error'] = str(error)
+        return result
+    if not response:
+        # add_run already printed the APIError
+        result['error'] = 'add_run failed, see the error printed above'
+    else:
+        result['run_id'] = response['id']
+    return result
+
+
+def create_runs(interface, entries, concurrency=4, chunk_size=RUN_CASE_CHUNK_SIZE):
+    # type: (PyTestRail, List[Dict], int, int) -> List[Dict]
+    """
+    creates the runs for a list of normalized manifest entries, up to concurrency at a time, over the interface's
+    pooled connections.  Keep concurrency at or below the pool_maxsize the interface was created with.
+    :return: list of create_run results in entries order.
+    """
+    if not entries:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(entries)))) as pool:
+        return list(pool.map(lambda entry: create_run(interface, entry, chunk_size=chunk_size), entries))
+
+
+def create_plan(interface, plan, concurrency=4):
+    # type: (PyTestRail, Dict, int) -> Dict
+    """
+    creates a test plan with one entry per item of plan['entries'].  The plan is created empty and the entries are
+    added up to concurrency at a time, see testplan.PlanBuilder.  If any entry fails the plan is deleted again.
+    plan keys:
+        project_id, name    required
+        entries             required.  list of dicts with suite_id and optionally name (defaults to the plan name),
+                            description, case_ids (all cases if it's missing), assignedto_id, config_ids
+        description, milestone_id  optional.
+    :return: dict with the plan's project_id and name plus plan_id, run_ids (list with the run ids of the entries,
+        in entries order) and error.  plan_id is None and run_ids is empty if it failed.
+    """
+    from .testplan import PlanBuilder
+    result = {'project_id': plan.get('project_id'), 'name': plan.get('name'), 'plan_id': None, 'run_ids': [],
+              'error': None}
+    try:
+        if plan.get('project_id') in (None, '') or not plan.get('name') or not plan.get('entries'):
+            raise ValueError("a plan needs project_id, name and entries: {}".format(plan))
+        description = plan.get('description') or RUN_DESCRIPTION
+        builder = PlanBuilder(interface, plan['project_id'], str(plan['name']), description,
+                              milestone_id=PyTestRail.strip_id(plan.get('milestone_id') or 0), workers=concurrency)
+        for entry in plan['entries']:
+            case_ids = [PyTestRail.strip_id(case_id) for case_id in entry.get('case_ids') or []]
+            builder.add_entry(interface.plan_entry_builder(
+                PyTestRail.strip_id(entry['suite_id']), str(entry.get('name') or plan['name']),
+                entry.get('description') or description, assignedto_id=int(entry.get('assignedto_id') or 0),
+                case_ids=case_ids, config_ids=[int(config_id) for config_id in entry.get('config_ids') or []]))
+        response = builder.build()
+    except (APIError, ValueError, KeyError) as error:
+        result['error'] = str(error)
+        return result
+    result['plan_id'] = response['id']
+    result['run_ids'] = [run['id'] for plan_entry in response['entries'] for run in plan_entry['runs']]
+    return result
@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+from .pytestrail import PyTestRail, APIError
+
+
+class RunIndex:
+    """
+    case id -> test lookups for one or more test runs, built once from get_tests_in_run and answered from dicts.
+    Use this instead of calling is_case_in_run over and over, which downloads the whole run every time.
+
+    The index is a snapshot.  If cases are added to or removed from the runs after it's built, call refresh().
+
+    example:
+        index = RunIndex(pyt, [5234, 5235])
+        index.test_id_for_case(1263027)
+    """
+
+    def __init__(self, interface, run_ids, workers=8):
+        # type: (PyTestRail, List[str or int], int) -> None
+        """
+        :param interface: PyTestRail object used to download the tests.
+        :param run_ids: list of string or integer run ids to index.
+        :param workers: number of runs downloaded at the same time.
+        """
+        assert isinstance(interface, PyTestRail)
+        self.interface = interface
+        self.run_ids = [PyTestRail.strip_id(run_id) for run_id in run_ids]
+        self.workers = workers
+        self._tests_by_case = {}   # case_id: [test dict, ...] in run_ids order
+        self._cases_by_run = {}    # run_id: set of case ids
+        self.is_built = False
+
+    def build(self):
+        # type: () -> RunIndex
+        """
+        downloads the tests of every run concurrently and indexes them by case id.
+        :return: self, so RunIndex(...).build() can be chained
+        """
+        if self.run_ids:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(self.run_ids)))) as pool:
+                tests_per_run = list(pool.map(self._get_tests, self.run_ids))
+        else:
+            tests_per_run = []
+        tests_by_case = {}
+        cases_by_run = {}
+        for run_id, tests in zip(self.run_ids, tests_per_run):
+            case_ids = set()
+            for test in tests:
+                case_ids.add(test['case_id'])
+                tests_by_case.setdefault(test['case_id'], []).append(test)
+            cases_by_run[run_id] = case_ids
+        self._tests_by_case = tests_by_case
+        self._cases_by_run = cases_by_run
+        self.is_built = True
+        return self
+
+    def refresh(self):
+        # type: () -> RunIndex
+        """
+        throws away the current index and builds it again from testrail.
+        """
+        self.invalidate()
+        return self.build()
+
+    def invalidate(self):
+        """
+        drops the index.  The next lookup rebuilds it.
+        """
+        self._tests_by_case = {}
+        self._cases_by_run = {}
+        self.is_built = False
+
+    def _get_tests(self, run_id):
+        # every page, a run with more than 250 tests would otherwise be missing tests and lookups for them would
+        # quietly miss
+        try:
+            return list(self.interface.iter_tests_in_run(run_id))
+        except APIError as error:
+            raise ValueError("couldn't get the tests for run id: {}.  {}".format(run_id, error))
+
+    def _ensure_built(self):
+        if not self.is_built:
+            self.build()
+
+    def is_case_in_run(self, case_id, run_id):
+        # type: (str or int, str or int) -> bool
+        self._ensure_built()
+        return PyTestRail.strip_id(case_id) in self._cases_by_run.get(PyTestRail.strip_id(run_id), ())
+
+    def tests_for_case(self, case_id):
+        # type: (str or int) -> List[Dict]
+        """
+        :return: list of get_test dicts for every indexed run that includes the case, in run_ids order.
+        """
+        self._ensure_built()
+        return list(self._tests_by_case.get(PyTestRail.strip_id(case_id), ()))
+
+    def run_id_for_case(self, case_id):
+        # type: (str or int) -> int or None
+        """
+        :return: integer id of the first indexed run that includes the case.  None if no run has it.
+        """
+        tests = self.tests_for_case(case_id)
+        return tests[0]['run_id'] if tests else None
+
+    def test_id_for_case(self, case_id, run_id=None):
+        # type: (str or int, str or int) -> int or None
+        """
+        :param case_id: string or integer case id
+        :param run_id: optional. run to look in.  If omitted the first indexed run that includes the case is used.
+        :return: integer test id of the case in that run.  None if it isn't there.
+        """
+        tests = self.tests_for_case(case_id)
+        if run_id is not None:
+            run_id = PyTestRail.strip_id(run_id)
+            tests = [test for test in tests if test['run_id'] == run_id]
+        return tests[0]['id'] if tests else None
+
+
+class PlanIndex(RunIndex):
+    """
+    RunIndex over every run in a test plan.  The plan is read with get_plan when the index is built, so runs added
+    to the plan later show up after refresh().
+    """
+
+    def __init__(self, interface, plan_id, workers=8):
+        # type: (PyTestRail, str or int, int) -> None
+        RunIndex.__init__(self, interface, [], workers=workers)
+        self.plan_id = PyTestRail.strip_id(plan_id)
+        self.plan_data = None
+
+    def build(self):
+        # type: () -> PlanIndex
+        plan_data = self.interface.get_plan(self.plan_id)
+        if not plan_data:
+            raise ValueError('plan_id: {0} doesn''t exist in testrail.'.format(self.plan_id))
+        self.plan_data = plan_data
+        self.run_ids = [run['id'] for entry in plan_data['entries'] for run in entry['runs']]
+        return RunIndex.build(self)
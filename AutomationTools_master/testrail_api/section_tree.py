@@ -0,0 +1,148 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+from .testrail import APIError
+
+
+class SectionTree:
+    """
+    index of the sections in one suite keyed by (parent_id, name), so finding a nested section path is one dict
+    lookup per level instead of a search through every section in the suite.  Root sections have parent_id None.
+
+    The tree is a snapshot from when it was built.  Sections added through it (or through PyTestRail.add_section on
+    the PyTestRail object that owns it) are added to it as they're created.  Sections changed some other way only
+    show up after refresh().
+
+    Get one with PyTestRail.section_tree(project_id, suite_id), which keeps it around for later calls.
+    """
+
+    def __init__(self, interface, project_id, suite_id):
+        """
+        :type interface: pytestrail.PyTestRail
+        :type project_id: int
+        :type suite_id: int
+        """
+        self.interface = interface
+        self.project_id = project_id
+        self.suite_id = suite_id
+        self._sections = {}     # (parent_id, name): section dict
+        self._duplicates = set()
+        self._lock = threading.Lock()
+        self.is_built = False
+
+    def build(self):
+        # type: () -> SectionTree
+        """
+        downloads every section in the suite and indexes it.
+        :return: self
+        """
+        sections = {}
+        duplicates = set()
+        for section in self.interface.iter_sections(self.project_id, self.suite_id):
+            key = (section['parent_id'], section['name'])
+            if key in sections:
+                duplicates.add(key)
+            else:
+                sections[key] = section
+        with self._lock:
+            self._sections = sections
+            self._duplicates = duplicates
+            self.is_built = True
+        return self
+
+    def __len__(self):
+        self._ensure_built()
+        return len(self._sections)
+
+    def refresh(self):
+        # type: () -> SectionTree
+        return self.build()
+
+    def _ensure_built(self):
+        if not self.is_built:
+            self.build()
+
+    def add(self, section):
+        # type: (Dict) -> None
+        """
+        adds a section dict (an add_section response) to the index.
+        """
+        with self._lock:
+            self._sections.setdefault((section['parent_id'], section['name']), section)
+
+    def find(self, name, parent_id=None):
+        # type: (str, int) -> Dict or None
+        """
+        :return: the section dict named name under parent_id.  None if there isn't one.
+        """
+        self._ensure_built()
+        key = (parent_id, name)
+        if key in self._duplicates:
+            raise ValueError('Found more than 1 section with the same name and parent_id.  Fix the test suite so there '
+                             'is only ever one section name with the same parent id.  i got name: {0}, parent_id: {1}'
+                             .format(name, parent_id))
+        return self._sections.get(key)
+
+    def resolve(self, section_name_list):
+        # type: (List[str]) -> int or None
+        """
+        :return: integer id of the last section in a path of section names.  None if any of them doesn't exist.
+        """
+        parent_id = None
+        for section_name in section_name_list:
+            section = self.find(section_name, parent_id)
+            if section is None:
+                return None
+            parent_id = section['id']
+        return parent_id
+
+    def _add_section(self, parent_id, name):
+        response = self.interface.add_section(self.project_id, self.suite_id, name, parent_id)
+        if not response:
+            raise APIError("couldn't add section {0} under parent_id {1} to suite {2}.  See the error printed above."
+                           .format(name, parent_id, self.suite_id))
+        self.add(response)
+        return response
+
+    def ensure_path(self, section_name_list):
+        # type: (List[str]) -> int
+        """
+        adds whatever sections of a path don't exist yet.  see PyTestRail.add_nested_sections.
+        :return: integer id of the last section in the path.
+        """
+        return self.ensure_paths([section_name_list], workers=1)[0]
+
+    def ensure_paths(self, list_of_paths, workers=8):
+        # type: (List[List[str]], int) -> List[int]
+        """
+        adds every section in a list of paths that doesn't exist yet.  Paths are walked one level at a time, all
+        the missing sections at a level are added at the same time, and then the next level is done under them.
+        Paths that share a prefix share its sections, so each missing section is only added once.
+
+        Sibling sections that are added together end up in testrail in whatever order the adds finish.  Use
+        workers=1 if the order sections show up in the suite matters.
+        :param list_of_paths: list of section paths.  A path is a list of section names from the root down.
+        :param workers: max number of add_section calls at the same time.
+        :return: list with the integer id of the last section of each path, in list_of_paths order.  None for an
+            empty path.
+        """
+        self._ensure_built()
+        parents = [None] * len(list_of_paths)
+        depth = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            while True:
+                at_depth = [index for index, path in enumerate(list_of_paths) if len(path) > depth]
+                if not at_depth:
+                    break
+                missing = {}    # used as an ordered set of (parent_id, name)
+                for index in at_depth:
+                    key = (parents[index], list_of_paths[index][depth])
+                    if key not in missing and self.find(key[1], key[0]) is None:
+                        missing[key] = None
+                # list() so an exception from any add is raised here
+                list(pool.map(lambda key: self._add_section(*key), missing))
+                for index in at_depth:
+                    parents[index] = self.find(list_of_paths[index][depth], parents[index])['id']
+                depth += 1
+        return parents
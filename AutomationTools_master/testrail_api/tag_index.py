@@ -0,0 +1,151 @@
+from typing import List, Dict, Iterable
+
+from .testplan import CaseFilter, Operator
+
+
+class TagIndex:
+    """
+    tag id -> cases inverted index over the custom_tags field of a set of cases, for picking cases by tag without
+    going through every case dict.  Each case gets a position and each tag is stored as a bitmap (a python int with
+    bit n set if the case at position n has the tag), so and/or/not over tags is a handful of big int operations even
+    for 100k cases.
+
+    example:
+        index = TagIndex.from_suite(pyt, 27, 2552)
+        index.select([CaseFilter(Operator.isEqual, TestTags.Firmware), CaseFilter(Operator.isNotEqual,
+                                                                                  TestTags.Disabled)])
+    """
+
+    def __init__(self, cases=None, tag_field='custom_tags'):
+        # type: (Iterable[Dict], str) -> None
+        """
+        :param cases: optional. get_case dicts to index.  More can be added later with add_cases.
+        :param tag_field: the multi-select custom field the tag ids are in.
+        """
+        self.tag_field = tag_field
+        self._case_ids = []         # position: case id
+        self._positions = {}        # case id: position
+        self._tag_positions = {}    # tag id: list of positions, in the order they were added
+        self._bitmaps = {}          # tag id: bitmap, built from _tag_positions when first used
+        if cases is not None:
+            self.add_cases(cases)
+
+    @classmethod
+    def from_suite(cls, interface, project_id, suite_id, tag_field='custom_tags', workers=8):
+        """
+        builds the index from every case in a suite.  The pages are downloaded in parallel, see get_all_cases.
+        :type interface: pytestrail.PyTestRail
+        :rtype: TagIndex
+        """
+        return cls(interface.get_all_cases(project_id, suite_id, workers=workers), tag_field=tag_field)
+
+    @classmethod
+    def from_mirror(cls, case_mirror, suite_id, tag_field='custom_tags'):
+        """
+        builds the index from the cases of a suite in a mirror.TestRailMirror.  No testrail calls at all.
+        :rtype: TagIndex
+        """
+        return cls(case_mirror.get_cases(suite_id), tag_field=tag_field)
+
+    def add_cases(self, cases):
+        # type: (Iterable[Dict]) -> None
+        """
+        adds cases to the index.  A case that's already in it keeps its old tags.
+        """
+        for case in cases:
+            case_id = case['id']
+            if case_id in self._positions:
+                continue
+            position = len(self._case_ids)
+            self._case_ids.append(case_id)
+            self._positions[case_id] = position
+            for tag_id in case.get(self.tag_field) or ():
+                self._tag_positions.setdefault(tag_id, []).append(position)
+                self._bitmaps.pop(tag_id, None)
+
+    def __len__(self):
+        return len(self._case_ids)
+
+    @property
+    def all_cases(self):
+        # type: () -> int
+        """
+        bitmap with every indexed case in it.
+        """
+        return (1 << len(self._case_ids)) - 1
+
+    def tag(self, tag_id):
+        # type: (int) -> int
+        """
+        :return: bitmap of the cases that have tag_id.
+        """
+        bitmap = self._bitmaps.get(tag_id)
+        if bitmap is None:
+            bits = bytearray((len(self._case_ids) + 7) // 8)
+            for position in self._tag_positions.get(tag_id, ()):
+                bits[position >> 3] |= 1 << (position & 7)
+            bitmap = self._bitmaps[tag_id] = int.from_bytes(bits, 'little')
+        return bitmap
+
+    def any_of(self, tag_ids):
+        # type: (Iterable[int]) -> int
+        """
+        :return: bitmap of the cases that have at least one of tag_ids.
+        """
+        bitmap = 0
+        for tag_id in tag_ids:
+            bitmap |= self.tag(tag_id)
+        return bitmap
+
+    def evaluate(self, case_filter_list):
+        # type: (List[CaseFilter]) -> int
+        """
+        runs a list of CaseFilter's left to right and returns the bitmap of the cases that match.  Each filter is
+        combined with everything before it:
+            ==  has the tag, and'ed with what came before
+            &&  same as ==
+            !=  doesn't have the tag, and'ed with what came before
+            ||  has the tag, or'ed with what came before
+        There's no precedence, [a || b, && c] means (a or b) and c.  The operator of the first filter only matters
+        for != (every case without the tag).  An empty list matches every case.
+        """
+        everything = self.all_cases
+        matches = None
+        for case_filter in case_filter_list:
+            operator = case_filter.operator
+            if operator == Operator.isNotEqual:
+                term = everything & ~self.tag(case_filter.tag_id)
+            elif operator in (Operator.isEqual, Operator.isAnd, Operator.isOr):
+                term = self.tag(case_filter.tag_id)
+            else:
+                raise ValueError("unknown CaseFilter operator: {}.  valid values are {}".format(
+                    operator, [Operator.isAnd, Operator.isOr, Operator.isEqual, Operator.isNotEqual]))
+            if matches is None:
+                matches = term
+            elif operator == Operator.isOr:
+                matches |= term
+            else:
+                matches &= term
+        return everything if matches is None else matches
+
+    def case_ids(self, bitmap):
+        # type: (int) -> List[int]
+        """
+        :return: list of the case ids in a bitmap, in the order the cases were added.
+        """
+        case_ids = self._case_ids
+        # bits as a string, lowest position first
+        bits = bin(bitmap)[:1:-1]
+        found = []
+        position = bits.find('1')
+        while position >= 0:
+            found.append(case_ids[position])
+            position = bits.find('1', position + 1)
+        return found
+
+    def select(self, case_filter_list):
+        # type: (List[CaseFilter]) -> List[int]
+        """
+        :return: list of the ids of the cases that match a list of CaseFilter's.  see evaluate.
+        """
+        return self.case_ids(self.evaluate(case_filter_list))
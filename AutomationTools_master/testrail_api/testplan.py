@@ -1,7 +1,12 @@
+import time
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
 
 from .pytestrail import PyTestRail, APIError, TestStatus
-from ..common.helpers import Helpers as help
+from .result_queue import ResultQueue
+from .result_store import ResultStore, ALL
+from .result_comment import CommentRenderer, upload_overflow_attachments
+from ..common.helpers import Helpers as help, IndexedList
 from typing import List, Dict
 
 
@@ -58,12 +63,24 @@ class CaseFilter():
 
 
 class TestCase:
+    # thousands of these can be alive during a big run, so the attributes set here are slots.  __dict__ is still
+    # there (and stays empty unless used) so code can keep setting its own attributes on a case.
+    __slots__ = ('__dict__', 'number', 'title', 'results', 'step_results', 'step_result_start_indexes',
+                 'steps_updated_with_results', 'custom_fields_dict', 'PASS', 'FAIL', 'ERROR', 'WARNING',
+                 'testrail_comment', 'testrail_formatted_result', 'test_run', '_pending_actual',
+                 '_test_steps', 'overflow_attachment')
+
+    # result category: counter attribute add_result bumps
+    COUNTERS = {'pass': 'PASS', 'warning': 'WARNING', 'fail': 'FAIL', 'error': 'ERROR'}
+
     def __init__(self, number, title="",
-                 test_run=None  # type: TestRun
+                 test_run=None,     # type: TestRun
+                 test_steps=None    # type: List[dict]
                  ):
         self.number = number
         self.title = title
-        self.results = {'pass': [], 'warning': [], 'fail': [], 'error': [], 'all': []}
+        # reads like {'pass': [], 'warning': [], 'fail': [], 'error': [], 'all': []} but keeps each line once
+        self.results = ResultStore()
         self.step_results = None
         self.step_result_start_indexes = None
         self.steps_updated_with_results = False
@@ -74,10 +91,61 @@ class TestCase:
         self.WARNING = 0
         self.testrail_comment = ''
         self.testrail_formatted_result = None
+        # gzip file with the full comment when TestRun.comment_renderer had to cut it.  uploaded by submit_result
+        self.overflow_attachment = None
         self.test_run = test_run
-        self.test_steps = None
-        if isinstance(test_run, TestRun):
-            self.test_steps = test_run.interface.get_case_steps(number, test_run.run_tests)
+        # step content: list of result strings waiting to be joined into that step's "actual".  Joining once when
+        # the steps are read instead of concatenating on every add keeps long cases linear.
+        self._pending_actual = {}
+        self._test_steps = None
+        if test_steps is not None:
+            # already looked up, e.g. by TestRun.build_test_cases
+            self.test_steps = test_steps
+        elif isinstance(test_run, TestRun):
+            if test_run.case_mirror is not None:
+                self.test_steps = test_run.case_mirror.get_case_steps(number)
+            else:
+                self.test_steps = test_run.interface.get_case_steps(number, test_run.run_tests)
+
+    @property
+    def test_steps(self):
+        # type: () -> List[dict]
+        """
+        list of step dicts for the case, with every result added so far joined into the steps' "actual" values.  It's
+        an IndexedList keyed on the step "content", so steps appended to it can be found by name right away.
+        """
+        if self._pending_actual:
+            self._join_pending_actual()
+        return self._test_steps
+
+    @test_steps.setter
+    def test_steps(self, steps):
+        # type: (List[dict]) -> None
+        self._pending_actual = {}
+        # indexed so add_results_to_test_steps finds a step by name without searching every step
+        if isinstance(steps, list) and not isinstance(steps, IndexedList):
+            steps = IndexedList(steps)
+        self._test_steps = steps
+
+    def _join_pending_actual(self):
+        for step_name, actual_parts in self._pending_actual.items():
+            step = self._test_steps.find("content", step_name)
+            if step is not None:
+                step["actual"] = ''.join(actual_parts)
+        self._pending_actual = {}
+
+    def add_result(self, category, line):
+        # type: (str, str) -> None
+        """
+        logs a result line for the case and counts it.
+        :param category: 'pass', 'warning', 'fail' or 'error'.  The line also goes in results['all'].
+        :param line: string result line.
+        """
+        self.results.add(category, line)
+        self.results.add(ALL, line)
+        counter = TestCase.COUNTERS.get(category)
+        if counter:
+            setattr(self, counter, getattr(self, counter) + 1)
 
     def does_step_exist(self, step_name):
         # type: (str) -> bool
@@ -87,10 +155,9 @@ class TestCase:
         :param step_name: string test step name to look for
         :return: bool depending on whether it found the step name or not.
         """
-        if help.find_pair_in_list_of_dicts("content", step_name, self.test_steps, return_index=True) >= 0:
-            return True
-        else:
+        if self._test_steps is None:
             return False
+        return self._test_steps.position("content", step_name) is not None
 
     def add_step_to_end(self, step_name):
         # type: (str) -> None
@@ -99,57 +166,66 @@ class TestCase:
         :param step_name: string name of the test step you want to add.
         """
         new_step = {"content": step_name, "expected": ""}
-        if self.test_steps is not None:
-            self.test_steps.append(new_step)
+        if self._test_steps is not None:
+            self._test_steps.append(new_step)
 
     def save_current_result_indexes(self):
         self.step_result_start_indexes = {}
         for key, value in self.results.items():
             self.step_result_start_indexes.update({key: (len(value))})
 
-    def get_current_step_results(self):
+    def get_current_step_results(self, category=None):
+        # type: (str) -> List[str] or Dict[str, List[str]]
+        """
+        results logged since save_current_result_indexes.
+        :param category: optional. 'pass', 'warning', 'fail', 'error' or 'all'.  Only that category's new lines are
+            built, straight from the result store.  Leave it out for the old dict of every category, which builds all
+            five lists on every call.
+        :return: list of lines for category, or dict of category: list of lines without it.
+        """
+        if category is not None:
+            return self.results.lines(category, self.step_result_start_indexes[category])
         step_results = {}
-        for key, value in self.results.items():
-            step_results.update({key: value[self.step_result_start_indexes[key]:]})
+        for key in self.results:
+            step_results.update({key: self.results.lines(key, self.step_result_start_indexes[key])})
         return step_results
 
     def add_results_to_test_steps(self, step_name, test_status=TestStatus.PASSED):
-        if self.test_steps is not None:
-            step_results = self.get_current_step_results()
-            for step in self.test_steps:
-                if "content" in step:
-                    if step["content"] == step_name:
-                        # found the step, add results and status key value pairs
-                        if "status_id" not in step:
-                            step.update({"status_id": test_status})
-                            self.steps_updated_with_results = True
-                        else:
-                            print("status_id already exists for this step: {}\r\nNot going to overwrite it.  "
-                                        "check this out cause its most likely a bug.".format(step))
-                        if step_results:
-                            if "actual" not in step:
-                                # step.update({"actual": step_results})
-                                all_result_str = '\n'.join(step_results['all'])
-                                step.update({"actual": all_result_str})
-                                self.steps_updated_with_results = True
-                            else:
-                                print("'actual' key already exists in step: {}\r\nIt probably shouldn't be there "
-                                            "unless you actually wanted to append results to the same step?  "
-                                            "Check this out.".format(step))
-                                # appending new step results to existing.
-                                all_result_str = '\n'.join(step_results['all'])
-                                step["actual"] = step["actual"] + all_result_str
-                                self.steps_updated_with_results = True
-                        break
-                    # else:
-                    #     raise ValueError("couldnt find dict entry 'content': {} in the self.test_steps dict: \r\n{}\r\n"
-                    #                      "It needs to be there before getting here.".format(step_name, self.test_steps))
-                else:
-                    raise ValueError("key 'content' doesnt exist in the step dict.  This isn't a valid step.  "
-                                     "step is: {}".format(step))
+        if self._test_steps is not None:
+            step = self._test_steps.find("content", step_name)
+            if step is None:
+                return
+            # found the step, add results and status key value pairs
+            if "status_id" not in step:
+                step.update({"status_id": test_status})
+                self.steps_updated_with_results = True
+            else:
+                print("status_id already exists for this step: {}\r\nNot going to overwrite it.  "
+                      "check this out cause its most likely a bug.".format(self._step_as_it_reads(step, step_name)))
+            # only the 'all' results go into the step so that's the only list we need to slice
+            all_result_str = '\n'.join(self.get_current_step_results(ALL))
+            actual_parts = self._pending_actual.get(step_name)
+            if actual_parts is None and "actual" not in step:
+                self._pending_actual[step_name] = [all_result_str]
+            else:
+                print("'actual' key already exists in step: {}\r\nIt probably shouldn't be there "
+                      "unless you actually wanted to append results to the same step?  "
+                      "Check this out.".format(self._step_as_it_reads(step, step_name)))
+                # appending new step results to existing.
+                if actual_parts is None:
+                    actual_parts = self._pending_actual[step_name] = [step["actual"]]
+                actual_parts.append(all_result_str)
+            self.steps_updated_with_results = True
         else:
             raise ValueError("self.test_steps is None.  Cant add results to a blank set of steps.")
 
+    def _step_as_it_reads(self, step, step_name):
+        # the step with its pending results joined into "actual", the way test_steps would show it
+        actual_parts = self._pending_actual.get(step_name)
+        if actual_parts is None:
+            return step
+        return dict(step, actual=''.join(actual_parts))
+
 
 class TestRun():
     def __init__(self, suite_id             # type: str or int
@@ -161,6 +237,7 @@ class TestRun():
                  , run_header=None          # type: dict
                  , run_tests=None           # type: List[dict]
                  , include_case_ids=None    # type: List[str or int]
+                 , case_mirror=None         # type: TestRailMirror
                  ):
         # check args
         if include_case_ids is None:
@@ -188,9 +265,32 @@ class TestRun():
         self.run_header = run_header
         self.run_tests = run_tests
         self.include_case_ids = include_case_ids
+        # optional mirror.TestRailMirror.  When set, TestCase reads its steps from the local mirror instead of testrail
+        self.case_mirror = case_mirror
+        # background uploader from start_result_queue.  None means submit_result posts each result right away.
+        self.result_queue = None
+        # optional result_comment.CommentRenderer.  When set, result comments are cut down to its size budget and the
+        # full log is attached to the result instead.  None keeps the whole log in the comment.
+        self.comment_renderer = None    # type: CommentRenderer
+        # id (a uuid string) of the plan entry this run was added as, set by PlanBuilder.  TestPlan matches runs to
+        # the add_plan response by it instead of by position when every run has one.
+        self.plan_entry_id = None
         if self.include_case_ids:
             self.strip_case_ids()
 
+    @property
+    def run_tests(self):
+        # type: () -> List[dict]
+        return self._run_tests
+
+    @run_tests.setter
+    def run_tests(self, tests):
+        # type: (List[dict]) -> None
+        # indexed so the per case step lookups in get_case_steps don't search the whole run every time
+        if isinstance(tests, list) and not isinstance(tests, IndexedList):
+            tests = IndexedList(tests)
+        self._run_tests = tests
+
     def strip_case_ids(self):
         if self.include_case_ids:
             for index, item in enumerate(self.include_case_ids):
@@ -230,6 +330,76 @@ class TestRun():
             raise ValueError('the add_run_response is blank.  This doesnt work without a valid response form an '
                              'add_run command.  Consider using the run_from_existing_runID command instead.')
 
+    def build_test_cases(self, case_ids=None, workers=8):
+        # type: (List[str or int], int) -> Dict[int, TestCase]
+        """
+        builds the TestCase objects for many cases of the run at once.  Creating them one at a time looks up each
+        case's steps separately (a search through run_tests or a get_case call per case), which dominates startup
+        for big runs.  Here run_tests is indexed by case id once, and the steps of any case that isn't in run_tests
+        come from one get_all_cases download of the suite, pages fetched in parallel.  With case_mirror set the steps
+        come from the mirror instead.
+        :param case_ids: optional. list of string or integer case ids.  Defaults to every case in the run.
+        :param workers: optional. number of get_cases pages downloaded at the same time.
+        :return: dict of integer case id: TestCase, in case_ids order.
+        """
+        if not self.interface:
+            raise APIError('PyTestRail isn''t initialized.  Need to make sure an instantiated PyTestRail object gets '
+                           'passed to TestRun.interface before the code gets to here')
+        if self.run_tests is None and self.run_id:
+            self.run_tests = self.interface.get_tests_in_run(self.run_id)
+        run_tests = self.run_tests or []
+        if isinstance(run_tests, dict):
+            # paginated response from testrail 6.7+
+            run_tests = run_tests.get('tests', [])
+        # first test wins, same as the old front to back search
+        tests_by_case = {}
+        for test in run_tests:
+            tests_by_case.setdefault(test['case_id'], test)
+        if case_ids is None:
+            case_ids = list(tests_by_case)
+        else:
+            case_ids = [PyTestRail.strip_id(case_id) for case_id in case_ids]
+
+        cases_by_id = {}
+        if self.case_mirror is None and any(
+                "custom_steps_separated" not in tests_by_case.get(case_id, ()) for case_id in case_ids):
+            cases = self.interface.get_all_cases(self.project_id, self.suite_id, workers=workers)
+            cases_by_id = {case['id']: case for case in cases}
+
+        test_cases = {}
+        for case_id in case_ids:
+            if self.case_mirror is not None:
+                case_data = self.case_mirror.get_case(case_id)
+            else:
+                case_data = tests_by_case.get(case_id)
+                if case_data is None or "custom_steps_separated" not in case_data:
+                    case_data = cases_by_id.get(case_id, case_data)
+            if case_data is None:
+                raise ValueError("case id: {} isn't in run {} or suite {}.".format(case_id, self.run_id,
+                                                                                 self.suite_id))
+            if "custom_steps_separated" not in case_data:
+                raise ValueError("custom_steps_separated doesnt exist in case id: {}.  So test case step updates "
+                                 "wont work downstream.".format(case_id))
+            test_cases[case_id] = TestCase(case_id, title=case_data.get('title', ''), test_run=self,
+                                           test_steps=case_data["custom_steps_separated"])
+        return test_cases
+
+    def select_case_ids(self, tag_index):
+        # type: (TagIndex) -> List[int]
+        """
+        picks the cases for the run by running case_filter_list against a tag index.  see TagIndex.evaluate.
+        :param tag_index: tag_index.TagIndex over the cases of the run's suite.
+        :return: list of integer case ids that match case_filter_list plus include_case_ids.  Every indexed case if
+            case_filter_list is None.
+        """
+        case_ids = tag_index.select(self.case_filter_list or [])
+        selected = set(case_ids)
+        for case_id in self.include_case_ids:
+            if case_id not in selected:
+                selected.add(case_id)
+                case_ids.append(case_id)
+        return case_ids
+
     def establish_connection(self, interface_user=None, interface_pwd=None):
         """
         Used to instantiate a pytestrail interface connection if one doesnt already exist.  Normally, an existing
@@ -277,7 +447,11 @@ class TestRun():
             raise ValueError('invalid result type.  I got: {0}.  valid values are nothing or {1}'
                              .format(result_type, good_result_types))
 
-        testrail_comment = self.format_result_comment(finised_testcase, result_type)
+        if self.comment_renderer is not None:
+            testrail_comment, finised_testcase.overflow_attachment = self.comment_renderer.render(finised_testcase,
+                                                                                                 result_type)
+        else:
+            testrail_comment = self.format_result_comment(finised_testcase, result_type)
         if test_case_pass:
             pass_status = self.interface.test_status.PASSED
         else:
@@ -292,6 +466,53 @@ class TestRun():
         return testrail_formatted_result
 
 
+    def start_result_queue(self, max_batch=50, max_delay=5.0):
+        # type: (int, float) -> ResultQueue
+        """
+        starts uploading results from submit_result in batches on a background thread instead of one post per test
+        case.  Call close_result_queue when the run is done, anything left is also sent at interpreter exit.
+        :param max_batch: max number of results per add_test_results call.
+        :param max_delay: max seconds a result waits before its batch is sent.
+        :return: the result_queue.ResultQueue.  Its flush_stats has the size and latency of every upload.
+        """
+        if not self.interface:
+            raise APIError('PyTestRail isn''t initialized.  Need to make sure an instantiated PyTestRail object gets '
+                           'passed to TestRun.interface before the code gets to here')
+        if self.result_queue is None:
+            self.result_queue = ResultQueue(self.interface, self.run_id, max_batch=max_batch, max_delay=max_delay)
+        return self.result_queue
+
+    def close_result_queue(self, timeout=None):
+        # type: (float) -> None
+        """
+        sends every queued result and stops the background uploader.
+        :param timeout: optional. max seconds to wait for the last uploads.
+        """
+        if self.result_queue is not None:
+            self.result_queue.close(timeout)
+            self.result_queue = None
+
+    def submit_result(self, finished_testcase, test_case_pass, result_type='ALL'):
+        # type: (TestCase, bool, str) -> dict
+        """
+        formats the result for a finished test case and sends it to testrail.  If start_result_queue was called the
+        result is queued for the next batch upload.  If not, and update_after_each_testcase is True, it's posted
+        right away.  Otherwise it's only formatted and returned.  If comment_renderer cut the comment, the full log is
+        attached to the result once testrail has created it.
+        :param finished_testcase: the finished TestCase object.
+        :param test_case_pass: bool.  True if pass, False if fail.
+        :param result_type: 'ALL' or 'GROUPED'.  see format_result_comment.
+        :return: the formatted result dict.
+        """
+        result = self.format_testrail_result(finished_testcase, test_case_pass, result_type)
+        finished_testcase.testrail_formatted_result = result
+        if self.result_queue is not None:
+            self.result_queue.put(result, attachment=finished_testcase.overflow_attachment)
+        elif self.update_after_each_testcase:
+            response = self.interface.add_test_results(self.interface.strip_id(self.run_id), [result])
+            upload_overflow_attachments(self.interface, response, [finished_testcase.overflow_attachment])
+        return result
+
     @staticmethod
     def format_result_comment(finished_testcase, result_type):
         """
@@ -301,6 +522,13 @@ class TestRun():
             we're working on currently.
         :return: string of the comment we want to show in testrail for the testcase in question
         """
+        results = finished_testcase.results
+        if isinstance(results, ResultStore):
+            join = results.join
+        else:
+            # someone swapped in a plain dict of lists
+            def join(category):
+                return '\n'.join(results[category])
         if result_type.upper() == 'GROUPED':
             case_comment = 'PASS: {0}\r\n' \
                            'WARNING: {1}\r\n' \
@@ -314,11 +542,10 @@ class TestRun():
                                                    , finished_testcase.WARNING
                                                    , finished_testcase.FAIL
                                                    , finished_testcase.ERROR
-                                                   # , finished_case.results['pass']
-                                                   , '\n'.join(finished_testcase.results['pass'])
-                                                   , '\n'.join(finished_testcase.results['warning'])
-                                                   , '\n'.join(finished_testcase.results['fail'])
-                                                   , '\n'.join(finished_testcase.results['error'])
+                                                   , join('pass')
+                                                   , join('warning')
+                                                   , join('fail')
+                                                   , join('error')
                                                    )
         elif result_type == 'ALL':
             case_comment = 'PASS: {0}\r\n' \
@@ -329,7 +556,7 @@ class TestRun():
                                                     , finished_testcase.WARNING
                                                     , finished_testcase.FAIL
                                                     , finished_testcase.ERROR
-                                                    , '\n'.join(finished_testcase.results['all'])
+                                                    , join('all')
                                                     )
         return case_comment
 
@@ -375,6 +602,9 @@ class TestPlan():
                 self.plan_id = self.add_plan_response['id']
                 self.name = self.add_plan_response['name']
                 self.description = str(self.add_plan_response['description'])
+                if all(test_run.plan_entry_id is not None for test_run in self.test_runs_list):
+                    self.__match_runs_by_entry()
+                    return
                 for idx in range(0, len(self.added_runs)):
                     if self.test_runs_list[idx].suite_id == self.added_runs[idx]['suite_id']:
                         self.test_runs_list[idx].run_id = self.added_runs[idx]['id']
@@ -389,6 +619,24 @@ class TestPlan():
             raise ValueError("The add_plan_response passed into TestPlan is blank.  I received: {}"
                              .format(self.add_plan_response))
 
+    def __match_runs_by_entry(self):
+        # runs of each plan entry in the order testrail returned them.  An entry with configs has several runs, they
+        # go to the test runs with that entry id in test_runs_list order.
+        runs_by_entry = {}
+        for run in self.added_runs:
+            runs_by_entry.setdefault(run['entry_id'], []).append(run)
+        for test_run in self.test_runs_list:
+            entry_runs = runs_by_entry.get(test_run.plan_entry_id)
+            if not entry_runs:
+                raise ValueError("no run left in the plan for entry id {} (suite id {}).  The plan response doesn't "
+                                 "have the entry, or it has fewer runs than test runs with that entry id"
+                                 .format(test_run.plan_entry_id, test_run.suite_id))
+            run = entry_runs.pop(0)
+            if test_run.suite_id != run['suite_id']:
+                raise ValueError("suite id mismatch for entry id {}.  we expect id {} but got {}."
+                                 .format(test_run.plan_entry_id, test_run.suite_id, run['suite_id']))
+            test_run.run_id = run['id']
+
     def __length_check(self):
         if self.test_runs_list and self.add_plan_response:  # make sure both are populated
             expected_length = len(self.test_runs_list)
@@ -414,6 +662,171 @@ class TestPlan():
         pass
 
 
+class PlanBuilder():
+    """
+    Builds a test plan one entry per request instead of in one add_plan call.  The plan is created empty first and
+    the entries are then added with add_plan_entry, up to workers at a time, so a plan with dozens of suite/config
+    entries doesn't hang on (or time out in) one huge request.  Each response is tied to the entry that was sent, so
+    the TestRun's of an entry get their run_id and plan_entry_id no matter what order the entries finish in.
+
+    It's all or nothing.  If an entry still can't be added after its retries the plan is deleted again, build raises
+    APIError and no TestRun is touched, so the result can always go straight into TestPlan.
+
+    example:
+        builder = PlanBuilder(pyt, 27, 'release 1.2 plan', 'all suites for release 1.2')
+        for test_run in test_runs:
+            builder.add_test_run(test_run, 'suite {}'.format(test_run.suite_id), 'release 1.2')
+        add_plan_response = builder.build()
+        test_plan = TestPlan(test_runs, add_plan_response, product_name, product_mac, product_family, firmware, pyt)
+    """
+
+    def __init__(self, interface        # type: PyTestRail
+                 , project_id           # type: int
+                 , name                 # type: str
+                 , description          # type: str
+                 , milestone_id=0       # type: int
+                 , workers=8            # type: int
+                 , retries=2            # type: int
+                 , backoff=1.0          # type: float
+                 ):
+        """
+        :param workers: max number of add_plan_entry calls at the same time.  Keep it at or below the pool_maxsize the
+            PyTestRail object was created with.
+        :param retries: number of times a failed add_plan_entry is retried.
+        :param backoff: seconds to wait before the first retry.  Doubles for every retry after that.
+        """
+        assert isinstance(interface, PyTestRail)
+        self.interface = interface
+        self.project_id = PyTestRail.strip_id(project_id)
+        self.name = name
+        self.description = description
+        self.milestone_id = milestone_id
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        # (entry dict, list of TestRun's for it) in the order they were added
+        self.entries = []
+        # (entry dict, list of TestRun's) of the entries that still failed after their retries, set by a build that
+        # raised
+        self.failed_entries = []
+        self.plan_id = None
+
+    def add_entry(self, entry_dict, test_runs=None):
+        # type: (Dict, List[TestRun] or TestRun) -> None
+        """
+        queues a plan entry.
+        :param entry_dict: entry from PyTestRail.plan_entry_builder.
+        :param test_runs: optional.  TestRun (or list of them, one per run the entry creates, e.g. per config) that
+            gets the run_id of the run this entry creates.
+        """
+        if test_runs is None:
+            test_runs = []
+        elif isinstance(test_runs, TestRun):
+            test_runs = [test_runs]
+        for test_run in test_runs:
+            if test_run.suite_id != entry_dict['suite_id']:
+                raise ValueError("test run suite id {} doesn't match the entry suite id {}"
+                                 .format(test_run.suite_id, entry_dict['suite_id']))
+        self.entries.append((entry_dict, test_runs))
+
+    def add_test_run(self, test_run, name, description, case_ids=None, config_ids=None, assignedto_id=0):
+        # type: (TestRun, str, str, List[int], List[int], int) -> None
+        """
+        queues a plan entry for a TestRun's suite.  see PyTestRail.plan_entry_builder for the args.  case_ids
+        defaults to the test run's include_case_ids, or every case in the suite if it has none.
+        """
+        if case_ids is None:
+            case_ids = list(test_run.include_case_ids)
+        entry_dict = self.interface.plan_entry_builder(test_run.suite_id, name, description,
+                                                       assignedto_id=assignedto_id, case_ids=case_ids,
+                                                       config_ids=config_ids)
+        self.add_entry(entry_dict, test_run)
+
+    @staticmethod
+    def _matches(entry_dict, plan_entry):
+        # True if plan_entry (from get_plan) is what adding entry_dict would have created
+        if plan_entry['suite_id'] != entry_dict['suite_id'] or plan_entry['name'] != entry_dict['name']:
+            return False
+        config_ids = set()
+        for run in plan_entry['runs']:
+            config_ids.update(run.get('config_ids') or [])
+        return config_ids == set(entry_dict.get('config_ids') or [])
+
+    def _retry_plan_entry(self, entry_dict, claimed):
+        """
+        retries a failed add_plan_entry.  add_plan_entry isn't idempotent and a request that failed (e.g. timed out)
+        may have added the entry anyway, so the plan is read again before every retry and an entry that matches
+        entry_dict and isn't claimed by another queued entry is taken instead of adding a second one.  Only call it
+        when no other add_plan_entry is in flight for the plan.
+        :param claimed: ids of the plan entries that already belong to a queued entry.  The one returned is added.
+        """
+        for attempt in range(self.retries):
+            time.sleep(self.backoff * 2 ** attempt)
+            plan = self.interface.get_plan(self.plan_id)
+            if not plan:
+                continue
+            for plan_entry in plan['entries']:
+                if plan_entry['id'] not in claimed and self._matches(entry_dict, plan_entry):
+                    claimed.add(plan_entry['id'])
+                    return plan_entry
+            response = self.interface.add_plan_entry(self.plan_id, entry_dict)
+            if response:
+                claimed.add(response['id'])
+                return response
+        return None
+
+    def build(self):
+        # type: () -> Dict
+        """
+        creates the plan and adds every queued entry, then sets run_id and plan_entry_id on the queued TestRun's.
+        :return: the plan in the same format as an add_plan/get_plan response, with the entries in the order they were
+            queued.  Raises APIError if the plan couldn't be created or an entry still failed after its retries.  In
+            that case the partial plan is deleted, the failed entries are in failed_entries and no TestRun is changed.
+        """
+        plan = self.interface.add_plan(self.name, self.description, self.project_id, [], self.milestone_id)
+        if not plan:
+            raise APIError("couldn't create plan {0} in project {1}.  See the error printed above."
+                           .format(self.name, self.project_id))
+        self.plan_id = plan['id']
+        self.failed_entries = []
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            # map keeps each response next to the entry it came from
+            responses = list(pool.map(lambda entry: self.interface.add_plan_entry(self.plan_id, entry[0]),
+                                      self.entries))
+        # retried one at a time once nothing else is in flight, so an entry found in the plan can only be from a
+        # failed request of a queued entry that isn't claimed yet
+        claimed = set(response['id'] for response in responses if response)
+        for index, (entry_dict, test_runs) in enumerate(self.entries):
+            if not responses[index]:
+                responses[index] = self._retry_plan_entry(entry_dict, claimed)
+                if not responses[index]:
+                    self.failed_entries.append((entry_dict, test_runs))
+        if self.failed_entries:
+            self._abandon("adding the entries for suites {0} to plan {1} failed.  See the errors printed above."
+                          .format([entry_dict['suite_id'] for entry_dict, test_runs in self.failed_entries],
+                                  self.plan_id))
+        runs_for_test_runs = []
+        for (entry_dict, test_runs), response in zip(self.entries, responses):
+            runs = list(response['runs'])
+            if len(runs) < len(test_runs):
+                self._abandon("plan entry {} for suite {} created fewer runs than test runs were given for it"
+                              .format(response['id'], entry_dict['suite_id']), ValueError)
+            runs_for_test_runs.append(runs)
+        for (entry_dict, test_runs), response, runs in zip(self.entries, responses, runs_for_test_runs):
+            for test_run, run in zip(test_runs, runs):
+                test_run.run_id = run['id']
+                test_run.plan_entry_id = response['id']
+        plan['entries'] = responses
+        return plan
+
+    def _abandon(self, message, error_type=APIError):
+        # deletes the half built plan and raises
+        if self.interface.delete_plan(self.plan_id) is None:
+            message += "  Deleting the partial plan {0} failed too, delete it by hand.".format(self.plan_id)
+        self.plan_id = None
+        raise error_type(message)
+
+
 if __name__ == '__main__':
     add_plan_response = {u'is_completed': False, u'custom_status3_count': 0, u'created_on': 1581614559, u'retest_count': 0, u'id': 5233, u'created_by': 45, u'passed_count': 0, u'project_id': 27, u'custom_status6_count': 0, u'failed_count': 0, u'description': u'programatically added plan 1 description', u'custom_status5_count': 0, u'entries': [{u'runs': [{u'include_all': True, u'is_completed': False, u'custom_status3_count': 0, u'created_on': 1581614559, u'entry_id': u'9d826640-37a0-4275-9d63-f2fe8f01d893', u'retest_count': 0, u'id': 5234, u'plan_id': 5233, u'created_by': 45, u'passed_count': 0, u'project_id': 27, u'config': None, u'custom_status6_count': 0, u'failed_count': 0, u'description': u'programatically added run 1 description', u'custom_status5_count': 0, u'suite_id': 2552, u'milestone_id': None, u'name': u'programatically added run 1', u'assignedto_id': None, u'blocked_count': 0, u'completed_on': None, u'config_ids': [], u'url': u'https://testrail.control4.com/index.php?/runs/view/5234', u'custom_status4_count': 0, u'untested_count': 16, u'custom_status2_count': 0, u'entry_index': 1, u'custom_status1_count': 0, u'custom_status7_count': 0}], u'suite_id': 2552, u'id': u'9d826640-37a0-4275-9d63-f2fe8f01d893', u'name': u'programatically added run 1'}, {u'runs': [{u'include_all': True, u'is_completed': False, u'custom_status3_count': 0, u'created_on': 1581614559, u'entry_id': u'515d9ecf-1060-4e28-8a80-e57af86e4060', u'retest_count': 0, u'id': 5235, u'plan_id': 5233, u'created_by': 45, u'passed_count': 0, u'project_id': 27, u'config': None, u'custom_status6_count': 0, u'failed_count': 0, u'description': u'programatically added run 2 description', u'custom_status5_count': 0, u'suite_id': 2684, u'milestone_id': None, u'name': u'programatically added run 2', u'assignedto_id': None, u'blocked_count': 0, u'completed_on': None, u'config_ids': [], u'url': u'https://testrail.control4.com/index.php?/runs/view/5235', u'custom_status4_count': 0, u'untested_count': 411, u'custom_status2_count': 0, u'entry_index': 2, u'custom_status1_count': 0, u'custom_status7_count': 0}], u'suite_id': 2684, u'id': u'515d9ecf-1060-4e28-8a80-e57af86e4060', u'name': u'programatically added run 2'}, {u'runs': [{u'include_all': True, u'is_completed': False, u'custom_status3_count': 0, u'created_on': 1581614559, u'entry_id': u'5dd55cc2-1808-4aca-8cb6-20a9295871c8', u'retest_count': 0, u'id': 5236, u'plan_id': 5233, u'created_by': 45, u'passed_count': 0, u'project_id': 27, u'config': None, u'custom_status6_count': 0, u'failed_count': 0, u'description': u'programatically added run 3 description', u'custom_status5_count': 0, u'suite_id': 2684, u'milestone_id': None, u'name': u'programatically added run 3', u'assignedto_id': None, u'blocked_count': 0, u'completed_on': None, u'config_ids': [], u'url': u'https://testrail.control4.com/index.php?/runs/view/5236', u'custom_status4_count': 0, u'untested_count': 411, u'custom_status2_count': 0, u'entry_index': 3, u'custom_status1_count': 0, u'custom_status7_count': 0}], u'suite_id': 2684, u'id': u'5dd55cc2-1808-4aca-8cb6-20a9295871c8', u'name': u'programatically added run 3'}], u'milestone_id': None, u'name': u'programatically added test plan 1', u'assignedto_id': None, u'blocked_count': 0, u'completed_on': None, u'url': u'https://testrail.control4.com/index.php?/plans/view/5233', u'custom_status4_count': 0, u'untested_count': 838, u'custom_status2_count': 0, u'custom_status1_count': 0, u'custom_status7_count': 0}
 
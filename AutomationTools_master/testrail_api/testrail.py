@@ -11,20 +11,119 @@
 # Copyright Gurock Software GmbH. See license.md for details.
 #
 
-import requests
 import json
 import base64
+import threading
 from sys import version_info
 
+# requests isn't imported until the first request goes out (see APIClient.session).  It takes longer to import than
+# everything else here put together, and plenty of code imports this module without ever sending a request.
+
 
 class APIClient:
-    def __init__(self, base_url):
-        self.user = ''
-        self.password = ''
+    def __init__(self, base_url, pool_connections=10, pool_maxsize=10, pool_block=False, connect_timeout=10.0,
+                 read_timeout=120.0):
+        """
+        Sets up the api url and a pooled keep-alive connection to testrail.  Every request made through this client
+        reuses connections from one shared pool instead of opening a new TCP/TLS connection per call.
+        :type base_url: str
+        :type pool_connections: int
+        :type pool_maxsize: int
+        :type pool_block: bool
+        :type connect_timeout: float
+        :type read_timeout: float
+        :param base_url: url to the testrail instance.
+        :param pool_connections: number of per-host connection pools to keep.  One is enough unless you point the
+            client at more than one testrail host.
+        :param pool_maxsize: max number of connections kept open per host.  Set this to at least the number of
+            threads that share the client.
+        :param pool_block: if True, a thread waits for a free connection when all pool_maxsize connections are busy.
+            If False (default), an extra throwaway connection is opened instead.
+        :param connect_timeout: seconds to wait for a connection to testrail.  None waits forever.
+        :param read_timeout: seconds to wait for testrail to send a response.  None waits forever.
+        """
+        self.__user = ''
+        self.__password = ''
+        self.__auth_header = ''
         if not base_url.endswith('/'):
             base_url += '/'
         self.__url = base_url + 'index.php?/api/v2/'
         self.current_python_version = version_info.major
+        self.timeout = (connect_timeout, read_timeout)
+        # the adapter owns the connection pool and is safe to share between threads.  requests.Session isn't (its
+        # cookie jar and redirect state aren't locked) so each thread gets its own session mounted on this adapter.
+        self.__pool_settings = {'pool_connections': pool_connections, 'pool_maxsize': pool_maxsize,
+                                'pool_block': pool_block}
+        self.__adapter = None   # created with the first session
+        self.__local = threading.local()
+        self.__sessions = []
+        self.__sessions_lock = threading.Lock()
+
+    @property
+    def user(self):
+        return self.__user
+
+    @user.setter
+    def user(self, value):
+        self.__user = value
+        self.__auth_header = self.__build_auth_header()
+
+    @property
+    def password(self):
+        return self.__password
+
+    @password.setter
+    def password(self, value):
+        self.__password = value
+        self.__auth_header = self.__build_auth_header()
+
+    def __build_auth_header(self):
+        """
+        builds the Basic auth header value once when user or password change instead of on every request.
+        """
+        if self.current_python_version == 2:
+            auth = base64.b64encode('%s:%s' % (self.__user, self.__password))
+        else:
+            auth = str(
+                base64.b64encode(
+                    bytes('%s:%s' % (self.__user, self.__password), 'utf-8')
+                ),
+                'ascii'
+            ).strip()
+        return 'Basic ' + auth
+
+    @property
+    def session(self):
+        """
+        returns the keep-alive session for the calling thread.  All sessions share the same connection pool.
+        :rtype: requests.Session
+        """
+        session = getattr(self.__local, 'session', None)
+        if session is None:
+            import requests
+            session = requests.Session()
+            with self.__sessions_lock:
+                if self.__adapter is None:
+                    from requests.adapters import HTTPAdapter
+                    self.__adapter = HTTPAdapter(**self.__pool_settings)
+                session.mount('https://', self.__adapter)
+                session.mount('http://', self.__adapter)
+                self.__sessions.append(session)
+            self.__local.session = session
+        return session
+
+    def close(self):
+        """
+        closes every pooled connection.  The client can still be used afterwards, it just reconnects.
+        """
+        with self.__sessions_lock:
+            sessions = self.__sessions
+            self.__sessions = []
+        for session in sessions:
+            session.close()
+        self.__local = threading.local()
+        if self.__adapter is not None:
+            self.__adapter.close()
 
     def send_get(self, uri, filepath=None):
         """
@@ -54,39 +153,68 @@ class APIClient:
         """
         return self.__send_request('POST', uri, data)
 
+    @staticmethod
+    def __request(session, method, url, **kwargs):
+        """
+        sends the request over the pooled session.  Connection failures and timeouts are raised as APIError so callers
+        handle them the same way as an error response from testrail.
+        """
+        import requests
+        try:
+            return session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as error:
+            raise APIError('TestRail API request failed: %s %s (%s)' % (method, url, error),
+                           request_sent=not APIClient.__never_connected(error))
+
+    @staticmethod
+    def __never_connected(error):
+        """
+        True if the request failed before a connection to testrail was made, so testrail can't have seen it.  Read
+        timeouts and dropped connections are False, the request may have been handled anyway.
+        """
+        import requests
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+            from urllib3.exceptions import ConnectTimeoutError
+            # refused connections and failed dns lookups come wrapped in urllib3's MaxRetryError.  NewConnectionError
+            # is a ConnectTimeoutError.
+            return isinstance(getattr(error.args[0], 'reason', None), ConnectTimeoutError)
+        return False
+
     def __send_request(self, method, uri, data):
         """
         This is the function that handles comms with testrail.  It checks the python version this is being run against
-        first and uses the correct code for each.
+        first and uses the correct code for each.  Requests go out over the calling thread's pooled session.
         """
         url = self.__url + uri
+        session = self.session
+        headers = {'Authorization': self.__auth_header}
 
         if self.current_python_version == 2:
             # if using python version 2.x
             # print('using python 2 __send_request')
-
-            auth = base64.b64encode('%s:%s' % (self.user, self.password))
-            headers = {'Authorization': 'Basic ' + auth}
-
             if method == 'POST':
                 if uri[:14] == 'add_attachment':    # add_attachment API method
                     files = {'attachment': (open(data, 'rb'))}
-                    response = requests.post(url, headers=headers, files=files)
+                    response = self.__request(session, 'POST', url, headers=headers, files=files, timeout=self.timeout)
                     files['attachment'].close()
                 else:
                     headers['Content-Type'] = 'application/json'
                     payload = bytes(json.dumps(data))
-                    response = requests.post(url, headers=headers, data=payload)
+                    response = self.__request(session, 'POST', url, headers=headers, data=payload, timeout=self.timeout)
             else:
                 headers['Content-Type'] = 'application/json'
-                response = requests.get(url, headers=headers)
+                response = self.__request(session, 'GET', url, headers=headers, timeout=self.timeout)
 
             if response.status_code > 201:
                 try:
                     error = response.json()
-                    raise APIError('TestRail API returned HTTP %s (%s)' % (response.status_code, error))
+                    raise APIError('TestRail API returned HTTP %s (%s)' % (response.status_code, error),
+                               status_code=response.status_code)
                 except:     # response.content not formatted as JSON
-                    raise APIError('TestRail API returned HTTP %s (%s)' % (response.status_code, response.content))
+                    raise APIError('TestRail API returned HTTP %s (%s)' % (response.status_code, response.content),
+                               status_code=response.status_code)
             else:
                 if uri[:15] == 'get_attachment/':  # Expecting file, not JSON
                     try:
@@ -103,33 +231,26 @@ class APIClient:
         elif self.current_python_version == 3:
             # if using python version 3.x
             # print('using python3 __send_request')
-            auth = str(
-                base64.b64encode(
-                    bytes('%s:%s' % (self.user, self.password), 'utf-8')
-                ),
-                'ascii'
-            ).strip()
-            headers = {'Authorization': 'Basic ' + auth}
-
             if method == 'POST':
                 if uri[:14] == 'add_attachment':  # add_attachment API method
                     files = {'attachment': (open(data, 'rb'))}
-                    response = requests.post(url, headers=headers, files=files)
+                    response = self.__request(session, 'POST', url, headers=headers, files=files, timeout=self.timeout)
                     files['attachment'].close()
                 else:
                     headers['Content-Type'] = 'application/json'
                     payload = bytes(json.dumps(data), 'utf-8')
-                    response = requests.post(url, headers=headers, data=payload)
+                    response = self.__request(session, 'POST', url, headers=headers, data=payload, timeout=self.timeout)
             else:
                 headers['Content-Type'] = 'application/json'
-                response = requests.get(url, headers=headers)
+                response = self.__request(session, 'GET', url, headers=headers, timeout=self.timeout)
 
             if response.status_code > 201:
                 try:
                     error = response.json()
                 except:  # response.content not formatted as JSON
                     error = str(response.content)
-                raise APIError('TestRail API returned HTTP %s (%s)' % (response.status_code, error))
+                raise APIError('TestRail API returned HTTP %s (%s)' % (response.status_code, error),
+                               status_code=response.status_code)
             else:
                 if uri[:15] == 'get_attachment/':  # Expecting file, not JSON
                     try:
@@ -160,7 +281,15 @@ class APIClient:
 
 
 class APIError(Exception):
-    pass
+    def __init__(self, message='', status_code=None, request_sent=True):
+        """
+        :param status_code: HTTP status testrail answered with.  None if the error isn't an error response.
+        :param request_sent: False only if the request provably never reached testrail (no connection could be
+            made), so sending it again can't do anything twice.
+        """
+        Exception.__init__(self, message)
+        self.status_code = status_code
+        self.request_sent = request_sent
 
 if __name__ == '__main__':
     client = APIClient('https://testrail.control4.com/')
@@ -1,25 +1,56 @@
+# keep the imports here to what parsing the arguments needs.  The testrail modules (and requests under them) are
+# imported inside the functions that use them, so --help and bad arguments don't pay for them.
 import argparse
-from AutomationTools_master.testrail_api.pytestrail import PyTestRail
+import sys
 
 parser = argparse.ArgumentParser()
 parser._action_groups.pop()
+parser.add_argument('--testrail_url', default=None, help='defaults to the company testrail')
 parser.add_argument('--project_id', default=None)
 parser.add_argument('--suite_id', default=None)
 parser.add_argument('--testrun_name', default=None)
 parser.add_argument('--include_all_cases', default=None)
 parser.add_argument("--list", nargs="+", default=[])
+parser.add_argument('--case_file', default=None,
+                    help='file of case ids, one per line or comma separated.  - reads them from stdin.')
+parser.add_argument('--chunk_size', type=int, default=None,
+                    help='runs with more cases than this are created with add_run and then chunked update_run calls.'
+                         '  default 5000')
+parser.add_argument('--rerun_from', default=None,
+                    help='run id.  creates a run with the cases of this run that have one of --statuses')
+parser.add_argument('--statuses', nargs="+", default=['failed', 'retest', 'blocked'],
+                    help='status names or ids for --rerun_from.  default failed retest blocked')
+parser.add_argument('--manifest', default=None,
+                    help='json, yaml or csv file of runs to create.  Prints the created run ids as json.')
+parser.add_argument('--concurrency', type=int, default=4, help='max runs created at the same time with --manifest')
+parser.add_argument('--serve', default=None, metavar='ADDRESS',
+                    help='run as a daemon on a unix socket path or [host:]port, see testrail_api/daemon.py')
+parser.add_argument('--daemon', default=None, metavar='ADDRESS',
+                    help='send run and --manifest requests to the daemon on ADDRESS instead of straight to testrail')
 args = parser.parse_args()
+if args.case_file and args.list:
+    parser.error('use --list or --case_file, not both')
+if args.rerun_from and args.daemon:
+    parser.error("--rerun_from isn't supported with --daemon.  run it without --daemon")
 
 
-def testrailReport():
-    testrailObj = PyTestRail('testautomation@snapone.com', 'EYDXwyN8BuZ3hwMIXBGN-2C.xsEiCCvkOWnZ/L89Y')
+def testrailReport(**kwargs):
+    from AutomationTools_master.testrail_api.pytestrail import PyTestRail
+    if args.testrail_url:
+        kwargs['testrail_url'] = args.testrail_url
+    testrailObj = PyTestRail('testautomation@snapone.com', 'EYDXwyN8BuZ3hwMIXBGN-2C.xsEiCCvkOWnZ/L89Y', **kwargs)
     # testrailObj = testrailClass.testrail_integration()
     return testrailObj
 
 
 def testRunID():
     # args2 = parser.parse_args()
-    testrailReport = testrailObj = PyTestRail('testautomation@snapone.com', 'EYDXwyN8BuZ3hwMIXBGN-2C.xsEiCCvkOWnZ/L89Y')
+    if args.daemon:
+        return daemonTestRunID()
+    from AutomationTools_master.testrail_api.pytestrail import RUN_CASE_CHUNK_SIZE
+    testrailObj = testrailReport()
+    if args.case_file or len(args.list) > (args.chunk_size or RUN_CASE_CHUNK_SIZE):
+        return chunkedTestRunID(testrailObj)
     project_id = args.project_id
     suite_id = args.suite_id
     test_run_name = args.testrun_name
@@ -28,22 +59,126 @@ def testRunID():
     else:
         all_cases = False
     all_cases = True if len(args.list) == 0 else False
-    response2 = testrailReport.add_run(project_id
-                                       , suite_id
-                                       , test_run_name
-                                       , 'Test run created using the TestRail.'  # required.  test run description
-                                       , include_all_cases=all_cases
-                                       , case_ids=args.list
-                                       # optional.  This is already defaulted to True i only included it here for visibility.  not required for this example
-                                       # , milestone_id='Some meaningful milestone'# optional.  use if you want to link this test run to a milestone
-                                       # , assignedto_id=152# optional.  use this if you want to assign the run to a particular user
-                                       )
+    response2 = testrailObj.add_run(project_id
+                                    , suite_id
+                                    , test_run_name
+                                    , 'Test run created using the TestRail.'  # required.  test run description
+                                    , include_all_cases=all_cases
+                                    , case_ids=args.list
+                                    # optional.  This is already defaulted to True i only included it here for visibility.  not required for this example
+                                    # , milestone_id='Some meaningful milestone'# optional.  use if you want to link this test run to a milestone
+                                    # , assignedto_id=152# optional.  use this if you want to assign the run to a particular user
+                                    )
     print('testrail response: {}'.format(response2))
     testRunID = response2['id']
     return testRunID
 
 
+def chunkedTestRunID(testrailObj):
+    """creates the run from --case_file (or a --list longer than --chunk_size) without holding the ids in argv.  The
+    ids are read as a stream and sent chunk_size at a time, see PyTestRail.add_run_chunked."""
+    from AutomationTools_master.testrail_api.pytestrail import RUN_CASE_CHUNK_SIZE
+    from AutomationTools_master.testrail_api.run_generator import read_case_ids
+    chunk_size = args.chunk_size or RUN_CASE_CHUNK_SIZE
+    if args.case_file == '-':
+        case_file = sys.stdin
+    elif args.case_file:
+        case_file = open(args.case_file, 'r', encoding='utf-8', newline='')
+    else:
+        case_file = args.list
+    try:
+        response2 = testrailObj.add_run_chunked(args.project_id, args.suite_id, args.testrun_name,
+                                                'Test run created using the TestRail.', read_case_ids(case_file),
+                                                chunk_size=chunk_size)
+    finally:
+        if case_file is not sys.stdin and case_file is not args.list:
+            case_file.close()
+    print('testrail response: {}'.format(response2))
+    testRunID = response2['id']
+    return testRunID
+
+
+def rerunTestRunID():
+    """creates a run with the cases of --rerun_from whose tests have one of --statuses, in the same project and suite.
+    --testrun_name overrides the default name.
+    :return: exit code.  0 if the run was created or there was nothing to rerun."""
+    from AutomationTools_master.testrail_api.pytestrail import TestStatus, RUN_CASE_CHUNK_SIZE
+    status_ids = []
+    for status in args.statuses:
+        if status.isdigit():
+            status_ids.append(int(status))
+        elif hasattr(TestStatus, status.upper()):
+            status_ids.append(getattr(TestStatus, status.upper()))
+        else:
+            parser.error('unknown status {}.  use an id or one of passed, blocked, untested, retest, failed'
+                         .format(status))
+    testrailObj = testrailReport()
+    response2 = testrailObj.add_rerun_run(args.rerun_from, status_ids, name=args.testrun_name,
+                                          chunk_size=args.chunk_size or RUN_CASE_CHUNK_SIZE)
+    print('testrail response: {}'.format(response2))
+    if response2 == {}:
+        print('no tests in run {} with status {}, no rerun run created'.format(args.rerun_from, status_ids))
+        return 0
+    return 0 if response2 else 1
+
+
+def daemonTestRunID():
+    """same as testRunID but the run is created by the --daemon."""
+    from AutomationTools_master.testrail_api.daemon_client import DaemonClient
+    case_ids = args.list
+    if args.case_file:
+        from AutomationTools_master.testrail_api.run_generator import read_case_ids
+        if args.case_file == '-':
+            case_ids = list(read_case_ids(sys.stdin))
+        else:
+            with open(args.case_file, 'r', encoding='utf-8', newline='') as case_file:
+                case_ids = list(read_case_ids(case_file))
+    response2 = DaemonClient(args.daemon).create_run(args.project_id, args.suite_id, args.testrun_name,
+                                                     case_ids=case_ids or None)
+    print('testrail response: {}'.format(response2))
+    testRunID = response2['run_id']
+    return testRunID
+
+
+def serveDaemon():
+    """runs the run generator daemon on --serve until it's stopped."""
+    from AutomationTools_master.testrail_api.cache import ResponseCache
+    from AutomationTools_master.testrail_api.daemon import RunGeneratorDaemon
+    from AutomationTools_master.testrail_api.pytestrail import RUN_CASE_CHUNK_SIZE
+    concurrency = max(1, args.concurrency)
+    testrailObj = testrailReport(pool_maxsize=max(16, 2 * concurrency), cache=ResponseCache())
+    RunGeneratorDaemon(testrailObj, concurrency=concurrency,
+                       chunk_size=args.chunk_size or RUN_CASE_CHUNK_SIZE).serve(args.serve)
+
+
+def manifestRuns():
+    """creates every run in the --manifest file and prints a json list of {name, project_id, suite_id, run_id, error}
+    to stdout.  Anything else that gets printed goes to stderr so stdout stays parseable.
+    :return: exit code.  1 if any run failed."""
+    import contextlib
+    import json
+    from AutomationTools_master.testrail_api.pytestrail import RUN_CASE_CHUNK_SIZE
+    from AutomationTools_master.testrail_api.run_generator import load_manifest, create_runs
+    concurrency = max(1, args.concurrency)
+    entries = load_manifest(args.manifest)
+    if args.daemon:
+        from AutomationTools_master.testrail_api.daemon_client import DaemonClient
+        results = DaemonClient(args.daemon).create_runs(entries, concurrency=concurrency)
+    else:
+        testrailObj = testrailReport(pool_maxsize=max(10, concurrency))
+        with contextlib.redirect_stdout(sys.stderr):
+            results = create_runs(testrailObj, entries, concurrency=concurrency,
+                                  chunk_size=args.chunk_size or RUN_CASE_CHUNK_SIZE)
+    print(json.dumps(results, indent=2))
+    return 1 if any(result['error'] for result in results) else 0
+
 
 if __name__ == "__main__":
     """create testrail run"""
+    if args.serve:
+        sys.exit(serveDaemon())
+    if args.manifest:
+        sys.exit(manifestRuns())
+    if args.rerun_from:
+        sys.exit(rerunTestRunID())
     testRunID()
@@ -0,0 +1,63 @@
+"""
+per call overhead of the argument type checks that PyTestRail runs on every get_run/get_test/get_case/... call.
+
+run from the repo root:
+    python -m benchmarks.bench_check_arg_types [--calls 1000000]
+"""
+import argparse
+import timeit
+
+from AutomationTools_master.common.helpers import Helpers
+
+
+def legacy_check_arg_types(function_name, arguments_and_types):
+    # Helpers.check_arg_types before the type cache and on/off switch
+    errors = []
+    position = 0
+    for arg_and_type in arguments_and_types:
+        position += 1
+        arg = arg_and_type[0]
+        typ = arg_and_type[1]
+        if type(typ) == tuple:
+            if None in typ:
+                typ_list = list(typ)
+                typ_list = [type(None) if v is None else v for v in typ_list]
+                typ = tuple(typ_list)
+        if typ == None:
+            typ = type(None)
+        if not isinstance(arg, typ):
+            errors.append(function_name)
+    if len(errors) > 0:
+        raise ValueError(errors)
+    else:
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=1000000, help='calls timed per variant')
+    args = parser.parse_args()
+
+    case_id, case_list = 'C1263027', []
+    validator = Helpers.arg_validator('get_case_steps', (str, int), (list, None))
+    variants = [
+        ('legacy check_arg_types',
+         lambda: legacy_check_arg_types('get_case_steps', [[case_id, (str, int)], [case_list, (list, None)]])),
+        ('check_arg_types',
+         lambda: Helpers.check_arg_types('get_case_steps', [[case_id, (str, int)], [case_list, (list, None)]])),
+        ('arg_validator', lambda: validator(case_id, case_list)),
+        ('no check (baseline)', lambda: True),
+    ]
+    baseline = min(timeit.repeat(variants[-1][1], number=args.calls, repeat=3)) / args.calls
+    for enabled in (True, False):
+        Helpers.set_arg_checking(enabled)
+        print('arg checking {}:'.format('on' if enabled else 'off'))
+        for name, call in variants:
+            seconds = min(timeit.repeat(call, number=args.calls, repeat=3)) / args.calls
+            print('  {:<24} {:7.1f} ns/call  ({:+.1f} ns over baseline)'.format(
+                name, seconds * 1e9, (seconds - baseline) * 1e9))
+    Helpers.set_arg_checking(True)
+
+
+if __name__ == '__main__':
+    main()
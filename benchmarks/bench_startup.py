@@ -0,0 +1,100 @@
+"""
+time from starting `python __main__.py` to its first request reaching testrail, against a local stand-in server that
+answers every call with {"id": 1}.  Also checks that `__main__.py --help` doesn't import requests or the testrail
+modules.  Exits with 1 if the median time is over --max-ms or --help imports them, so CI can run it as a check.
+
+run from the repo root:
+    python -m benchmarks.bench_startup [--runs 10] [--max-ms 400]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(REPO_ROOT, '__main__.py')
+
+# modules --help shouldn't need
+HEAVY_MODULES = ('requests', 'urllib3', 'AutomationTools_master.testrail_api.pytestrail')
+
+
+class _FirstRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    first_request = None
+
+    def log_message(self, *args):
+        pass
+
+    def _answer(self):
+        if _FirstRequestHandler.first_request is None:
+            _FirstRequestHandler.first_request = time.perf_counter()
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'id': 1}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _answer
+    do_POST = _answer
+
+
+def time_to_first_request(server_url):
+    _FirstRequestHandler.first_request = None
+    command = [sys.executable, MAIN, '--testrail_url', server_url, '--project_id', '1', '--suite_id', '1',
+               '--testrun_name', 'startup benchmark']
+    started = time.perf_counter()
+    subprocess.run(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, check=True)
+    if _FirstRequestHandler.first_request is None:
+        raise RuntimeError('__main__.py exited without sending a request')
+    return _FirstRequestHandler.first_request - started
+
+
+def help_imports():
+    # -X importtime writes one line per imported module to stderr
+    completed = subprocess.run([sys.executable, '-X', 'importtime', MAIN, '--help'], cwd=REPO_ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imported = {line.rsplit('|', 1)[-1].strip() for line in completed.stderr.splitlines() if '|' in line}
+    return [module for module in HEAVY_MODULES if module in imported]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='number of times __main__.py is started')
+    parser.add_argument('--max-ms', type=float, default=400.0, help='fail if the median is slower than this')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FirstRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server_url = 'http://127.0.0.1:{}/'.format(server.server_port)
+    try:
+        # one untimed run so the .pyc files exist
+        time_to_first_request(server_url)
+        times = [time_to_first_request(server_url) for _ in range(args.runs)]
+    finally:
+        server.shutdown()
+
+    median_ms = statistics.median(times) * 1000
+    print('time to first request over {} runs:  median {:.1f} ms  min {:.1f} ms  max {:.1f} ms'.format(
+        args.runs, median_ms, min(times) * 1000, max(times) * 1000))
+    failed = False
+    if median_ms > args.max_ms:
+        print('FAIL: median is over --max-ms {:.0f} ms'.format(args.max_ms))
+        failed = True
+    heavy = help_imports()
+    if heavy:
+        print('FAIL: __main__.py --help imports {}'.format(', '.join(heavy)))
+        failed = True
+    else:
+        print('__main__.py --help imports none of {}'.format(', '.join(HEAVY_MODULES)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
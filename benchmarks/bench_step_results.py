@@ -0,0 +1,66 @@
+"""
+steps per second for TestCase step result building on one long case.
+
+run from the repo root:
+    python -m benchmarks.bench_step_results [--steps 10000] [--lines 20] [--legacy]
+
+--legacy also times the old list scan + string concatenation algorithm on the same data for comparison.
+"""
+import argparse
+import time
+
+from AutomationTools_master.testrail_api.testplan import TestCase
+
+
+def legacy_add_results_to_test_steps(test_case, step_name, test_status=1):
+    # the TestCase.add_results_to_test_steps loop from before the step index, minus the warnings
+    step_results = test_case.get_current_step_results()
+    for step in test_case.test_steps:
+        if step["content"] == step_name:
+            if "status_id" not in step:
+                step.update({"status_id": test_status})
+            all_result_str = '\n'.join(step_results['all'])
+            if "actual" not in step:
+                step.update({"actual": all_result_str})
+            else:
+                step["actual"] = step["actual"] + all_result_str
+            break
+
+
+def run_case(step_count, lines_per_step, add_results):
+    test_case = TestCase(1)
+    test_case.test_steps = [{"content": "step {}".format(step), "expected": ""} for step in range(step_count)]
+    start = time.perf_counter()
+    for step in range(step_count):
+        step_name = "step {}".format(step)
+        test_case.save_current_result_indexes()
+        for line in range(lines_per_step):
+            result = "{} line {}".format(step_name, line)
+            test_case.add_result('pass', result)
+        add_results(test_case, step_name)
+    # reading the steps is what joins the buffered results, so it's part of the cost
+    steps = test_case.test_steps
+    seconds = time.perf_counter() - start
+    assert steps[-1]["actual"].startswith("step {} line 0".format(step_count - 1))
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--steps', type=int, default=10000, help='number of steps in the case')
+    parser.add_argument('--lines', type=int, default=20, help='result lines logged per step')
+    parser.add_argument('--legacy', action='store_true', help='also time the old algorithm')
+    args = parser.parse_args()
+
+    seconds = run_case(args.steps, args.lines, TestCase.add_results_to_test_steps)
+    print('indexed: {} steps, {} lines in {:.3f}s  ->  {:,.0f} steps/sec'.format(
+        args.steps, args.steps * args.lines, seconds, args.steps / seconds))
+    if args.legacy:
+        legacy_seconds = run_case(args.steps, args.lines, legacy_add_results_to_test_steps)
+        print('legacy:  {} steps, {} lines in {:.3f}s  ->  {:,.0f} steps/sec  ({:.1f}x slower)'.format(
+            args.steps, args.steps * args.lines, legacy_seconds, args.steps / legacy_seconds,
+            legacy_seconds / seconds))
+
+
+if __name__ == '__main__':
+    main()
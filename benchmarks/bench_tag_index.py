@@ -0,0 +1,55 @@
+"""
+time to index and select cases by tag expression with tag_index.TagIndex on a large synthetic suite.
+
+run from the repo root:
+    python -m benchmarks.bench_tag_index [--cases 100000] [--tags 50]
+"""
+import argparse
+import random
+import time
+
+from AutomationTools_master.testrail_api.tag_index import TagIndex
+from AutomationTools_master.testrail_api.testplan import CaseFilter, Operator, TestTags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', type=int, default=100000, help='number of cases in the suite')
+    parser.add_argument('--tags', type=int, default=50, help='number of distinct tag ids')
+    parser.add_argument('--repeat', type=int, default=20, help='selections timed')
+    args = parser.parse_args()
+
+    rand = random.Random(1)
+    cases = [{'id': 1000000 + n, 'custom_tags': rand.sample(range(1, args.tags + 1), rand.randint(0, 6))}
+             for n in range(args.cases)]
+    case_filters = [CaseFilter(Operator.isEqual, TestTags.Firmware),
+                    CaseFilter(Operator.isOr, TestTags.CLv2_gateway),
+                    CaseFilter(Operator.isAnd, TestTags.Automated),
+                    CaseFilter(Operator.isNotEqual, TestTags.Disabled)]
+
+    start = time.perf_counter()
+    tag_index = TagIndex(cases)
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        # drop the cached bitmaps so building them from the positions is part of what's timed
+        tag_index._bitmaps = {}
+        selected = tag_index.select(case_filters)
+    select_seconds = (time.perf_counter() - start) / args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        scanned = [case['id'] for case in cases
+                   if (TestTags.Firmware in case['custom_tags'] or TestTags.CLv2_gateway in case['custom_tags'])
+                   and TestTags.Automated in case['custom_tags'] and TestTags.Disabled not in case['custom_tags']]
+    scan_seconds = (time.perf_counter() - start) / args.repeat
+    assert scanned == selected
+
+    print('{} cases, {} tags: indexed in {:.1f} ms'.format(args.cases, args.tags, index_seconds * 1000))
+    print('select (a || b) && c && !d: {:.2f} ms, {} cases  (list scan: {:.2f} ms)'.format(
+        select_seconds * 1000, len(selected), scan_seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()